@@ -1,3 +1,4 @@
+import itertools
 import math
 
 from gamecomponents import PlayerInfo
@@ -5,13 +6,24 @@ from ai import monkeyAI, dummyAI, dummyRotatorAI, rotatorAI, fastAndSlowRotatorA
 
 import random
 
+from sortedcontainers import SortedList
+
 from networks import neuralAI
 
 
 class PlayerRepository:
-    def __init__(self):
+    def __init__(self, store=None):
         self.players = []
         self.generatedPlayers = 0
+        # PlayerStore every player is saved into, also after leaving the tournament
+        self.store = store
+        # players that left since the store was last saved
+        self.leaving = []
+        # (sort key, sequence number) of every player, best first
+        self.index = SortedList()
+        self.entries = {}
+        self.bySequence = {}
+        self.sequence = 0
 
     def generateHumanPlayer(self):
         return [PlayerInfo(name="<<Player>>")]
@@ -56,23 +68,79 @@ class PlayerRepository:
         return result
 
     def setPlayers(self, players):
-        self.players = players
+        if self.store is not None:
+            kept = {id(p) for p in players}
+            self.store.save(players, leaving=self.leaving + [p for p in self.players if id(p) not in kept])
+        self.leaving = []
+        self.players = list(players)
+        self.index.clear()
+        self.entries = {}
+        self.bySequence = {}
+        for p in self.players:
+            self.insert(p)
+
+    def addPlayers(self, players):
+        """Add players after the current ones and save everything that changed since into the store"""
+        self.players = self.players + players
+        for p in players:
+            self.insert(p)
+        if self.store is not None:
+            self.store.save(self.players, leaving=self.leaving)
+        self.leaving = []
+
+    def insert(self, p):
+        # the sequence number keeps players with the same rank in the order they were added, like a
+        # stable sort of the player list does
+        entry = (self.sortKey(p), self.sequence)
+        self.sequence += 1
+        self.index.add(entry)
+        self.entries[id(p)] = entry
+        self.bySequence[entry[1]] = p
+
+    def updateRanks(self, players):
+        """Move players whose rank changed to their new place in the index"""
+        for p in players:
+            entry = self.entries[id(p)]
+            key = self.sortKey(p)
+            if key != entry[0]:
+                self.index.remove(entry)
+                self.entries[id(p)] = (key, entry[1])
+                self.index.add(self.entries[id(p)])
+
+    def ranked(self, start=None, stop=None, reverse=False):
+        """Players from place start to place stop, best first"""
+        for _, sequence in self.index.islice(start, stop, reverse=reverse):
+            yield self.bySequence[sequence]
+
+    def top(self, count, filter=lambda x: True):
+        """Best count players for which filter is true"""
+        return list(itertools.islice((p for p in self.ranked() if filter(p)), count))
 
     def removeWorstPlayers(self, minSigma, quantile=0.1):
         possiblePlayersToRemove = math.floor(len(self.players) * quantile)
         if possiblePlayersToRemove > 0:
-            eligiblePlayers = self.sortPlayers(self.players)[-possiblePlayersToRemove:]
+            eligiblePlayers = list(self.ranked(len(self.players) - possiblePlayersToRemove))
         else:
             return 0
-        playersToRemove = self.sortPlayers([p for p in eligiblePlayers if p.sigma is not None and p.sigma < minSigma])
-        self.players = [p for p in self.players if p not in playersToRemove]
+        playersToRemove = [p for p in eligiblePlayers if p.sigma is not None and p.sigma < minSigma]
+        for p in playersToRemove:
+            entry = self.entries.pop(id(p))
+            self.index.remove(entry)
+            del self.bySequence[entry[1]]
+        removed = {id(p) for p in playersToRemove}
+        self.players = [p for p in self.players if id(p) not in removed]
+        self.leaving += playersToRemove
         return playersToRemove
 
     def fetchPlayers(self, sort=False, filter=lambda x: True):
         if sort:
-            return [p for p in self.sortPlayers(self.players) if filter(p)]
+            return [p for p in self.ranked() if filter(p)]
         else:
             return [p for p in self.players if filter(p)]
 
+    @staticmethod
+    def sortKey(p):
+        return 50 if p.rank is None else -p.rank
+
     def sortPlayers(self, players):
-        return sorted(players, key=lambda p: 50 if p.rank is None else -p.rank)
+        return sorted(players, key=self.sortKey)
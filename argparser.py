@@ -1,5 +1,13 @@
+import contextlib
+
 import configargparse
 
+
+def parseBool(value):
+    """true or false, for switches that are on in config and have to be turned off on the command line"""
+    return value.lower() == "true"
+
+
 p = configargparse.ArgParser(default_config_files=["config"])
 p.add("-c", "--config", is_config_file=True, help="config file path with defaults")
 p.add(
@@ -26,6 +34,70 @@ p.add(
     action="store_true",
     help="true to allow human player to play",
 )
+p.add(
+    "--input_script",
+    help="file with key events of human players by tick, they get no other input when the match is not drawn",
+)
+p.add(
+    "--input_port",
+    type=int,
+    help="port on localhost human players get key events from when there is no input_script, unset to not listen",
+)
+p.add(
+    "-w",
+    "--workers",
+    type=int,
+    help="how many processes should simulate matches of a round in parallel. 1 plays all matches in the main "
+    "process, 0 uses one process per cpu",
+)
+p.add(
+    "--engine",
+    choices=["esper", "array", "lockstep"],
+    help="engine used for matches that are not drawn. array keeps the game state in numpy arrays and is faster, "
+    "lockstep plays all matches a process gets in one set of arrays, turn by turn together. Results are the same",
+)
+p.add(
+    "--ai_batch_networks",
+    type=parseBool,
+    help="run neural networks of all tanks in one batched forward pass per turn instead of one by one, results are "
+    "the same. With the compiled network kernel networks still run one by one through it, so it rounds the same",
+)
+p.add(
+    "--fast_forward",
+    type=parseBool,
+    help="once no bullet is flying and either no gun can be loaded again or the match stands still, count the "
+    "remaining turns of a headless match without simulating them, results are the same",
+)
+p.add(
+    "--instrument",
+    action="store_true",
+    help="collect time spent in every processor and counters of ticks, bullets, collision checks and range finder "
+    "tests. They are shown when drawing and printed as JSON at the end of the tournament",
+)
+p.add("--record_dir", help="directory to record every match into, empty to not record")
+p.add(
+    "--record_checksum_interval",
+    type=int,
+    help="every how many turns a checksum of the game state is recorded, replays are checked against them",
+)
+p.add("--replay_file", help="play a recorded match instead of running a tournament")
+p.add(
+    "--replay_networks",
+    action="store_true",
+    help="when replaying let recorded networks and AIs decide again instead of repeating recorded decisions",
+)
+p.add("--checkpoint_file", help="file the tournament state is saved into, empty to not save it")
+p.add("--checkpoint_every", type=int, help="save the tournament state every this many rounds and after the last one")
+p.add(
+    "--resume",
+    action="store_true",
+    help="continue the tournament from checkpoint_file when it exists. Raise rounds to extend a finished tournament",
+)
+p.add(
+    "--player_store",
+    help="SQLite database every player and network of the tournament is saved into, also after leaving it. Empty "
+    "to keep players only in memory",
+)
 p.add("--random_seed", help="random seed to use, pass `disabled` to turn off using seed")
 p.add(
     "-g",
@@ -45,6 +117,12 @@ p.add("--gui_draw_every_nth_round", type=int, help="draw only each nth round")
 p.add("--gui_draw_best_match", action="store_true", help="always draw the best match")
 p.add("--gui_draw_worst_match", action="store_true", help="always draw the worst match")
 p.add("--gui_max_fps", type=int)
+p.add(
+    "--gui_render_thread",
+    action="store_true",
+    help="draw matches without human players on a thread of their own, so they run at full speed",
+)
+p.add("--gui_sprite_cache_size", type=int, help="how many rotated images are kept for drawing")
 p.add(
     "--gui_resolution",
     action="append",
@@ -73,6 +151,9 @@ p.add(
     help="how much viewport should be offset vertically when starting the game",
 )
 
+p.add("--bench_output", help="file benchmark.py writes its results to as JSON")
+p.add("--bench_turns", type=int, help="how many turns each benchmark scenario match lasts at most")
+
 p.add("--game_frag_score", type=float, help="score for every kill")
 p.add("--game_last_man_score", type=float, help="score if only you survive")
 p.add(
@@ -116,8 +197,23 @@ config = p.parse_args()
 # some calculated values are added here:
 config.game_survive_score_per_turn = config.game_survived_score / config.game_max_match_turns
 
-print(config)
-print("----------")
-print(p.format_help())
-print("----------")
-print(p.format_values())
+
+@contextlib.contextmanager
+def configOverride(**values):
+    """Set config values while inside and restore them afterwards"""
+    previous = {name: getattr(config, name) for name in values}
+    for name, value in values.items():
+        setattr(config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(config, name, value)
+
+
+def printConfig():
+    print(config)
+    print("----------")
+    print(p.format_help())
+    print("----------")
+    print(p.format_values())
@@ -0,0 +1,494 @@
+import math
+import random
+
+import numpy as np
+
+import assets
+import create
+import instrumentation
+from argparser import config
+from gamecomponents import (
+    AI,
+    Decision,
+    FireGun,
+    Gun,
+    Move,
+    Perception,
+    PositionBox,
+    Rotate,
+    RotateGun,
+    Solid,
+)
+from logic import GameEndProcessor
+from networks import NeuralAI, NeuralAIBatch
+from spatial import collidingPairs
+from vectormath import cosSin, rangeFind
+
+
+class ComponentSets:
+    """Mirror of the esper component database that keeps only entity ids.
+
+    Esper iterates entities in the order of python sets built from its component database. That
+    order decides in which order AIs consume random numbers and which owner gets points when
+    players kill each other in the same turn, so the engine repeats the same set operations to
+    visit entities in exactly the same order as the esper processors do."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def add(self, componentType, entity):
+        if componentType not in self.sets:
+            self.sets[componentType] = set()
+        self.sets[componentType].add(entity)
+
+    def discard(self, componentType, entity):
+        if componentType in self.sets:
+            self.sets[componentType].discard(entity)
+            if not self.sets[componentType]:
+                del self.sets[componentType]
+
+    def query(self, *componentTypes):
+        try:
+            return list(set.intersection(*[self.sets[ct] for ct in componentTypes]))
+        except KeyError:
+            return []
+
+
+class ArrayEngine:
+    """Headless simulation of a single match with the game state kept in numpy arrays.
+
+    Every turn runs the same phases as the processors from prepareProcessors in the same order,
+    but movement, rotation, reloading, bullet TTL, collisions and range finding work on whole
+    arrays instead of single components. Results are the same as with the esper processors for
+    the same random seed."""
+
+    TANK_COMPONENTS = (PositionBox, Solid, AI, Gun, Decision, FireGun)
+    ENTITY_ARRAYS = ("posX", "posY", "rotation", "radius", "ttl", "owner", "moving", "isBullet")
+    TANK_ARRAYS = ("bodyIds", "gunIds", "gunRotation", "ammo", "reloadTimeLeft", "isLoaded", "removed")
+
+    def __init__(self, players):
+        self.players = players
+        self.sets = ComponentSets()
+        self.dead = set()
+        self.gameEndReason = None
+        self.turnsLeft = config.game_max_match_turns
+        self.ammoTimeout = config.game_bullet_ttl
+        self.noAmmoCountdown = False
+        self.noAmmoTurnsLeft = 0
+        self.survivorScore = config.game_survived_score / config.game_max_match_turns
+        self.lastManStandingScore = config.game_last_man_score
+
+        # state of every entity indexed by entity id
+        self.nextEntityId = 0
+        self.posX = np.zeros(0)
+        self.posY = np.zeros(0)
+        self.rotation = np.zeros(0)
+        self.radius = np.zeros(0)
+        self.ttl = np.zeros(0, dtype=np.int64)
+        self.owner = np.zeros(0, dtype=np.int64)
+        self.moving = np.zeros(0, dtype=bool)
+        self.isBullet = np.zeros(0, dtype=bool)
+        self.bullets = []
+        # the events entity created by initWorld
+        self.createEntity()
+
+        # state of every tank indexed by its position in players
+        n = len(players)
+        self.bodyIds = np.zeros(n, dtype=np.intp)
+        self.gunIds = np.zeros(n, dtype=np.intp)
+        # rotation of a gun relative to its body, like Mount.rotation
+        self.gunRotation = np.zeros(n)
+        self.ammo = np.full(n, config.game_ammo, dtype=np.int64)
+        self.reloadTimeLeft = np.zeros(n, dtype=np.int64)
+        self.isLoaded = np.ones(n, dtype=bool)
+        self.removed = np.zeros(n, dtype=bool)
+        self.ais = [None] * n
+        self.decisions = [None] * n
+        self.moves = [None] * n
+        self.rotates = [None] * n
+        self.gunRotates = [None] * n
+        self.rotateGuns = [None] * n
+        self.closestTargets = [None] * n
+        self.pendingScores = []
+        # state after the last turn and the random state it was compared at, see isQuiescent
+        self.lastRandomState = None
+        self.lastState = None
+        self.neuralAIBatch = NeuralAIBatch()
+        self.tankOfBody = {}
+        self.tankOfGun = {}
+        self.createTanks()
+
+    def createEntity(self):
+        self.nextEntityId += 1
+        if self.nextEntityId >= len(self.posX):
+            self.growEntities(max(64, 2 * len(self.posX)))
+        return self.nextEntityId
+
+    def growEntities(self, size):
+        for name in self.ENTITY_ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros(size, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def createTanks(self):
+        w, h = assets.size(assets.TANK_BASE)
+        tankRadius = create.tankCollisionRadius(w, h)
+        for k, playerInfo in enumerate(self.players):
+            startx, starty, bodyRotation, gunRotation = create.spawnPoint(playerInfo)
+            body = self.createEntity()
+            self.sets.add(Solid, body)
+            self.sets.add(PositionBox, body)
+            gun = self.createEntity()
+            self.sets.add(PositionBox, gun)
+            self.sets.add(Gun, body)
+            if playerInfo.ai is not None:
+                self.sets.add(AI, body)
+                self.ais[k] = AI(playerInfo.ai)
+            self.bodyIds[k], self.gunIds[k] = body, gun
+            self.tankOfBody[body], self.tankOfGun[gun] = k, k
+            # a gun shares the center of its tank, so only the body position is kept
+            self.posX[body] = startx
+            self.posY[body] = starty
+            self.radius[body] = tankRadius
+            self.rotates[k] = Rotate(bodyRotation)
+            self.gunRotates[k] = Rotate(gunRotation)
+
+    def entityExists(self, entity):
+        if entity in self.dead:
+            return False
+        if entity in self.tankOfBody:
+            return not self.removed[self.tankOfBody[entity]]
+        return entity in self.bullets
+
+    def isGameRunning(self):
+        return self.gameEndReason is None
+
+    def run(self):
+        while self.isGameRunning():
+            self.process()
+            if config.fast_forward and self.isGameRunning() and self.isQuiescent():
+                self.fastForward()
+
+    def isQuiescent(self):
+        """Same as logic.QuiescenceDetector.isQuiescent"""
+        self.clearDeadEntities()
+        if self.bullets or self.pendingScores:
+            self.lastState = None
+            return False
+        alive = ~self.removed
+        if not np.any(self.ammo[alive] | self.isLoaded[alive] | self.reloadTimeLeft[alive]):
+            return True
+        randomState = self.aiRandomState()
+        if randomState != self.lastRandomState:
+            self.lastRandomState = randomState
+            self.lastState = None
+            return False
+        state = self.matchState()
+        quiescent = state is not None and state == self.lastState
+        self.lastState = state
+        return quiescent
+
+    def aiRandomState(self):
+        """Random state the AIs draw from in the next turn"""
+        return random.getstate()
+
+    def matchState(self):
+        if any(ai is not None and ai.memory is not None for ai in self.ais):
+            return None
+        arrays = (
+            self.posX,
+            self.posY,
+            self.rotation,
+            self.gunRotation,
+            self.ammo,
+            self.reloadTimeLeft,
+            self.isLoaded,
+            self.removed,
+        )
+        decisions = [None if d is None else (d.timeout, len(d.commands)) for d in self.decisions]
+        return [array.tobytes() for array in arrays] + decisions
+
+    def turnsToEnd(self):
+        """Same as GameEndProcessor.turnsToEnd"""
+        alive = ~self.removed
+        if np.count_nonzero(alive) <= 1:
+            return 1
+        turns = self.turnsLeft
+        if self.noAmmoCountdown:
+            turns = min(turns, self.noAmmoTurnsLeft)
+        elif np.all(self.ammo[alive] == 0):
+            turns = min(turns, 1 + max(self.ammoTimeout, 1))
+        return turns
+
+    def skipTurns(self, turns):
+        """Same as GameEndProcessor.skipTurns"""
+        if turns <= 0:
+            return
+        self.turnsLeft -= turns
+        if self.noAmmoCountdown:
+            self.noAmmoTurnsLeft -= turns
+        elif np.all(self.ammo[~self.removed] == 0):
+            self.noAmmoCountdown = True
+            self.noAmmoTurnsLeft = self.ammoTimeout - (turns - 1)
+
+    def fastForward(self):
+        turns = self.turnsToEnd()
+        self.skipTurns(turns - 1)
+        self.processGameEnd()
+        agents = np.flatnonzero(~self.removed)
+        for k in agents:
+            score = self.players[k].score
+            for _ in range(turns):
+                score += self.survivorScore
+            self.players[k].score = score
+        self.addLastManStandingScore(agents)
+        instrumentation.count("ticks_fast_forwarded", turns)
+
+    def process(self):
+        instrumentation.count("ticks")
+        self.clearDeadEntities()
+        self.processAI()
+        self.processDecisions()
+        self.processGameEnd()
+        solids = self.processCollisions()
+        self.processTotalScore()
+        self.processMovement()
+        self.processRotation()
+        self.processMounts()
+        self.processRangeFinding(solids)
+        self.processVelocity()
+        self.processFiringGun()
+        self.processCleanup()
+        self.processGunReload()
+
+    def clearDeadEntities(self):
+        for entity in self.dead:
+            if entity in self.tankOfBody:
+                k = self.tankOfBody[entity]
+                for componentType in self.TANK_COMPONENTS:
+                    self.sets.discard(componentType, entity)
+                self.removed[k] = True
+                self.decisions[k] = self.moves[k] = self.rotates[k] = self.gunRotates[k] = self.rotateGuns[k] = None
+            else:
+                self.sets.discard(PositionBox, entity)
+                self.sets.discard(Solid, entity)
+                if self.isBullet[entity]:
+                    self.bullets.remove(entity)
+        self.dead.clear()
+
+    def processAI(self):
+        decisions, neuralAIs, inputs, neuralAITanks = self.collectDecisions()
+        if neuralAIs:
+            for i, decision in zip(neuralAITanks, self.neuralAIBatch.decide(neuralAIs, inputs)):
+                decisions[i] = (decisions[i][0], decision)
+        self.applyDecisions(decisions)
+
+    def collectDecisions(self):
+        """Decisions of all AIs as (body, decision) pairs. Neural networks are only given their input
+        when they run batched, their decisions are left None at the positions in neuralAITanks"""
+        decisions = []
+        neuralAIs, inputs, neuralAITanks = [], [], []
+        for body in self.sets.query(AI, PositionBox, Gun):
+            k = self.tankOfBody[body]
+            ai = self.ais[k]
+            perception = Perception()
+            target = self.closestTargets[k]
+            perception.target = (
+                None
+                if target is None
+                else PositionBox(x=self.posX[target], y=self.posY[target], rotation=self.rotation[target])
+            )
+            if config.ai_batch_networks and isinstance(ai.decisionFunction, NeuralAI):
+                neuralAIs.append(ai.decisionFunction)
+                inputs.append(ai.decisionFunction.networkInput(perception))
+                neuralAITanks.append(len(decisions))
+                ai.memory = None
+                decisions.append((body, None))
+            else:
+                decision, ai.memory = ai.decide(perception, ai.memory)
+                decisions.append((body, decision))
+        return decisions, neuralAIs, inputs, neuralAITanks
+
+    def applyDecisions(self, decisions):
+        for body, decision in decisions:
+            if decision is not None:
+                self.decisions[self.tankOfBody[body]] = decision
+                self.sets.add(Decision, body)
+
+    def processDecisions(self):
+        for body in self.sets.query(PositionBox, Decision):
+            k = self.tankOfBody[body]
+            decision = self.decisions[k]
+            for command in decision.commands:
+                commandType = type(command)
+                if commandType is Move:
+                    self.moves[k] = command
+                elif commandType is Rotate:
+                    self.rotates[k] = command
+                elif commandType is RotateGun:
+                    self.rotateGuns[k] = command
+                elif commandType is FireGun:
+                    self.sets.add(FireGun, body)
+                else:
+                    raise ValueError("Command {} is not supported by the array engine".format(commandType.__name__))
+            decision.timeout -= 1
+            if decision.timeout <= 0:
+                self.sets.discard(Decision, body)
+                self.decisions[k] = None
+
+    def processGameEnd(self):
+        self.turnsLeft -= 1
+        if self.noAmmoCountdown:
+            self.noAmmoTurnsLeft -= 1
+            if self.noAmmoTurnsLeft <= 0:
+                self.gameEndReason = GameEndProcessor.GameEndReason.OUT_OF_AMMO
+        alive = ~self.removed
+        if np.all(self.ammo[alive] == 0) and not self.noAmmoCountdown:
+            self.noAmmoCountdown = True
+            self.noAmmoTurnsLeft = self.ammoTimeout
+        if self.turnsLeft <= 0:
+            self.gameEndReason = GameEndProcessor.GameEndReason.OUT_OF_TIME
+        if np.count_nonzero(alive) <= 1:
+            self.gameEndReason = GameEndProcessor.GameEndReason.LAST_MAN_STANDING
+
+    def deleteWithChildren(self, entity):
+        if entity in self.tankOfBody:
+            # keep the scoring information when player dies
+            self.createEntity()
+            self.dead.add(int(self.gunIds[self.tankOfBody[entity]]))
+        self.dead.add(entity)
+
+    def processCollisions(self):
+        entities = self.sets.query(PositionBox, Solid)
+        solids = np.array(entities, dtype=np.intp)
+        pairs = collidingPairs(self.posX[solids], self.posY[solids], self.radius[solids])
+        self.handleCollisions(entities, self.isBullet[solids].tolist(), *pairs)
+        return solids
+
+    def handleCollisions(self, entities, explosive, first, second):
+        """Explode or bounce off colliding pairs (entities[first[i]], entities[second[i]]), given in
+        the order of the nested loop in CollisionProcessor"""
+        for a, b in zip(first.tolist(), second.tolist()):
+            entityA = entities[a]
+            if explosive[a] or explosive[b]:
+                self.deleteWithChildren(entityA)
+                # Add points for someone that caused explosion
+                owner = int(self.owner[entityA])
+                if explosive[a] and self.entityExists(owner):
+                    self.createEntity()
+                    self.pendingScores.append(self.tankOfBody[owner])
+            else:
+                move = self.moves[self.tankOfBody[entityA]]
+                if move is not None:
+                    move.distance *= -1
+
+    def processTotalScore(self):
+        for k in self.pendingScores:
+            self.players[k].score += config.game_frag_score
+        self.pendingScores = []
+
+        agents = np.flatnonzero(~self.removed)
+        for k in agents:
+            self.players[k].score += self.survivorScore
+
+        if not self.isGameRunning():
+            self.addLastManStandingScore(agents)
+
+    def addLastManStandingScore(self, agents):
+        if len(agents) <= 1:
+            for k in agents:
+                self.players[k].score += self.lastManStandingScore
+
+    def processMovement(self):
+        movingTanks = [k for k in range(len(self.players)) if self.moves[k] is not None]
+        bullets = np.array(self.bullets, dtype=np.intp)
+        bullets = bullets[self.moving[bullets]]
+        if not movingTanks and len(bullets) == 0:
+            return
+        entities = np.concatenate((self.bodyIds[movingTanks], bullets))
+        distances = [self.moves[k].distance for k in movingTanks]
+        distances = np.concatenate((distances, np.full(len(bullets), float(config.game_bullet_speed))))
+        cos, sin = cosSin(self.rotation[entities])
+        self.posX[entities] += distances * cos
+        self.posY[entities] += distances * sin
+        for k in movingTanks:
+            self.moves[k] = None
+        self.moving[bullets] = False
+
+    def processRotation(self):
+        tanks = np.flatnonzero(~self.removed)
+        bodyAngles = np.array([0.0 if self.rotates[k] is None else self.rotates[k].angle for k in tanks])
+        gunAngles = np.array([0.0 if self.gunRotates[k] is None else self.gunRotates[k].angle for k in tanks])
+        rotateGunAngles = np.array([0.0 if self.rotateGuns[k] is None else self.rotateGuns[k].angle for k in tanks])
+        self.rotation[self.bodyIds[tanks]] += bodyAngles
+        self.gunRotation[tanks] += gunAngles
+        self.gunRotation[tanks] += rotateGunAngles
+        for k in tanks:
+            self.rotates[k] = self.gunRotates[k] = self.rotateGuns[k] = None
+
+    def processMounts(self):
+        # a gun shares the center of its tank, only its rotation follows the body
+        tanks = np.flatnonzero(~self.removed)
+        self.rotation[self.gunIds[tanks]] = self.rotation[self.bodyIds[tanks]] + self.gunRotation[tanks]
+
+    def processRangeFinding(self, solids):
+        tanks = np.flatnonzero(~self.removed)
+        bodies = self.bodyIds[tanks]
+        instrumentation.count("range_finder_tests", len(tanks) * len(solids))
+        _, closest, _ = rangeFind(
+            self.posX[bodies],
+            self.posY[bodies],
+            self.rotation[self.gunIds[tanks]],
+            np.full(len(tanks), float(config.game_laser_range)),
+            self.posX[solids],
+            self.posY[solids],
+            self.radius[solids],
+        )
+        for k, target in zip(tanks.tolist(), closest.tolist()):
+            self.closestTargets[k] = int(solids[target]) if target >= 0 else None
+
+    def processVelocity(self):
+        if config.game_bullet_speed != 0:
+            self.moving[self.bullets] = True
+
+    def processFiringGun(self):
+        for body in self.sets.query(Gun, FireGun, PositionBox):
+            k = self.tankOfBody[body]
+            if self.isLoaded[k]:
+                self.createBullet(k)
+                self.isLoaded[k] = False
+            self.sets.discard(FireGun, body)
+
+    def createBullet(self, k):
+        bullet = self.createEntity()
+        instrumentation.count("bullets_spawned")
+        self.sets.add(Solid, bullet)
+        self.sets.add(PositionBox, bullet)
+        body = self.bodyIds[k]
+        rotation = self.rotation[self.gunIds[k]]
+        # Bullet needs to be offset not to kill own tank
+        self.posX[bullet] = self.posX[body] + config.game_bullet_position_offset * math.cos(math.radians(rotation))
+        self.posY[bullet] = self.posY[body] + config.game_bullet_position_offset * math.sin(math.radians(rotation))
+        self.rotation[bullet] = rotation
+        self.radius[bullet] = create.BULLET_COLLISION_RADIUS
+        self.ttl[bullet] = config.game_bullet_ttl
+        self.owner[bullet] = self.bodyIds[k]
+        self.moving[bullet] = False
+        self.isBullet[bullet] = True
+        self.bullets.append(bullet)
+
+    def processCleanup(self):
+        bullets = np.array(self.bullets, dtype=np.intp)
+        expired = self.ttl[bullets] <= 0
+        self.dead.update(bullets[expired].tolist())
+        self.ttl[bullets[~expired]] -= 1
+
+    def processGunReload(self):
+        tanks = ~self.removed
+        startLoading = tanks & (self.ammo > 0) & ~self.isLoaded & (self.reloadTimeLeft == 0)
+        loading = tanks & ~self.isLoaded & (self.reloadTimeLeft > 0)
+        self.ammo[startLoading] -= 1
+        self.reloadTimeLeft[startLoading] = config.game_gun_load_time
+        self.reloadTimeLeft[loading] -= 1
+        self.isLoaded[loading & (self.reloadTimeLeft == 0)] = True
@@ -0,0 +1,34 @@
+import struct
+
+BULLET = "assets/bullet.png"
+TANK_BASE = "assets/tankBase.png"
+TANK_TURRET = "assets/tankTurret.png"
+
+# Every image is loaded once per process and the same Surface is shared by all entities using it
+_images = {}
+_sizes = {}
+
+
+def image(path):
+    """Surface of the image at path"""
+    if path not in _images:
+        # imported here so headless games that only need sizes never load pygame's image decoding
+        import pygame
+
+        surface = pygame.image.load(path)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        _images[path] = surface
+        _sizes[path] = surface.get_size()
+    return _images[path]
+
+
+def size(path):
+    """Width and height of the image at path, read from the PNG header without decoding the image"""
+    if path not in _sizes:
+        with open(path, "rb") as f:
+            header = f.read(24)
+        if header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+            raise ValueError("{} is not a PNG image".format(path))
+        _sizes[path] = struct.unpack(">II", header[16:24])
+    return _sizes[path]
@@ -0,0 +1,188 @@
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import create
+import instrumentation
+import tankbr
+from PlayerRepository import PlayerRepository
+from ai import dummyRotatorAI
+from argparser import config, configOverride
+from arrayengine import ArrayEngine
+from gamecomponents import Perception, PositionBox
+from instrumentation import InstrumentedWorld
+from networks import NeuralAIBatch, neuralAI
+
+COLD_START_RUNS = 5
+COLD_START_SNIPPET = (
+    "import sys; import tankbr; print('loaded:' + ','.join(m for m in ('pygame', 'gui') if m in sys.modules))"
+)
+SCENARIO_SEED = 1
+# name, number of tanks, AI forced on every tank (None keeps the generated players)
+SCENARIOS = [
+    ("8 tanks", 8, None),
+    ("64 tanks", 64, None),
+    ("512 tanks", 512, None),
+    # every tank fires as soon as its gun is loaded, so the arena fills up with bullets
+    ("64 tanks firing", 64, dummyRotatorAI),
+]
+NN_LATENCY_CALLS = 2000
+NN_BATCH_SIZE = 64
+
+
+def scenarioPlayers(tanks, ai):
+    players = PlayerRepository().generatePlayers(number=tanks)
+    if ai is not None:
+        for p in players:
+            p.ai = ai
+    return players
+
+
+def scenarioConfig(tanks):
+    # keeps about the same density of tanks as in a default 8 tank match
+    return configOverride(
+        game_max_match_turns=config.bench_turns,
+        game_spawn_range=int(config.game_spawn_range * math.sqrt(tanks / 8)),
+    )
+
+
+def esperMatch(players, seed):
+    """Time of a headless esper match and instrumentation stats collected in it"""
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        with instrumentation.collecting() as stats:
+            world, events = tankbr.initWorld(InstrumentedWorld)
+            create.tanks(world, players, render=False)
+            gameEndProcessor = tankbr.prepareProcessors(world, events, drawUI=False)
+            start = time.perf_counter()
+            while gameEndProcessor.isGameRunning():
+                world.process()
+            seconds = time.perf_counter() - start
+        return seconds, stats
+    finally:
+        random.setstate(state)
+
+
+def arrayMatch(players, seed):
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        start = time.perf_counter()
+        engine = ArrayEngine(players)
+        engine.run()
+        return time.perf_counter() - start, config.game_max_match_turns - engine.turnsLeft
+    finally:
+        random.setstate(state)
+
+
+def scenarios():
+    results = []
+    for name, tanks, ai in SCENARIOS:
+        with scenarioConfig(tanks):
+            seconds, stats = esperMatch(scenarioPlayers(tanks, ai), SCENARIO_SEED)
+            arraySeconds, arrayTicks = arrayMatch(scenarioPlayers(tanks, ai), SCENARIO_SEED)
+        ticks = stats.counters["ticks"]
+        results.append(
+            {
+                "name": name,
+                "tanks": tanks,
+                "ticks": ticks,
+                "seconds": seconds,
+                "ticks_per_second": ticks / seconds,
+                "processor_ms_per_tick": {p: t * 1000 / ticks for p, t in stats.processorSeconds.most_common()},
+                "counters": dict(stats.counters),
+                "array_engine_ticks_per_second": arrayTicks / arraySeconds,
+            }
+        )
+    return results
+
+
+def perCall(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls
+
+
+def networkLatency():
+    """Microseconds of a bare network run and of a whole decision (input, network, commands) made
+    alone or in a batch"""
+    neuralAIs = [neuralAI(seed=seed)[0] for seed in range(NN_BATCH_SIZE)]
+    x = [[0.5], [1]]
+    perception = Perception()
+    perception.target = PositionBox()
+    batch = NeuralAIBatch()
+    batchCalls = max(1, NN_LATENCY_CALLS // NN_BATCH_SIZE)
+    return {
+        "model_run_us": perCall(lambda: neuralAIs[0].model.run(x), NN_LATENCY_CALLS) * 1e6,
+        "decision_us": perCall(lambda: neuralAIs[0](perception, None), NN_LATENCY_CALLS) * 1e6,
+        "batched_decision_us": perCall(
+            lambda: batch.decide(neuralAIs, [ai.networkInput(perception) for ai in neuralAIs]), batchCalls
+        )
+        * 1e6
+        / NN_BATCH_SIZE,
+    }
+
+
+def tournamentRound():
+    """Seconds of one full tournament round with the default config"""
+    with configOverride(rounds=1, workers=1, gui_draw=False, gui_draw_best_match=False, gui_draw_worst_match=False):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tankbr.run()
+        return time.perf_counter() - start
+
+
+def coldStart(runs=COLD_START_RUNS):
+    """Median time in seconds of starting a fresh interpreter and importing the tournament modules,
+    which is what every pool worker started from scratch pays. Also returns rendering modules that
+    got imported on the way, there should be none"""
+    times = []
+    loaded = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", COLD_START_SNIPPET], capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        line = [line for line in result.stdout.splitlines() if line.startswith("loaded:")][-1]
+        loaded = [m for m in line[len("loaded:") :].split(",") if m]
+    return statistics.median(times), loaded
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks():
+    coldStartSeconds, renderingModules = coldStart()
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "turns": config.bench_turns,
+        "cold_start_ms": coldStartSeconds * 1000,
+        "cold_start_rendering_modules": renderingModules,
+        "scenarios": scenarios(),
+        "network_latency": networkLatency(),
+        "tournament_round_seconds": tournamentRound(),
+    }
+
+
+if __name__ == "__main__":
+    results = runBenchmarks()
+    with open(config.bench_output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
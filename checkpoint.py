@@ -0,0 +1,123 @@
+import io
+import json
+import os
+import random
+
+import numpy as np
+
+import ai
+from PlayerRepository import PlayerRepository
+from gamecomponents import PlayerInfo
+from network_processor import Model
+from networks import neuralAI
+from replay import aiName
+
+VERSION = 1
+# name of the array holding the JSON encoded state, all other arrays are network weights
+STATE = "state"
+NUMPY_KEYS = "numpy_random_keys"
+
+
+def weightsKey(player, layerName):
+    return "weights/{}/{}".format(player, layerName)
+
+
+def playerState(p):
+    state = {
+        "name": p.name,
+        "ai": aiName(p.ai),
+        "totalGames": p.totalGames,
+        "mu": p.mu,
+        "sigma": p.sigma,
+        "rank": p.rank,
+        "storeId": p.storeId,
+    }
+    if p.neural_net is not None:
+        state["generation"] = p.neural_net.generation
+        state["architecture"] = p.neural_net.architecture
+        # order of layers decides the order random numbers are drawn in when breeding
+        state["layers"] = list(p.neural_net.parameters)
+    return state
+
+
+def save(path, round, playerRepository, rng, removed):
+    """Write the tournament state after round - 1 to path.
+
+    Weights of every network go into arrays of an uncompressed npz file, everything else into a
+    JSON string next to them. The file is replaced only once it is completely written, so a crash
+    while saving keeps the previous checkpoint."""
+    arrays = {}
+    players = []
+    for index, p in enumerate(playerRepository.players):
+        players.append(playerState(p))
+        if p.neural_net is not None:
+            for layerName, layer in p.neural_net.parameters.items():
+                arrays[weightsKey(index, layerName)] = layer
+    name, keys, position, hasGauss, cachedGaussian = np.random.get_state()
+    state = {
+        "version": VERSION,
+        "round": round,
+        "generated_players": playerRepository.generatedPlayers,
+        "players": players,
+        # only what is printed about recently removed players is kept
+        "removed": [[p.name, p.totalGames] for p in removed],
+        "random": random.getstate(),
+        "numpy_random": [name, position, hasGauss, cachedGaussian],
+        "breeding_random": rng.bit_generator.state,
+    }
+    arrays[NUMPY_KEYS] = keys
+    arrays[STATE] = np.frombuffer(json.dumps(state).encode("utf-8"), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(buffer.getbuffer())
+    os.replace(temporary, path)
+
+
+def restorePlayer(saved, weights):
+    if saved["ai"] == "neural":
+        model = Model(
+            {layerName: weights[layerName] for layerName in saved["layers"]},
+            saved["architecture"],
+            saved["generation"],
+        )
+        decide, _ = neuralAI(neural_net_model=model)
+    else:
+        model = None
+        decide = None if saved["ai"] == "human" else getattr(ai, saved["ai"])
+    p = PlayerInfo(name=saved["name"], ai=decide, neural_net=model)
+    p.totalGames = saved["totalGames"]
+    p.mu, p.sigma, p.rank = saved["mu"], saved["sigma"], saved["rank"]
+    p.storeId = saved["storeId"]
+    return p
+
+
+def load(path):
+    """Tournament state saved by save. Returns the round to continue from, the player repository,
+    the breeding generator and recently removed players. Global random states of python and numpy
+    are restored too"""
+    with np.load(path, allow_pickle=False) as data:
+        state = json.loads(data[STATE].tobytes().decode("utf-8"))
+        if state["version"] != VERSION:
+            raise ValueError("Checkpoint version {} is not supported".format(state["version"]))
+        players = []
+        for index, saved in enumerate(state["players"]):
+            weights = {layerName: data[weightsKey(index, layerName)] for layerName in saved.get("layers", [])}
+            players.append(restorePlayer(saved, weights))
+        numpyKeys = data[NUMPY_KEYS]
+    playerRepository = PlayerRepository()
+    playerRepository.setPlayers(players)
+    playerRepository.generatedPlayers = state["generated_players"]
+    version, internalState, gauss = state["random"]
+    random.setstate((version, tuple(internalState), gauss))
+    name, position, hasGauss, cachedGaussian = state["numpy_random"]
+    np.random.set_state((name, numpyKeys, position, hasGauss, cachedGaussian))
+    rng = np.random.Generator(getattr(np.random, state["breeding_random"]["bit_generator"])())
+    rng.bit_generator.state = state["breeding_random"]
+    removed = []
+    for playerName, totalGames in state["removed"]:
+        p = PlayerInfo(name=playerName)
+        p.totalGames = totalGames
+        removed.append(p)
+    return state["round"], playerRepository, rng, removed
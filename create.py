@@ -1,8 +1,8 @@
 import math
 import random
 
-import pygame
-
+import assets
+import instrumentation
 from argparser import config
 from gamecomponents import (
     RotationSteering,
@@ -19,15 +19,32 @@ from gamecomponents import (
     RangeFinder,
     Gun,
     AI,
-    Child,
+    Mount,
     TTL,
 )
 
+BULLET_COLLISION_RADIUS = 10
+
 
-def bullet(world, ownerId, position):
+def bullet(world, ownerId, position, render=True, reused=None):
+    """Create a bullet fired from position. reused are components of a deleted bullet by their type,
+    from BulletPoolProcessor.take, they are set up again instead of creating new ones"""
     bullet = world.create_entity()
-    bulletImage = pygame.image.load("assets/bullet.png")
-    world.add_component(bullet, Solid(collisionRadius=10))
+    instrumentation.count("bullets_spawned")
+    reused = reused or {}
+
+    def component(componentType, *args, **kwargs):
+        instance = reused.get(componentType)
+        if instance is None:
+            return componentType(*args, **kwargs)
+        if hasattr(instance, "reset"):
+            instance.reset(*args, **kwargs)
+        else:
+            instance.__init__(*args, **kwargs)
+        return instance
+
+    w, h = assets.size(assets.BULLET)
+    world.add_component(bullet, component(Solid, collisionRadius=BULLET_COLLISION_RADIUS))
     # Bullet needs to be offset not to kill own tank
     dx, dy = (
         config.game_bullet_position_offset * math.cos(math.radians(position.rotation)),
@@ -35,31 +52,32 @@ def bullet(world, ownerId, position):
     )
     world.add_component(
         bullet,
-        PositionBox(
+        component(
+            PositionBox,
             x=position.x + dx,
             y=position.y + dy,
-            w=bulletImage.get_width(),
-            h=bulletImage.get_height(),
+            w=w,
+            h=h,
             rotation=position.rotation,
         ),
     )
-    world.add_component(bullet, Renderable(image=bulletImage))
-    world.add_component(bullet, Velocity(speed=config.game_bullet_speed, angularSpeed=0))
-    world.add_component(bullet, Owner(ownerId))
-    world.add_component(bullet, Explosive())
-    world.add_component(bullet, TTL(config.game_bullet_ttl))
+    if render:
+        world.add_component(bullet, component(Renderable, image=assets.image(assets.BULLET)))
+    world.add_component(bullet, component(Velocity, speed=config.game_bullet_speed, angularSpeed=0))
+    world.add_component(bullet, component(Owner, ownerId))
+    world.add_component(bullet, component(Explosive))
+    world.add_component(bullet, component(TTL, config.game_bullet_ttl))
 
 
-def tank(world, startx, starty, playerInfo, bodyRotation=0.0, gunRotation=0.0):
-    bodyImage = pygame.image.load("assets/tankBase.png")
-    gunImage = pygame.image.load("assets/tankTurret.png")
-    bw, bh = bodyImage.get_width(), bodyImage.get_height()
+def tank(world, startx, starty, playerInfo, bodyRotation=0.0, gunRotation=0.0, render=True):
+    """Create a tank, without render set its entities only get sizes of their images and no Renderable"""
+    bw, bh = assets.size(assets.TANK_BASE)
+    gw, gh = assets.size(assets.TANK_TURRET)
 
     body = world.create_entity()
-    world.add_component(body, Renderable(image=bodyImage, rotation=-90))
-    world.add_component(
-        body, Solid(collisionRadius=math.sqrt(bw * bw + bh * bh) / 2 * 0.7)
-    )  # may overlap a little sometimes
+    if render:
+        world.add_component(body, Renderable(image=assets.image(assets.TANK_BASE), rotation=-90))
+    world.add_component(body, Solid(collisionRadius=tankCollisionRadius(bw, bh)))
     world.add_component(body, Agent())
     world.add_component(body, PositionBox(x=startx, y=starty, w=bw, h=bh))
     world.add_component(body, Velocity(speed=0, angularSpeed=0))
@@ -69,20 +87,22 @@ def tank(world, startx, starty, playerInfo, bodyRotation=0.0, gunRotation=0.0):
     # declaration order. Idea is to use a PreRenderingProcessor that would add elements
     # to components based on their zlevel that would run once
     gun = world.create_entity()
-    world.add_component(gun, Renderable(image=gunImage, rotation=-90))
-    world.component_for_entity(gun, Renderable)
-    # FIXME For now the gun and body must have the same center or they will diverge
-    # during rotation/moving
+    if render:
+        world.add_component(gun, Renderable(image=assets.image(assets.TANK_TURRET), rotation=-90))
     world.add_component(
         gun,
-        PositionBox(x=startx, y=starty, w=gunImage.get_width(), h=gunImage.get_height()),
+        PositionBox(x=startx, y=starty, w=gw, h=gh),
     )
+    world.add_component(gun, Mount(body))
     world.add_component(gun, Velocity(speed=0, angularSpeed=0))
     world.add_component(gun, Rotate(gunRotation))
     world.add_component(gun, RangeFinder(maxRange=config.game_laser_range, angleOffset=0))
     world.add_component(body, Gun(gun, ammo=config.game_ammo))
 
     if playerInfo.ai is None:
+        # only a human player needs pygame for its keys, headless tournaments never get here
+        import pygame
+
         world.add_component(
             body,
             MovementSteering(moveForwardKey=pygame.K_w, moveBackwardsKey=pygame.K_s),
@@ -95,26 +115,33 @@ def tank(world, startx, starty, playerInfo, bodyRotation=0.0, gunRotation=0.0):
         world.add_component(body, playerInfo)
         world.add_component(body, AI(playerInfo.ai))
 
-    world.add_component(body, Child(gun))
 
+def spawnPoint(playerInfo):
+    """Returns starting x, y, body rotation and gun rotation for a player"""
+    if playerInfo.ai is None:
+        return 0, 0, 0, 0
+    return (
+        random.randint(-config.game_spawn_range, config.game_spawn_range),
+        random.randint(-config.game_spawn_range, config.game_spawn_range),
+        random.randint(0, 359),
+        random.randint(0, 359),
+    )
+
+
+def tankCollisionRadius(w, h):
+    # may overlap a little sometimes
+    return math.sqrt(w * w + h * h) / 2 * 0.7
 
-def tanks(world, players):
+
+def tanks(world, players, render=True):
     for p in players:
-        if p.ai is None:
-            tank(
-                world=world,
-                startx=0,
-                starty=0,
-                bodyRotation=0,
-                gunRotation=0,
-                playerInfo=p,
-            )
-        else:
-            tank(
-                world=world,
-                startx=random.randint(-config.game_spawn_range, config.game_spawn_range),
-                starty=random.randint(-config.game_spawn_range, config.game_spawn_range),
-                bodyRotation=random.randint(0, 359),
-                gunRotation=random.randint(0, 359),
-                playerInfo=p,
-            )
+        startx, starty, bodyRotation, gunRotation = spawnPoint(p)
+        tank(
+            world=world,
+            startx=startx,
+            starty=starty,
+            bodyRotation=bodyRotation,
+            gunRotation=gunRotation,
+            playerInfo=p,
+            render=render,
+        )
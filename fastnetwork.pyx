@@ -0,0 +1,39 @@
+from libc.math cimport exp
+
+import numpy as np
+
+from slownetwork import relu, sigmoid
+
+
+cdef void dense_layer(double[:, ::1] weights, double[:, ::1] bias, double[:, ::1] x, double[:, ::1] out, int activation):
+    cdef Py_ssize_t i, j
+    cdef double value
+    for i in range(weights.shape[0]):
+        value = 0
+        for j in range(weights.shape[1]):
+            value += weights[i, j] * x[j, 0]
+        value += bias[i, 0]
+        if activation == 1:
+            value = value if value > 0 else 0
+        elif activation == 2:
+            value = 1 / (1 + exp(-value))
+        out[i, 0] = value
+
+
+def forward_propagation(plan, x):
+    """Run a compiled layer plan (see network_processor.compile_plan) on input column x. The
+       returned array is the output buffer of the last layer and is overwritten by the next call"""
+    cdef Py_ssize_t j, inputs = len(x)
+    cdef double[:, ::1] current_activation = np.empty((inputs, 1))
+    cdef int code
+    for j in range(inputs):
+        current_activation[j, 0] = x[j][0]
+    result = None
+    for weights, bias, activation, output in plan:
+        code = 1 if activation is relu else 2 if activation is sigmoid else 0
+        dense_layer(weights, bias, current_activation, output, code)
+        if code == 0:
+            activation(output, output)
+        current_activation = output
+        result = output
+    return result
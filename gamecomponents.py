@@ -1,4 +1,6 @@
 class PlayerInfo:
+    __slots__ = ("name", "score", "ai", "neural_net", "totalGames", "mu", "sigma", "rank", "storeId")
+
     def __init__(self, name, ai=None, neural_net=None, score=0):
         self.name = name
         self.score = score
@@ -9,9 +11,13 @@ class PlayerInfo:
         self.mu = None
         self.sigma = None
         self.rank = None
+        # id in the PlayerStore, None while not stored
+        self.storeId = None
 
 
 class Move:
+    __slots__ = ("distance",)
+
     def __init__(self, distance=0.0):
         self.distance = distance
 
@@ -19,40 +25,61 @@ class Move:
 class Score:
     """Define points for some entity. One enity can have many scores"""
 
+    __slots__ = ("ownerId", "points")
+
     def __init__(self, ownerId, points=0):
         self.ownerId = ownerId
         self.points = points
 
 
 class Velocity:
+    __slots__ = ("speed", "angularSpeed", "move", "rotate")
+
     def __init__(self, speed=0.0, angularSpeed=0.0):
+        # added by VelocityProcessor every turn instead of new ones
+        self.move = Move()
+        self.rotate = Rotate()
+        self.reset(speed, angularSpeed)
+
+    def reset(self, speed=0.0, angularSpeed=0.0):
+        """Set up a reused velocity again, it keeps its Move and Rotate"""
         self.speed = speed
         self.angularSpeed = angularSpeed
 
 
 class Rotate:
+    __slots__ = ("angle",)
+
     def __init__(self, angle=0.0):
         self.angle = angle
 
 
 class RotateGun:
+    __slots__ = ("angle",)
+
     def __init__(self, angle=0.0):
         self.angle = angle
 
 
 class MovementSteering:
+    __slots__ = ("moveForwardKey", "moveBackwardsKey")
+
     def __init__(self, moveForwardKey, moveBackwardsKey):
         self.moveForwardKey = moveForwardKey
         self.moveBackwardsKey = moveBackwardsKey
 
 
 class RotationSteering:
+    __slots__ = ("rotateLeftKey", "rotateRightKey")
+
     def __init__(self, rotateLeftKey, rotateRightKey):
         self.rotateLeftKey = rotateLeftKey
         self.rotateRightKey = rotateRightKey
 
 
 class FiringSteering:
+    __slots__ = ("fireGunKey",)
+
     def __init__(self, fireGunKey):
         self.fireGunKey = fireGunKey
 
@@ -70,6 +97,8 @@ class Memory:
 
 
 class AI:
+    __slots__ = ("decisionFunction", "memory")
+
     def __init__(self, decisionFunction, memory=None):
         self.decisionFunction = decisionFunction
         self.memory = memory
@@ -81,16 +110,20 @@ class AI:
 class Agent:
     """Marker component for players/AIs that are taking part in the game actively"""
 
-    pass
+    __slots__ = ()
 
 
 class Decision:
+    __slots__ = ("commands", "timeout")
+
     def __init__(self, commands, timeout=1):
         self.commands = commands
         self.timeout = timeout
 
 
 class PositionBox:
+    __slots__ = ("x", "y", "w", "h", "rotation", "pivotx", "pivoty")
+
     def __init__(self, x=0.0, y=0.0, w=0.0, h=0.0, rotation=0.0, pivotx=None, pivoty=None):
         self.x = x
         self.y = y
@@ -111,20 +144,26 @@ class PositionBox:
 
 
 class Solid:
+    __slots__ = ("collisionRadius",)
+
     def __init__(self, collisionRadius):
         self.collisionRadius = collisionRadius
 
 
 class Explosive:
-    pass
+    __slots__ = ()
 
 
 class TTL:
+    __slots__ = ("turns",)
+
     def __init__(self, turns):
         self.turns = turns
 
 
 class Gun:
+    __slots__ = ("gunEntity", "ammo", "reloadTimeLeft", "isLoaded")
+
     def __init__(self, gunEntity, ammo):
         self.gunEntity = gunEntity
         self.ammo = ammo
@@ -133,32 +172,49 @@ class Gun:
 
 
 class RangeFinder:
+    __slots__ = ("maxRange", "angleOffset", "closestTarget", "foundTargets")
+
     def __init__(self, maxRange, angleOffset):
         self.maxRange = maxRange
         self.angleOffset = angleOffset
         self.closestTarget = None
+        self.foundTargets = []
 
 
 class FireGun:
-    pass
+    __slots__ = ()
+
 
+class Mount:
+    """Entity carried by parentId. Its PositionBox follows the parent and is set by MountProcessor,
+    x and y are its offset in the frame of the parent and rotation is relative to the parent"""
 
-class Child:
-    def __init__(self, childId):
-        self.childId = childId
+    __slots__ = ("parentId", "x", "y", "rotation")
+
+    def __init__(self, parentId, x=0.0, y=0.0, rotation=0.0):
+        self.parentId = parentId
+        self.x = x
+        self.y = y
+        self.rotation = rotation
 
 
 class Owner:
+    __slots__ = ("ownerId",)
+
     def __init__(self, ownerId):
         self.ownerId = ownerId
 
 
 class InputEvents:
+    __slots__ = ("events",)
+
     def __init__(self, events=None):
         self.events = events
 
 
 class Renderable:
+    __slots__ = ("image", "w", "h", "rotation")
+
     def __init__(self, image, rotation=0):
         self.image = image
         self.w = image.get_width()
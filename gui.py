@@ -1,7 +1,14 @@
 import math
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 import esper
 import pygame
+
+import instrumentation
 from argparser import config
 from gamecomponents import (
     Renderable,
@@ -17,49 +24,142 @@ from gamecomponents import (
 )
 
 
-class RenderProcessor(esper.Processor):
+class SpriteCache:
+    """Rotated and zoomed images with the offset of their top left corner from the position they are
+    drawn at, keyed by image, whole degrees and pivot. Least recently used ones are dropped once
+    there are more than size, all of them when the zoom changes"""
+
+    def __init__(self, size):
+        self.size = size
+        self.zoom = None
+        self.sprites = OrderedDict()
+
+    def sprite(self, image, origin, angle, imageRotation, zoom):
+        if zoom != self.zoom:
+            self.sprites.clear()
+            self.zoom = zoom
+        angle = round(angle) % 360
+        key = (image, origin, angle, imageRotation)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            return sprite
+        instrumentation.count("sprites_rotated")
+        sprite = (pygame.transform.rotozoom(image, angle + imageRotation, zoom), boxOffset(image, origin, angle))
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+
+def boxOffset(image, origin, angle):
+    """Offset of the upper left corner of the axis aligned bounding box of image rotated by angle
+    around origin, from the point origin is drawn at"""
+    # calculate the axis aligned bounding box of the rotated image
+    w, h = image.get_size()
+    box = [pygame.math.Vector2(p).rotate(angle) for p in [(0, 0), (w, 0), (w, h), (0, h)]]
+    minX, maxY = min(p[0] for p in box), max(p[1] for p in box)
+    # calculate the translation of the pivot
+    pivot = pygame.math.Vector2(origin)
+    pivotMove = pivot.rotate(angle) - pivot
+    return -origin[0] + minX - pivotMove[0], -origin[1] + maxY - pivotMove[1]
+
+
+# What a frame shows, taken from the world after a tick. Sprites, lasers and labels are tuples of
+# records starting with the entity they belong to, so frames between two snapshots can be
+# interpolated entity by entity
+Snapshot = namedtuple("Snapshot", ["time", "sprites", "lasers", "labels", "stats"])
+Sprite = namedtuple("Sprite", ["entity", "image", "x", "y", "rotation", "pivot", "imageRotation"])
+Laser = namedtuple("Laser", ["entity", "x", "y", "rotation"])
+Label = namedtuple("Label", ["entity", "text", "x", "y"])
+
+
+def takeSnapshot(world):
+    sprites = tuple(
+        Sprite(
+            ent,
+            rend.image,
+            position.x,
+            position.y,
+            position.rotation,
+            (position.pivotx, position.pivoty),
+            rend.rotation,
+        )
+        for ent, (rend, position) in world.get_components(Renderable, PositionBox)
+    )
+    lasers = []
+    for ent, gun in world.get_component(Gun):
+        gunPosition = world.component_for_entity(gun.gunEntity, PositionBox)
+        lasers.append(Laser(ent, gunPosition.x, gunPosition.y, gunPosition.rotation))
+    labels = tuple(
+        Label(ent, "{} +{:.1f}".format(info.name, info.score), position.x, position.y + 0.7 * position.h)
+        for ent, (info, position) in world.get_components(PlayerInfo, PositionBox)
+    )
+    stats = tuple(instrumentation.stats.summary()) if instrumentation.stats is not None else ()
+    return Snapshot(time.perf_counter(), sprites, tuple(lasers), labels, stats)
+
+
+def interpolate(previous, latest, alpha):
+    """Snapshot alpha of the way from previous to latest. Entities that are only in latest are shown
+    where they are in it"""
+
+    def between(records):
+        before = {record.entity: record for record in records(previous)}
+        result = []
+        for record in records(latest):
+            old = before.get(record.entity)
+            if old is not None:
+                turn = (record.rotation - old.rotation + 180) % 360 - 180
+                record = record._replace(
+                    x=old.x + alpha * (record.x - old.x),
+                    y=old.y + alpha * (record.y - old.y),
+                    rotation=old.rotation + alpha * turn,
+                )
+            result.append(record)
+        return tuple(result)
+
+    return latest._replace(sprites=between(lambda s: s.sprites), lasers=between(lambda s: s.lasers))
+
+
+def frameAt(previous, latest, now):
+    """Snapshot to draw at time now when previous and latest are the two most recent snapshots, one
+    snapshot interval late so there is always a newer snapshot to move to. None before any snapshot"""
+    if previous is None or latest is None:
+        return latest
+    interval = latest.time - previous.time
+    if interval <= 0:
+        return latest
+    alpha = (now - interval - previous.time) / interval
+    return interpolate(previous, latest, min(1.0, max(0.0, alpha)))
+
+
+class Renderer:
+    """Draws snapshots into the window, at most gui_max_fps of them a second"""
+
     FRAME_AVG_SIZE = 100
+    # pixels around the window in which names and scores may still show
+    LABEL_MARGIN = 200
 
     def __init__(self):
-        super().__init__()
         self.window = pygame.display.set_mode(config.gui_resolution)
         self.clock = pygame.time.Clock()
         self.clear_color = (0, 0, 0)
         self.currentFrame = 0
         self.lastFrameTimes = [0] * self.FRAME_AVG_SIZE
+        self.sprites = SpriteCache(config.gui_sprite_cache_size)
         # Initialize Pygame stuff
         if not pygame.get_init():
             pygame.init()
             pygame.display.set_caption("Tankbr")
             pygame.key.set_repeat(1, 1)
+        self.nameFont = pygame.font.Font(None, 16)
+        self.uiFont = pygame.font.Font(None, 20)
+        # rendered name and score of every player drawn in the last frame, by entity
+        self.labels = {}
 
     def blitRotate(self, surf, image, pos, originPos, angle, imageRotation):
-        # calcaulate the axis aligned bounding box of the rotated image
-        w, h = image.get_size()
-        box = [pygame.math.Vector2(p) for p in [(0, 0), (w, 0), (w, h), (0, h)]]
-        box_rotate = [p.rotate(angle) for p in box]
-        min_x, max_y = (
-            min(box_rotate, key=lambda p: p[0])[0],
-            max(box_rotate, key=lambda p: p[1])[1],
-        )
-        # sin_a, cos_a = math.sin(math.radians(angle)), math.cos(math.radians(angle))
-        # min_x, min_y = min([0, sin_a * h, cos_a * w, sin_a * h + cos_a * w]), max(
-        #     [0, sin_a * w, -cos_a * h, sin_a * w - cos_a * h]
-        # )
-        # calculate the translation of the pivot
-        pivot = pygame.math.Vector2(originPos[0], originPos[1])
-        pivot_rotate = pivot.rotate(angle)
-        pivot_move = pivot_rotate - pivot
-        # calculate the upper left origin of the rotated image
-        x, y = (
-            pos[0] - originPos[0] + min_x - pivot_move[0],
-            pos[1] - originPos[1] + max_y - pivot_move[1],
-        )
-
-        # get a rotated image
-        rotated_image = pygame.transform.rotozoom(image, angle + imageRotation, config.gui_zoom)
-        # rotate and blit the image
-        surf.blit(rotated_image, self.transformCoordinates(x, y))
+        rotatedImage, (offsetX, offsetY) = self.sprites.sprite(image, originPos, angle, imageRotation, config.gui_zoom)
+        surf.blit(rotatedImage, self.transformCoordinates(pos[0] + offsetX, pos[1] + offsetY))
 
     def addRawTime(self, time):
         self.lastFrameTimes[self.currentFrame % self.FRAME_AVG_SIZE] = time
@@ -73,45 +173,58 @@ class RenderProcessor(esper.Processor):
             -config.gui_zoom * y + config.gui_resolution[1] / 2 + config.gui_offset_y,
         )
 
-    def drawTank(self):
-        for ent, (rend, position) in self.world.get_components(Renderable, PositionBox):
-            pivot = pygame.math.Vector2(position.pivotx, position.pivoty)
-            originalPosition = pygame.math.Vector2(position.x, position.y)
+    def onScreen(self, x, y, margin):
+        """True when something within margin pixels of the world point x, y can be seen in the window"""
+        screenX, screenY = self.transformCoordinates(x, y)
+        return (
+            -margin <= screenX <= config.gui_resolution[0] + margin
+            and -margin <= screenY <= config.gui_resolution[1] + margin
+        )
+
+    def drawTank(self, sprites):
+        for sprite in sprites:
+            w, h = sprite.image.get_size()
+            if not self.onScreen(sprite.x, sprite.y, (w + h) * config.gui_zoom):
+                continue
             self.blitRotate(
                 self.window,
-                rend.image,
-                originalPosition,
-                pivot,
-                position.rotation,
-                rend.rotation,
+                sprite.image,
+                (sprite.x, sprite.y),
+                sprite.pivot,
+                sprite.rotation,
+                sprite.imageRotation,
             )
 
-    def drawLaser(self):
-        for ent, (gun, position) in self.world.get_components(Gun, PositionBox):
-            gunPosition = self.world.component_for_entity(gun.gunEntity, PositionBox)
-            sin_a, cos_a = math.sin(math.radians(gunPosition.rotation)), math.cos(math.radians(gunPosition.rotation))
-            x, y = self.transformCoordinates(gunPosition.x, gunPosition.y)
+    def drawLaser(self, lasers):
+        color = pygame.Color(255, 0, 0)
+        width, height = config.gui_resolution
+        for laser in lasers:
+            sin_a, cos_a = math.sin(math.radians(laser.rotation)), math.cos(math.radians(laser.rotation))
+            x, y = self.transformCoordinates(laser.x, laser.y)
             lx, ly = self.transformCoordinates(
-                gunPosition.x + config.game_laser_range * cos_a,
-                gunPosition.y + config.game_laser_range * sin_a,
+                laser.x + config.game_laser_range * cos_a,
+                laser.y + config.game_laser_range * sin_a,
             )
-            pygame.draw.line(self.window, pygame.Color(255, 0, 0), (x, y), (lx, ly), 2)
-
-    def drawNamesAndScores(self):
-        font = pygame.font.Font(None, 16)
-        for ent, (info, position) in self.world.get_components(PlayerInfo, PositionBox):
-            text = "{} +{:.1f}".format(info.name, info.score)
-            label = font.render(
-                text,
-                True,
-                pygame.Color("yellow"),
-            )
-            tx, ty = font.size(text)
-            x, y = self.transformCoordinates(position.x, position.y + 0.7 * position.h)
-            self.window.blit(label, (x - tx / 2, y - ty))
-
-    def drawUI(self):
-        font = pygame.font.Font(None, 20)
+            # lasers of different tanks are not connected, so each one is a line of its own
+            if min(x, lx) <= width and max(x, lx) >= 0 and min(y, ly) <= height and max(y, ly) >= 0:
+                pygame.draw.line(self.window, color, (x, y), (lx, ly), 2)
+
+    def drawNamesAndScores(self, labels):
+        rendered = {}
+        for label in labels:
+            if not self.onScreen(label.x, label.y, self.LABEL_MARGIN):
+                continue
+            text, surface = self.labels.get(label.entity, (None, None))
+            if text != label.text:
+                surface = self.nameFont.render(label.text, True, pygame.Color("yellow"))
+            rendered[label.entity] = (label.text, surface)
+            tx, ty = surface.get_size()
+            x, y = self.transformCoordinates(label.x, label.y)
+            self.window.blit(surface, (x - tx / 2, y - ty))
+        self.labels = rendered
+
+    def drawUI(self, stats):
+        font = self.uiFont
         fps = font.render(
             "FPS: {} (update took: {:.1f} ms (avg from {} FPS))".format(
                 int(self.clock.get_fps()), self.getRawTimeAvg(), self.FRAME_AVG_SIZE
@@ -120,15 +233,17 @@ class RenderProcessor(esper.Processor):
             pygame.Color("white"),
         )
         self.window.blit(fps, (10, 10))
+        for line, text in enumerate(stats):
+            self.window.blit(font.render(text, True, pygame.Color("white")), (10, 30 + 16 * line))
 
-    def process(self):
+    def draw(self, snapshot):
         # Clear the window:
         self.window.fill(self.clear_color)
 
-        self.drawTank()
-        self.drawLaser()
-        self.drawNamesAndScores()
-        self.drawUI()
+        self.drawTank(snapshot.sprites)
+        self.drawLaser(snapshot.lasers)
+        self.drawNamesAndScores(snapshot.labels)
+        self.drawUI(snapshot.stats)
 
         # Flip the framebuffers
         pygame.display.flip()
@@ -137,18 +252,111 @@ class RenderProcessor(esper.Processor):
         self.clock.tick(config.gui_max_fps)
 
 
+class RenderProcessor(esper.Processor):
+    """Draws the match after every tick, which makes the match run at most gui_max_fps ticks a second"""
+
+    def __init__(self):
+        super().__init__()
+        self.renderer = Renderer()
+
+    def process(self):
+        self.renderer.draw(takeSnapshot(self.world))
+
+
+class SnapshotProcessor(esper.Processor):
+    """Publishes a snapshot of the match to a Viewer after every tick"""
+
+    def __init__(self, viewer):
+        super().__init__()
+        self.viewer = viewer
+
+    def process(self):
+        self.viewer.publish(takeSnapshot(self.world))
+
+
+class Viewer:
+    """Draws matches on a thread of its own while they run at full speed. Matches publish snapshots
+    and every frame shows the match between the two most recent ones, snapshots published between
+    two frames are never drawn"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = None
+        self.latest = None
+        self.running = True
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="viewer", daemon=True)
+        self.thread.start()
+        # the window has to be open before images are loaded for the matches
+        self.ready.wait()
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.previous, self.latest = self.latest, snapshot
+
+    def frame(self, now):
+        with self.lock:
+            previous, latest = self.previous, self.latest
+        return frameAt(previous, latest, now)
+
+    def run(self):
+        try:
+            renderer = Renderer()
+        except Exception:
+            self.running = False
+            raise
+        finally:
+            self.ready.set()
+        while self.running:
+            events = pygame.event.get()
+            controlView(events)
+            if any(event.type == pygame.QUIT for event in events):
+                # matches go on without being drawn
+                self.running = False
+                break
+            snapshot = self.frame(time.perf_counter())
+            if snapshot is None:
+                renderer.clock.tick(config.gui_max_fps)
+            else:
+                renderer.draw(snapshot)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+
+# Viewer of this process, started with the first match it draws
+viewer = None
+
+
+def startViewer():
+    global viewer
+    if viewer is None or not viewer.running:
+        viewer = Viewer()
+    return viewer
+
+
+def stopViewer():
+    global viewer
+    if viewer is not None:
+        viewer.close()
+        viewer = None
+
+
 class InputEventProcessor(esper.Processor):
+    """Does what the keys bound by steering components of tanks ask for. Bindings are put into a
+    table once, then every event is looked up in it"""
+
     def __init__(self, gameEndProcessor):
         super().__init__()
         self.gameEndProcessor = gameEndProcessor
+        # (event type, key) -> [(entity, action)]
+        self.keyActions = None
 
     def registerKeyActions(self, entity, key, actionKeyDown=None, actionKeyUp=None):
-        for ent, inputEvents in self.world.get_component(InputEvents):
-            for event in inputEvents.events:
-                if event.type == pygame.KEYDOWN and event.key == key and actionKeyDown is not None:
-                    actionKeyDown(entity)
-                elif event.type == pygame.KEYUP and event.key == key and actionKeyUp is not None:
-                    actionKeyUp(entity)
+        for eventType, action in ((pygame.KEYDOWN, actionKeyDown), (pygame.KEYUP, actionKeyUp)):
+            if action is not None:
+                self.keyActions.setdefault((eventType, key), []).append((entity, action))
 
     def steerRotation(self, entity, rotationSteering):
         def setAngularSpeed(ent, speed):
@@ -189,58 +397,148 @@ class InputEventProcessor(esper.Processor):
             lambda ent: self.world.add_component(ent, FireGun()),
         )
 
-    def doMouseActions(self):
-        # button events must go first so the screen does not jump when motion comes first
-        for ent, inputEvents in self.world.get_component(InputEvents):
-            for event in inputEvents.events:
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    leftMouseButtonPressed, _, _ = pygame.mouse.get_pressed(3)
-                    if leftMouseButtonPressed:
-                        # get_rel needs to be reset to avoid screen jumps when dragging
-                        pygame.mouse.get_rel()
-        for ent, inputEvents in self.world.get_component(InputEvents):
-            for event in inputEvents.events:
-                if event.type == pygame.MOUSEWHEEL:
-                    if event.y > 0:
-                        increaseZoom()
-                    if event.y < 0:
-                        decreaseZoom()
-                if event.type == pygame.MOUSEMOTION:
-                    leftMouseButtonPressed, _, _ = pygame.mouse.get_pressed(3)
-                    if leftMouseButtonPressed:
-                        x, y = pygame.mouse.get_rel()
-                        config.gui_offset_x += x
-                        config.gui_offset_y += y
-
-    def checkForQuit(self):
-        for ent, inputEvents in self.world.get_component(InputEvents):
-            for event in inputEvents.events:
-                if event.type == pygame.QUIT:
-                    self.gameEndReason = self.gameEndProcessor.GameEndReason.MANUAL
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.gameEndReason = self.gameEndProcessor.GameEndReason.MANUAL
-
-    def process(self):
+    def bindKeys(self):
+        self.keyActions = {}
         for ent, (_, movementSteering) in self.world.get_components(Velocity, MovementSteering):
             self.steerMovement(ent, movementSteering)
         for ent, (_, rotationSteering) in self.world.get_components(Velocity, RotationSteering):
             self.steerRotation(ent, rotationSteering)
         for ent, (_, firingSteering) in self.world.get_components(Gun, FiringSteering):
             self.fireGun(ent, firingSteering)
-        self.doMouseActions()
-        self.checkForQuit()
+
+    def quit(self):
+        self.gameEndProcessor.gameEndReason = self.gameEndProcessor.GameEndReason.MANUAL
+
+    def process(self):
+        if self.keyActions is None:
+            self.bindKeys()
+        for ent, inputEvents in self.world.get_component(InputEvents):
+            for event in inputEvents.events:
+                if event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+                    for entity, action in self.keyActions.get((event.type, event.key), ()):
+                        # bindings of tanks that died stay in the table
+                        if self.world.entity_exists(entity):
+                            action(entity)
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                        self.quit()
+                elif event.type == pygame.QUIT:
+                    self.quit()
+            controlView(inputEvents.events)
 
 
 class InputEventCollector(esper.Processor):
-    def __init__(self, eventsEntity):
+    def __init__(self, eventsEntity, inputQueue=None):
+        super().__init__()
+        self.eventsEntity = eventsEntity
+        self.inputQueue = inputQueue
+
+    def process(self):
+        events = pygame.event.get()
+        if self.inputQueue is not None:
+            events += self.inputQueue.take()
+        self.world.component_for_entity(self.eventsEntity, InputEvents).events = events
+
+
+class QueuedInputCollector(esper.Processor):
+    """InputEventCollector of matches that are not drawn, all events come from inputQueue"""
+
+    def __init__(self, eventsEntity, inputQueue):
         super().__init__()
         self.eventsEntity = eventsEntity
+        self.inputQueue = inputQueue
 
     def process(self):
-        # FIXME Can be used to decouple further processors from
-        # pygame by mapping those events to other objects
-        self.world.component_for_entity(self.eventsEntity, InputEvents).events = pygame.event.get()
+        self.world.component_for_entity(self.eventsEntity, InputEvents).events = self.inputQueue.take()
+
+
+# Key event that does not come from the window, with the type and key of a pygame event
+KeyEvent = namedtuple("KeyEvent", ["type", "key"])
+KEY_EVENT_TYPES = {"down": pygame.KEYDOWN, "up": pygame.KEYUP}
+
+
+def keyEvent(eventType, keyName):
+    """KeyEvent from the names of its type, down or up, and of its key as in pygame constants without K_"""
+    key = getattr(pygame, "K_" + keyName, None)
+    if key is None:
+        key = getattr(pygame, "K_" + keyName.upper())
+    return KeyEvent(KEY_EVENT_TYPES[eventType], key)
+
+
+class InputQueue:
+    """Key events of human players that do not come from the window: a script with the tick of every
+    event and events received while the match runs, from a socket or any other thread"""
+
+    def __init__(self, script=None):
+        # tick -> [KeyEvent]
+        self.script = script if script is not None else {}
+        self.received = queue.SimpleQueue()
+        self.tick = 0
+
+    def put(self, event):
+        """Add event to the next tick"""
+        self.received.put(event)
+
+    def take(self):
+        """Events of the next tick"""
+        self.tick += 1
+        events = self.script.pop(self.tick, [])
+        while True:
+            try:
+                events.append(self.received.get_nowait())
+            except queue.Empty:
+                return events
+
+
+def readInputScript(path):
+    """InputQueue playing a file with an event on every line: tick, down or up and key name, like 5 down w"""
+    script = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                tick, eventType, keyName = line.split()
+                script.setdefault(int(tick), []).append(keyEvent(eventType, keyName))
+    return InputQueue(script)
+
+
+def listenForInput(inputQueue, port):
+    """Put events sent to port on localhost into inputQueue, one on every line as down or up and key
+    name. Returns the port, which is chosen by the system when port is 0"""
+    server = socket.create_server(("127.0.0.1", port))
+
+    def serve():
+        with server:
+            while True:
+                connection, _ = server.accept()
+                with connection, connection.makefile() as lines:
+                    for line in lines:
+                        if line.strip():
+                            inputQueue.put(keyEvent(*line.split()))
+
+    threading.Thread(target=serve, name="input", daemon=True).start()
+    return server.getsockname()[1]
+
+
+def controlView(events):
+    """Zoom with the mouse wheel and move the view by dragging"""
+    # button events must go first so the screen does not jump when motion comes first
+    for event in events:
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            leftMouseButtonPressed, _, _ = pygame.mouse.get_pressed(3)
+            if leftMouseButtonPressed:
+                # get_rel needs to be reset to avoid screen jumps when dragging
+                pygame.mouse.get_rel()
+    for event in events:
+        if event.type == pygame.MOUSEWHEEL:
+            if event.y > 0:
+                increaseZoom()
+            if event.y < 0:
+                decreaseZoom()
+        if event.type == pygame.MOUSEMOTION:
+            leftMouseButtonPressed, _, _ = pygame.mouse.get_pressed(3)
+            if leftMouseButtonPressed:
+                x, y = pygame.mouse.get_rel()
+                config.gui_offset_x += x
+                config.gui_offset_y += y
 
 
 def increaseZoom():
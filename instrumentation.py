@@ -0,0 +1,106 @@
+import contextlib
+import time
+from collections import Counter
+
+import esper
+
+# Stats being collected right now, None when instrumentation is off. Everything in here checks it
+# first, so leaving the calls in costs one function call per tick when nothing is collected.
+stats = None
+
+
+class Stats:
+    """Timings of processors and counters of things happening in matches"""
+
+    def __init__(self):
+        self.processorSeconds = Counter()
+        self.processorCalls = Counter()
+        self.processorEntities = Counter()
+        # seconds every processor took in the most recent tick, for live display
+        self.lastTick = {}
+        self.counters = Counter()
+
+    def merge(self, other):
+        self.processorSeconds.update(other.processorSeconds)
+        self.processorCalls.update(other.processorCalls)
+        self.processorEntities.update(other.processorEntities)
+        self.lastTick = dict(other.lastTick)
+        self.counters.update(other.counters)
+
+    def summary(self):
+        """Short lines describing the most recent tick and counters so far"""
+        lines = [
+            "{}: {:.2f} ms".format(name, seconds * 1000)
+            for name, seconds in sorted(self.lastTick.items(), key=lambda item: -item[1])
+        ]
+        lines.append(", ".join("{}: {}".format(name, value) for name, value in sorted(self.counters.items())))
+        return lines
+
+    def dump(self):
+        return {
+            "counters": dict(self.counters),
+            "processors": {
+                name: {
+                    "calls": self.processorCalls[name],
+                    "seconds": seconds,
+                    "ms_per_call": seconds * 1000 / self.processorCalls[name],
+                    "entities_per_call": self.processorEntities[name] / self.processorCalls[name],
+                }
+                for name, seconds in self.processorSeconds.most_common()
+            },
+        }
+
+
+def count(name, amount=1):
+    if stats is not None:
+        stats.counters[name] += amount
+
+
+def enable():
+    """Start collecting into new Stats and return them"""
+    global stats
+    stats = Stats()
+    return stats
+
+
+def merge(matchStats):
+    if stats is not None and matchStats is not None:
+        stats.merge(matchStats)
+
+
+@contextlib.contextmanager
+def collecting():
+    """Collect into separate Stats while inside, for example stats of a single match"""
+    global stats
+    previous = stats
+    stats = Stats()
+    try:
+        yield stats
+    finally:
+        stats = previous
+
+
+class InstrumentedWorld(esper.World):
+    """World recording time, calls and number of entities of every processor into current stats"""
+
+    def __init__(self):
+        super().__init__()
+        self._process = self._instrumentedProcess
+
+    def _instrumentedProcess(self, *args, **kwargs):
+        current = stats
+        if current is None:
+            for processor in self._processors:
+                processor.process(*args, **kwargs)
+            return
+        current.counters["ticks"] += 1
+        lastTick = {}
+        for processor in self._processors:
+            name = processor.__class__.__name__
+            current.processorEntities[name] += len(self._entities)
+            start = time.perf_counter()
+            processor.process(*args, **kwargs)
+            lastTick[name] = time.perf_counter() - start
+            current.processorSeconds[name] += lastTick[name]
+            current.processorCalls[name] += 1
+        current.lastTick = lastTick
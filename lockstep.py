@@ -0,0 +1,274 @@
+import random
+
+import numpy as np
+
+import instrumentation
+from argparser import config
+from arrayengine import ArrayEngine
+from gamecomponents import PositionBox, Solid
+from networks import NeuralAIBatch
+from spatial import ALL_PAIRS_LIMIT, collidingPairs
+from vectormath import circlesCollideMatrix, cosSin, rangeFind
+
+
+class LockstepMatch(ArrayEngine):
+    """ArrayEngine of one match played in a Lockstep. Its entity and tank arrays are rows of the
+    arrays shared by all matches, and it keeps its own python random state between turns"""
+
+    def __init__(self, players, row):
+        self.lockstep = None
+        self.row = row
+        super().__init__(players)
+        self.randomState = random.getstate()
+
+    def aiRandomState(self):
+        return self.randomState
+
+    def growEntities(self, size):
+        if self.lockstep is None:
+            super().growEntities(size)
+        else:
+            self.lockstep.growEntities(size)
+
+
+class Lockstep:
+    """Headless simulation of many matches at once, every turn of all of them together.
+
+    State of all matches lives in arrays indexed by (match, entity) or (match, tank). Phases that
+    only do arithmetic on them (movement, rotation, range finding, bullet TTL and reloading) and
+    forward passes of the neural networks run once per turn for all matches. Phases that follow
+    the esper iteration order run match by match like in ArrayEngine. Every match ends on its own
+    and gets the same result as when played alone with its seed."""
+
+    def __init__(self, matches, seeds):
+        state = random.getstate()
+        try:
+            self.engines = []
+            for row, (players, seed) in enumerate(zip(matches, seeds)):
+                random.seed(seed)
+                self.engines.append(LockstepMatch(players, row))
+        finally:
+            random.setstate(state)
+        self.neuralAIBatch = NeuralAIBatch()
+        self.shareTankArrays()
+        self.growEntities(max(len(engine.posX) for engine in self.engines))
+        for engine in self.engines:
+            engine.lockstep = self
+
+    def shareTankArrays(self):
+        width = max(len(engine.players) for engine in self.engines)
+        for name in ArrayEngine.TANK_ARRAYS:
+            array = getattr(self.engines[0], name)
+            shared = np.zeros((len(self.engines), width), dtype=array.dtype)
+            if name == "removed":
+                # columns of matches with fewer tanks hold tanks that are never there
+                shared[:] = True
+            for engine in self.engines:
+                tanks = len(engine.players)
+                shared[engine.row, :tanks] = getattr(engine, name)
+                setattr(engine, name, shared[engine.row, :tanks])
+            setattr(self, name, shared)
+
+    def growEntities(self, size):
+        for name in ArrayEngine.ENTITY_ARRAYS:
+            array = getattr(self.engines[0], name)
+            shared = np.zeros((len(self.engines), size), dtype=array.dtype)
+            for engine in self.engines:
+                array = getattr(engine, name)
+                shared[engine.row, : len(array)] = array
+                setattr(engine, name, shared[engine.row])
+            setattr(self, name, shared)
+
+    def run(self):
+        state = random.getstate()
+        try:
+            running = self.engines
+            while running:
+                self.process(running)
+                for engine in running:
+                    if config.fast_forward and engine.isGameRunning() and engine.isQuiescent():
+                        engine.fastForward()
+                running = [engine for engine in running if engine.isGameRunning()]
+        finally:
+            random.setstate(state)
+
+    def process(self, running):
+        instrumentation.count("ticks", len(running))
+        for engine in running:
+            engine.clearDeadEntities()
+        self.processAI(running)
+        for engine in running:
+            engine.processDecisions()
+            engine.processGameEnd()
+        solids = self.processCollisions(running)
+        for engine in running:
+            engine.processTotalScore()
+        self.processMovement(running)
+        self.processRotation(running)
+        self.processMounts(running)
+        self.processRangeFinding(running, *solids)
+        self.processVelocity(running)
+        for engine in running:
+            engine.processFiringGun()
+        self.processCleanup(running)
+        self.processGunReload(running)
+
+    def flatBullets(self, running):
+        """Bullets of all running matches as indexes into the flattened entity arrays"""
+        width = self.posX.shape[1]
+        return np.array([engine.row * width + b for engine in running for b in engine.bullets], dtype=np.intp)
+
+    def processAI(self, running):
+        allDecisions, neuralAIs, inputs, owners = [], [], [], []
+        for j, engine in enumerate(running):
+            random.setstate(engine.randomState)
+            decisions, matchNeuralAIs, matchInputs, neuralAITanks = engine.collectDecisions()
+            engine.randomState = random.getstate()
+            allDecisions.append(decisions)
+            neuralAIs += matchNeuralAIs
+            inputs += matchInputs
+            owners += [(j, i) for i in neuralAITanks]
+        if neuralAIs:
+            for (j, i), decision in zip(owners, self.neuralAIBatch.decide(neuralAIs, inputs)):
+                allDecisions[j][i] = (allDecisions[j][i][0], decision)
+        for engine, decisions in zip(running, allDecisions):
+            engine.applyDecisions(decisions)
+
+    def processMovement(self, running):
+        width = self.posX.shape[1]
+        tanks, distances = [], []
+        for engine in running:
+            for k, move in enumerate(engine.moves):
+                if move is not None:
+                    tanks.append(engine.row * width + int(engine.bodyIds[k]))
+                    distances.append(move.distance)
+                    engine.moves[k] = None
+        moving = self.moving.reshape(-1)
+        bullets = self.flatBullets(running)
+        bullets = bullets[moving[bullets]]
+        if not tanks and len(bullets) == 0:
+            return
+        entities = np.concatenate((np.array(tanks, dtype=np.intp), bullets))
+        distances = np.concatenate((distances, np.full(len(bullets), float(config.game_bullet_speed))))
+        cos, sin = cosSin(self.rotation.reshape(-1)[entities])
+        self.posX.reshape(-1)[entities] += distances * cos
+        self.posY.reshape(-1)[entities] += distances * sin
+        moving[bullets] = False
+
+    def processRotation(self, running):
+        width = self.posX.shape[1]
+        bodies, tanks, bodyAngles, gunAngles, rotateGunAngles = [], [], [], [], []
+        for engine in running:
+            offset = engine.row * width
+            tankOffset = engine.row * self.gunRotation.shape[1]
+            for k, removed in enumerate(engine.removed.tolist()):
+                if removed:
+                    continue
+                bodies.append(offset + int(engine.bodyIds[k]))
+                tanks.append(tankOffset + k)
+                bodyAngles.append(0.0 if engine.rotates[k] is None else engine.rotates[k].angle)
+                gunAngles.append(0.0 if engine.gunRotates[k] is None else engine.gunRotates[k].angle)
+                rotateGunAngles.append(0.0 if engine.rotateGuns[k] is None else engine.rotateGuns[k].angle)
+                engine.rotates[k] = engine.gunRotates[k] = engine.rotateGuns[k] = None
+        self.rotation.reshape(-1)[bodies] += np.array(bodyAngles, dtype=np.float64)
+        gunRotation = self.gunRotation.reshape(-1)
+        tanks = np.array(tanks, dtype=np.intp)
+        gunRotation[tanks] += np.array(gunAngles, dtype=np.float64)
+        gunRotation[tanks] += np.array(rotateGunAngles, dtype=np.float64)
+
+    def processMounts(self, running):
+        rows = np.array([engine.row for engine in running], dtype=np.intp)
+        alive = ~self.removed[rows]
+        rotation = self.entityValues("rotation", rows, self.bodyIds[rows]) + self.gunRotation[rows]
+        guns = (rows[:, None] * self.posX.shape[1] + self.gunIds[rows])[alive]
+        self.rotation.reshape(-1)[guns] = rotation[alive]
+
+    def entityValues(self, name, rows, ids):
+        """Entity array name at entities ids[j] of the match in row rows[j]"""
+        return getattr(self, name).reshape(-1)[rows[:, None] * self.posX.shape[1] + ids]
+
+    def solidValues(self, name, rows, solidIds, present):
+        """entityValues at solids of every match, NaN where a shorter match has none"""
+        values = self.entityValues(name, rows, solidIds)
+        values[~present] = np.nan
+        return values
+
+    def processCollisions(self, running):
+        """Collisions of all matches. Returns solids of every match as entity ids padded at the end,
+        with a mask of the ids that are there, for range finding later in the turn"""
+        rows = np.array([engine.row for engine in running], dtype=np.intp)
+        entities = [engine.sets.query(PositionBox, Solid) for engine in running]
+        lengths = [len(matchEntities) for matchEntities in entities]
+        width = max(lengths)
+        solidIds = np.array(
+            [matchEntities + [0] * (width - len(matchEntities)) for matchEntities in entities], dtype=np.intp
+        )
+        present = np.arange(width) < np.array(lengths)[:, None]
+        x, y, r = (self.solidValues(name, rows, solidIds, present) for name in ("posX", "posY", "radius"))
+        explosive = self.entityValues("isBullet", rows, solidIds).tolist()
+        if width <= ALL_PAIRS_LIMIT:
+            # all matches at once, the same matrices collidingPairs checks for every match
+            instrumentation.count("collision_checks", sum(n * (n - 1) for n in lengths))
+            matches, first, second = np.nonzero(circlesCollideMatrix(x, y, r))
+            bounds = np.searchsorted(matches, np.arange(len(running) + 1)).tolist()
+            pairs = [(first[start:end], second[start:end]) for start, end in zip(bounds, bounds[1:])]
+        else:
+            pairs = [collidingPairs(x[j, :n], y[j, :n], r[j, :n]) for j, n in enumerate(lengths)]
+        for engine, matchEntities, matchExplosive, matchPairs in zip(running, entities, explosive, pairs):
+            engine.handleCollisions(matchEntities, matchExplosive, *matchPairs)
+        return solidIds, present
+
+    def processRangeFinding(self, running, solidIds, present):
+        """Every tank looks at the solids of its own match. Matches are stacked on the first axis,
+        tanks that are gone and solids missing from shorter matches sit at NaN and see nothing"""
+        rows = np.array([engine.row for engine in running], dtype=np.intp)
+        instrumentation.count(
+            "range_finder_tests",
+            int(np.dot(np.count_nonzero(~self.removed[rows], axis=1), np.count_nonzero(present, axis=1))),
+        )
+        # solids are padded at the end, so the closest one of a match keeps its index
+        targets = {name: self.solidValues(name, rows, solidIds, present) for name in ("posX", "posY", "radius")}
+        alive = ~self.removed[rows]
+        bodies, guns = self.bodyIds[rows], self.gunIds[rows]
+        x = np.where(alive, self.entityValues("posX", rows, bodies), np.nan)
+        y = np.where(alive, self.entityValues("posY", rows, bodies), np.nan)
+        rotation = np.where(alive, self.entityValues("rotation", rows, guns), 0.0)
+        _, closest, _ = rangeFind(
+            x,
+            y,
+            rotation,
+            np.full(x.shape, float(config.game_laser_range)),
+            targets["posX"],
+            targets["posY"],
+            targets["radius"],
+        )
+        closestIds = np.where(closest >= 0, np.take_along_axis(solidIds, np.maximum(closest, 0), axis=1), -1)
+        for engine, matchAlive, matchClosest in zip(running, alive.tolist(), closestIds.tolist()):
+            for k in range(len(engine.players)):
+                if matchAlive[k]:
+                    engine.closestTargets[k] = matchClosest[k] if matchClosest[k] >= 0 else None
+
+    def processVelocity(self, running):
+        if config.game_bullet_speed != 0:
+            self.moving.reshape(-1)[self.flatBullets(running)] = True
+
+    def processCleanup(self, running):
+        width = self.posX.shape[1]
+        engines = {engine.row: engine for engine in running}
+        bullets = self.flatBullets(running)
+        ttl = self.ttl.reshape(-1)
+        expired = ttl[bullets] <= 0
+        for bullet in bullets[expired].tolist():
+            engines[bullet // width].dead.add(bullet % width)
+        ttl[bullets[~expired]] -= 1
+
+    def processGunReload(self, running):
+        playing = np.zeros(len(self.engines), dtype=bool)
+        playing[[engine.row for engine in running]] = True
+        tanks = ~self.removed & playing[:, None]
+        startLoading = tanks & (self.ammo > 0) & ~self.isLoaded & (self.reloadTimeLeft == 0)
+        loading = tanks & ~self.isLoaded & (self.reloadTimeLeft > 0)
+        self.ammo[startLoading] -= 1
+        self.reloadTimeLeft[startLoading] = config.game_gun_load_time
+        self.reloadTimeLeft[loading] -= 1
+        self.isLoaded[loading & (self.reloadTimeLeft == 0)] = True
@@ -1,9 +1,12 @@
 import math
+import random
 from enum import Enum
 
 import esper
+import numpy as np
 
 import create
+import instrumentation
 from argparser import config
 from gamecomponents import (
     PlayerInfo,
@@ -23,27 +26,30 @@ from gamecomponents import (
     Gun,
     RangeFinder,
     FireGun,
-    Child,
+    Mount,
     Owner,
 )
-from mymath import segmentAndCircleIntersect, circlesCollide, square
+from networks import NeuralAI, NeuralAIBatch
+from spatial import SpatialIndex
+from vectormath import cosSin
 
 
 class MovementProcessor(esper.Processor):
-    def __init__(self):
+    def __init__(self, spatialIndex=None):
         super().__init__()
+        self.spatialIndex = spatialIndex
 
     def move(self, move, position, rotation):
         position.x += move.distance * math.cos(math.radians(rotation))
         position.y += move.distance * math.sin(math.radians(rotation))
 
     def process(self):
-        for ent, (move, position) in self.world.get_components(Move, PositionBox):
+        moves = self.world.get_components(Move, PositionBox)
+        for ent, (move, position) in moves:
             self.move(move, position, position.rotation)
-            for child in self.world.try_component(ent, Child):
-                for child_position in self.world.try_component(child.childId, PositionBox):
-                    self.move(move, child_position, position.rotation)
             self.world.remove_component(ent, Move)
+        if moves and self.spatialIndex is not None:
+            self.spatialIndex.moved()
 
 
 # Velocity processor genarates move and rotate components
@@ -52,11 +58,15 @@ class VelocityProcessor(esper.Processor):
         super().__init__()
 
     def process(self):
+        # every velocity adds the same Move and Rotate each turn, Movement and Rotation processors
+        # remove them again right away
         for ent, velocity in self.world.get_component(Velocity):
             if velocity.speed != 0:
-                self.world.add_component(ent, Move(velocity.speed))
+                velocity.move.distance = velocity.speed
+                self.world.add_component(ent, velocity.move)
             if velocity.angularSpeed != 0:
-                self.world.add_component(ent, Rotate(velocity.angularSpeed))
+                velocity.rotate.angle = velocity.angularSpeed
+                self.world.add_component(ent, velocity.rotate)
 
 
 class RotationProcessor(esper.Processor):
@@ -64,17 +74,62 @@ class RotationProcessor(esper.Processor):
         super().__init__()
 
     def process(self):
+        # mounted entities turn relative to their parent, MountProcessor adds the parent rotation
+        for ent, (rotate, mount) in self.world.get_components(Rotate, Mount):
+            mount.rotation += rotate.angle
+            self.world.remove_component(ent, Rotate)
         for ent, (rotate, position) in self.world.get_components(Rotate, PositionBox):
             position.rotation += rotate.angle
-            for child in self.world.try_component(ent, Child):
-                for child_position in self.world.try_component(child.childId, PositionBox):
-                    child_position.rotation += rotate.angle
             self.world.remove_component(ent, Rotate)
         for ent, (rotateGun, gun) in self.world.get_components(RotateGun, Gun):
-            self.world.component_for_entity(gun.gunEntity, PositionBox).rotation += rotateGun.angle
+            self.world.component_for_entity(gun.gunEntity, Mount).rotation += rotateGun.angle
             self.world.remove_component(ent, RotateGun)
 
 
+class MountProcessor(esper.Processor):
+    """Sets PositionBox of every mounted entity from the PositionBox of its parent, all of them at
+    once after the parents moved and rotated"""
+
+    def __init__(self):
+        super().__init__()
+        # parent -> entities mounted on it, as of the last pass
+        self.mounted = None
+
+    def mountedOn(self, parent):
+        """Entities mounted on parent that are still there"""
+        if self.mounted is None:
+            self.indexMounts(self.world.get_component(Mount))
+        return [ent for ent in self.mounted.get(parent, ()) if self.world.entity_exists(ent)]
+
+    def indexMounts(self, mounts):
+        self.mounted = {}
+        for ent, mount in mounts:
+            self.mounted.setdefault(mount.parentId, []).append(ent)
+
+    def process(self):
+        mounts = self.world.get_components(Mount, PositionBox)
+        self.indexMounts((ent, mount) for ent, (mount, _) in mounts)
+        if len(mounts) == 0:
+            return
+        parents = [self.world.component_for_entity(mount.parentId, PositionBox) for _, (mount, _) in mounts]
+        parentX = np.array([parent.x for parent in parents], dtype=np.float64)
+        parentY = np.array([parent.y for parent in parents], dtype=np.float64)
+        parentRotation = np.array([parent.rotation for parent in parents], dtype=np.float64)
+        offsetX = np.array([mount.x for _, (mount, _) in mounts], dtype=np.float64)
+        offsetY = np.array([mount.y for _, (mount, _) in mounts], dtype=np.float64)
+        rotation = parentRotation + np.array([mount.rotation for _, (mount, _) in mounts], dtype=np.float64)
+        cos, sin = cosSin(parentRotation)
+        x = parentX + offsetX * cos - offsetY * sin
+        y = parentY + offsetX * sin + offsetY * cos
+        for (_, (_, position)), px, py, r in zip(mounts, x.tolist(), y.tolist(), rotation.tolist()):
+            position.x, position.y, position.rotation = px, py, r
+
+
+def living(world, componentType):
+    """world.get_component without entities deleted since the last world.process()"""
+    return [(ent, component) for ent, component in world.get_component(componentType) if world.entity_exists(ent)]
+
+
 class GameEndProcessor(esper.Processor):
     class GameEndReason(Enum):
         MANUAL = 0
@@ -96,6 +151,32 @@ class GameEndProcessor(esper.Processor):
     def callAtGameEnd(self, callback):
         self.gameEndCallbacks.append(callback)
 
+    def isOutOfAmmo(self):
+        return all(g.ammo == 0 for e, g in living(self.world, Gun))
+
+    def turnsToEnd(self):
+        """Turns the match still lasts if no gun fires and no tank dies any more"""
+        if len(living(self.world, Agent)) <= 1:
+            return 1
+        turns = self.turnsLeft
+        if self.noAmmoCountdown:
+            turns = min(turns, self.noAmmoTurnsLeft)
+        elif self.isOutOfAmmo():
+            # the countdown starts in the next turn and ends no sooner than in the one after
+            turns = min(turns, 1 + max(self.ammoTimeout, 1))
+        return turns
+
+    def skipTurns(self, turns):
+        """Count down turns that are not played, there have to be fewer of them than turnsToEnd()"""
+        if turns <= 0:
+            return
+        self.turnsLeft -= turns
+        if self.noAmmoCountdown:
+            self.noAmmoTurnsLeft -= turns
+        elif self.isOutOfAmmo():
+            self.noAmmoCountdown = True
+            self.noAmmoTurnsLeft = self.ammoTimeout - (turns - 1)
+
     def process(self):
         self.turnsLeft -= 1
         if self.noAmmoCountdown:
@@ -103,14 +184,14 @@ class GameEndProcessor(esper.Processor):
             if self.noAmmoTurnsLeft <= 0:
                 # print("Game ended because no one had bullets left")
                 self.gameEndReason = self.GameEndReason.OUT_OF_AMMO
-        if all(g.ammo == 0 for e, g in self.world.get_component(Gun)) and not self.noAmmoCountdown:
+        if self.isOutOfAmmo() and not self.noAmmoCountdown:
             # print("No bullets countdown started")
             self.noAmmoCountdown = True
             self.noAmmoTurnsLeft = self.ammoTimeout
         if self.turnsLeft <= 0:
             # print("Game ended because time run out")
             self.gameEndReason = self.GameEndReason.OUT_OF_TIME
-        if len(self.world.get_component(Agent)) <= 1:
+        if len(living(self.world, Agent)) <= 1:
             # print("Game ended because there were no players to kill left")
             self.gameEndReason = self.GameEndReason.LAST_MAN_STANDING
         if not self.isGameRunning():
@@ -118,9 +199,47 @@ class GameEndProcessor(esper.Processor):
                 callback()
 
 
-class FiringGunProcessor(esper.Processor):
+class BulletPoolProcessor(esper.Processor):
+    """Components of deleted bullets, which create.bullet reuses instead of creating new ones.
+
+    Deleted entities stay in the world until the next world.process() starts, so their components
+    are given out again only from then on. It has to be the first processor."""
+
     def __init__(self):
         super().__init__()
+        self.deleted = {}
+        self.free = []
+
+    def delete(self, entity):
+        """world.delete_entity that keeps components of bullets"""
+        if self.world.has_component(entity, Explosive):
+            self.deleted[entity] = self.world.components_for_entity(entity)
+        self.world.delete_entity(entity)
+
+    def take(self):
+        """Components of a deleted bullet by their type, empty when there are none"""
+        if not self.free:
+            return {}
+        instrumentation.count("bullets_reused")
+        return {type(component): component for component in self.free.pop()}
+
+    def process(self):
+        self.free.extend(self.deleted.values())
+        self.deleted.clear()
+
+
+def deleteEntity(world, entity, bulletPool=None):
+    if bulletPool is None:
+        world.delete_entity(entity)
+    else:
+        bulletPool.delete(entity)
+
+
+class FiringGunProcessor(esper.Processor):
+    def __init__(self, render=True, bulletPool=None):
+        super().__init__()
+        self.render = render
+        self.bulletPool = bulletPool
 
     def process(self):
         for ent, (gun, fireGun, position) in self.world.get_components(Gun, FireGun, PositionBox):
@@ -129,6 +248,8 @@ class FiringGunProcessor(esper.Processor):
                     world=self.world,
                     ownerId=ent,
                     position=self.world.component_for_entity(gun.gunEntity, PositionBox),
+                    render=self.render,
+                    reused=self.bulletPool.take() if self.bulletPool is not None else None,
                 )
                 gun.isLoaded = False
             self.world.remove_component(ent, FireGun)
@@ -150,89 +271,123 @@ class GunReloadProcessor(esper.Processor):
                     gun.isLoaded = True
 
 
-class RangeFindingProcessor(esper.Processor):
+class SpatialIndexProcessor(esper.Processor):
+    """Solids of the current tick and a SpatialIndex of where they are, shared by all processors
+    looking for solids. Solids stay the same from collisions to range finding, entities deleted in
+    between are there until the next tick and bullets are fired later. Once they move, the index is
+    built again from their positions the next time it is needed"""
+
     def __init__(self):
         super().__init__()
+        self.solids = []
+        self.radius = np.zeros(0)
+        self.index = None
 
     def process(self):
+        self.update()
+
+    def update(self):
+        self.solids = self.world.get_components(PositionBox, Solid)
+        self.radius = np.array([solid.collisionRadius for _, (_, solid) in self.solids], dtype=np.float64)
+        self.index = None
+
+    def moved(self):
+        self.index = None
+
+    def spatialIndex(self):
+        if self.index is None:
+            self.index = SpatialIndex(
+                np.array([position.x for _, (position, _) in self.solids], dtype=np.float64),
+                np.array([position.y for _, (position, _) in self.solids], dtype=np.float64),
+                self.radius,
+            )
+        return self.index
+
+
+def solidsIndex(world, spatialIndex):
+    """spatialIndex, or one of the solids in world right now when processors do not share one"""
+    if spatialIndex is None:
+        spatialIndex = SpatialIndexProcessor()
+        spatialIndex.world = world
+        spatialIndex.update()
+    return spatialIndex
+
 
+class RangeFindingProcessor(esper.Processor):
+    def __init__(self, spatialIndex=None):
+        super().__init__()
+        self.spatialIndex = spatialIndex
+
+    def process(self):
         finders = self.world.get_components(PositionBox, RangeFinder)
-        targets = self.world.get_components(PositionBox, Solid)
-        for ent, (position, finder) in finders:
-            fx = finder.maxRange * math.cos(math.radians(finder.angleOffset + position.rotation))
-            fy = finder.maxRange * math.sin(math.radians(finder.angleOffset + position.rotation))
-            endX, endY = position.x + fx, position.y + fy
-            foundTargets = []
-            for target, (targetPosition, solid) in targets:
-                if position.x == targetPosition.x and position.y == targetPosition.y:
-                    continue
-                # we have direct hit and it is in range of finder and in front of the finder
-                if segmentAndCircleIntersect(
-                    position.x,
-                    position.y,
-                    endX,
-                    endY,
-                    finder.maxRange,
-                    targetPosition.x,
-                    targetPosition.y,
-                    solid.collisionRadius,
-                ):
-                    foundTargets.append(targetPosition)
-            finder.foundTargets = foundTargets
-            if len(foundTargets) > 0:
-                finder.closestTarget = min(
-                    foundTargets,
-                    key=lambda targetPosition: square(position.x - targetPosition.x)
-                    + square(position.y - targetPosition.y),
-                )
-            else:
-                finder.closestTarget = None
+        if len(finders) == 0:
+            return
+        solids = solidsIndex(self.world, self.spatialIndex)
+        targets = solids.solids
+        instrumentation.count("range_finder_tests", len(finders) * len(targets))
+        hits, closest, _ = solids.spatialIndex().rangeFind(
+            np.array([position.x for _, (position, _) in finders], dtype=np.float64),
+            np.array([position.y for _, (position, _) in finders], dtype=np.float64),
+            np.array([finder.angleOffset + position.rotation for _, (position, finder) in finders], dtype=np.float64),
+            np.array([finder.maxRange for _, (_, finder) in finders], dtype=np.float64),
+        )
+        for i, (ent, (position, finder)) in enumerate(finders):
+            finder.foundTargets = [targets[j][1][0] for j in np.flatnonzero(hits[i])]
+            finder.closestTarget = targets[closest[i]][1][0] if closest[i] >= 0 else None
 
 
 class CollisionProcessor(esper.Processor):
-    def __init__(self):
+    def __init__(self, bulletPool=None, spatialIndex=None, mountProcessor=None):
         super().__init__()
+        self.bulletPool = bulletPool
+        self.spatialIndex = spatialIndex
+        self.mountProcessor = mountProcessor
+
+    def mountedOn(self, entity):
+        if self.mountProcessor is not None:
+            return self.mountProcessor.mountedOn(entity)
+        return [mounted for mounted, mount in self.world.get_component(Mount) if mount.parentId == entity]
 
     def deleteWithChildren(self, entity):
         for info in self.world.try_component(entity, PlayerInfo):
             # keep the scoring information when player dies
             self.world.create_entity(info)
-        for child in self.world.try_component(entity, Child):
-            self.world.delete_entity(child.childId)
-        self.world.delete_entity(entity)
+        for mounted in self.mountedOn(entity):
+            self.world.delete_entity(mounted)
+        deleteEntity(self.world, entity, self.bulletPool)
 
     def revertMoveOnCollision(self, entity):
         for move in self.world.try_component(entity, Move):
             move.distance *= -1
 
     def process(self):
-        solids = self.world.get_components(PositionBox, Solid)
-        for entityA, (positionA, solidA) in solids:
-            for entityB, (positionB, solidB) in solids:
-                if (entityA != entityB) and circlesCollide(
-                    positionA.x,
-                    positionA.y,
-                    solidA.collisionRadius,
-                    positionB.x,
-                    positionB.y,
-                    solidB.collisionRadius,
-                ):
-                    if self.world.has_component(entityA, Explosive) or self.world.has_component(entityB, Explosive):
-                        self.deleteWithChildren(entityA)
-                        # Add points for someone that caused explosion
-                        for owner in self.world.try_component(entityA, Owner):
-                            # owner of the bullet may already be dead
-                            if self.world.entity_exists(owner.ownerId):
-                                self.world.create_entity(Score(owner.ownerId, config.game_frag_score))
-                    else:
-                        self.revertMoveOnCollision(entityA)
+        index = solidsIndex(self.world, self.spatialIndex)
+        solids = index.solids
+        explosive = [self.world.has_component(entity, Explosive) for entity, _ in solids]
+        # pairs come in the order of a nested loop over solids, side effects depend on it
+        for a, b in zip(*index.spatialIndex().collidingPairs()):
+            entityA = solids[a][0]
+            if explosive[a] or explosive[b]:
+                self.deleteWithChildren(entityA)
+                # Add points for someone that caused explosion
+                for owner in self.world.try_component(entityA, Owner):
+                    # owner of the bullet may already be dead
+                    if self.world.entity_exists(owner.ownerId):
+                        self.world.create_entity(Score(owner.ownerId, config.game_frag_score))
+            else:
+                self.revertMoveOnCollision(entityA)
 
 
 class AIProcessor(esper.Processor):
-    def __init__(self):
+    def __init__(self, batchNeuralNetworks=False):
         super().__init__()
+        self.batchNeuralNetworks = batchNeuralNetworks
+        self.neuralAIBatch = NeuralAIBatch()
 
     def process(self):
+        if self.batchNeuralNetworks:
+            self.processBatched()
+            return
         for ent, (ai, position, gun) in self.world.get_components(AI, PositionBox, Gun):
             perception = Perception()
             perception.target = self.world.component_for_entity(gun.gunEntity, RangeFinder).closestTarget
@@ -240,6 +395,28 @@ class AIProcessor(esper.Processor):
             if decision is not None:
                 self.world.add_component(ent, decision)
 
+    def processBatched(self):
+        decisions = []
+        neuralAIs, inputs, neuralAIEntities = [], [], []
+        for ent, (ai, position, gun) in self.world.get_components(AI, PositionBox, Gun):
+            perception = Perception()
+            perception.target = self.world.component_for_entity(gun.gunEntity, RangeFinder).closestTarget
+            if isinstance(ai.decisionFunction, NeuralAI):
+                # input is taken right away, it draws random numbers in the same order as without batching
+                neuralAIs.append(ai.decisionFunction)
+                inputs.append(ai.decisionFunction.networkInput(perception))
+                neuralAIEntities.append(len(decisions))
+                ai.memory = None
+                decisions.append((ent, None))
+            else:
+                decision, ai.memory = ai.decide(perception, ai.memory)
+                decisions.append((ent, decision))
+        for i, decision in zip(neuralAIEntities, self.neuralAIBatch.decide(neuralAIs, inputs)):
+            decisions[i] = (decisions[i][0], decision)
+        for ent, decision in decisions:
+            if decision is not None:
+                self.world.add_component(ent, decision)
+
 
 class DecisionProcessor(esper.Processor):
     def __init__(self):
@@ -255,13 +432,14 @@ class DecisionProcessor(esper.Processor):
 
 
 class CleanupProcessor(esper.Processor):
-    def __init__(self):
+    def __init__(self, bulletPool=None):
         super().__init__()
+        self.bulletPool = bulletPool
 
     def process(self):
         for ent, ttl in self.world.get_component(TTL):
             if ttl.turns <= 0:
-                self.world.delete_entity(ent)
+                deleteEntity(self.world, ent, self.bulletPool)
             else:
                 ttl.turns -= 1
 
@@ -283,7 +461,78 @@ class TotalScoreProcessor(esper.Processor):
             playerInfo.score += self.survivorScore
 
         if not self.gameEndProcessor.isGameRunning():
-            agentsLeft = self.world.get_components(Agent, PlayerInfo)
-            for ent, (agent, totalScore) in agentsLeft:
-                if len(agentsLeft) <= 1:
-                    totalScore.score += self.lastManStandingScore
+            self.addLastManStandingScore(self.world.get_components(Agent, PlayerInfo))
+
+    def addLastManStandingScore(self, agentsLeft):
+        for ent, (agent, totalScore) in agentsLeft:
+            if len(agentsLeft) <= 1:
+                totalScore.score += self.lastManStandingScore
+
+    def survive(self, turns):
+        """Add survivor scores of turns that are not played to every tank that is left. They are added
+        one turn after another, so they round exactly like in played turns"""
+        for ent, (agent, playerInfo) in self.world.get_components(Agent, PlayerInfo):
+            if self.world.entity_exists(ent):
+                score = playerInfo.score
+                for _ in range(turns):
+                    score += self.survivorScore
+                playerInfo.score = score
+
+
+class QuiescenceDetector:
+    """Tells when only the passing turns can change the outcome of a match: no bullet is flying, no
+    score waits to be counted and either no gun can be loaded again or the last turn left the match
+    as it found it. Then every later turn plays out like the last one, because AIs decide only from
+    what they perceive, their memory and random numbers. AIs that keep a memory never count as
+    standing still"""
+
+    def __init__(self, world):
+        self.world = world
+        self.lastRandomState = None
+        self.lastState = None
+
+    def isQuiescent(self):
+        world = self.world
+        if living(world, Explosive) or living(world, Score):
+            self.lastState = None
+            return False
+        guns = [gun for _, gun in living(world, Gun)]
+        if all(gun.ammo == 0 and not gun.isLoaded and gun.reloadTimeLeft == 0 for gun in guns):
+            return True
+        # most AIs draw random numbers every turn, so the rest of the state is compared only without them
+        randomState = random.getstate()
+        if randomState != self.lastRandomState:
+            self.lastRandomState = randomState
+            self.lastState = None
+            return False
+        state = self.matchState()
+        quiescent = state is not None and state == self.lastState
+        self.lastState = state
+        return quiescent
+
+    def matchState(self):
+        """Everything the next turn starts from, None when an AI keeps a memory"""
+        world = self.world
+        if any(ai.memory is not None for _, ai in world.get_component(AI)):
+            return None
+        return (
+            [(ent, p.x, p.y, p.rotation) for ent, p in world.get_component(PositionBox)],
+            [(ent, m.rotation) for ent, m in world.get_component(Mount)],
+            [(ent, v.speed, v.angularSpeed) for ent, v in world.get_component(Velocity)],
+            [(ent, g.ammo, g.reloadTimeLeft, g.isLoaded) for ent, g in world.get_component(Gun)],
+            [(ent, d.timeout, len(d.commands)) for ent, d in world.get_component(Decision)],
+        )
+
+
+def fastForward(world):
+    """Play the rest of a quiescent match at once: count down the turns it still lasts, add survivor
+    scores for all of them and end it like its last turn would"""
+    gameEndProcessor = world.get_processor(GameEndProcessor)
+    totalScoreProcessor = world.get_processor(TotalScoreProcessor)
+    turns = gameEndProcessor.turnsToEnd()
+    gameEndProcessor.skipTurns(turns - 1)
+    gameEndProcessor.process()
+    totalScoreProcessor.survive(turns)
+    agents = world.get_components(Agent, PlayerInfo)
+    totalScoreProcessor.addLastManStandingScore([agent for agent in agents if world.entity_exists(agent[0])])
+    instrumentation.count("ticks_fast_forwarded", turns)
@@ -1,7 +1,24 @@
 import math
+from collections import namedtuple
 
 import numpy as np
 
+import slownetwork
+
+try:
+    from fastnetwork import forward_propagation
+except ImportError:
+    print("Fast network kernel not found, compile fastnetwork.pyx with Cython to have better performance")
+    from slownetwork import forward_propagation
+
+# the compiled kernel adds up a layer in its own order, so numpy's matmul may round its results differently
+COMPILED_KERNEL = forward_propagation is not slownetwork.forward_propagation
+
+ACTIVATIONS = {"relu": slownetwork.relu, "sigmoid": slownetwork.sigmoid}
+
+# One layer of a compiled plan: parameters fetched once, activation function and preallocated output buffer
+LayerPlan = namedtuple("LayerPlan", ["weights", "bias", "activation", "output"])
+
 
 class Model:
     def __init__(self, parameters, architecture, generation=0):
@@ -9,8 +26,33 @@ class Model:
         self.architecture = architecture
         self.generation = generation
 
+    @property
+    def parameters(self):
+        return self._parameters
+
+    @parameters.setter
+    def parameters(self, parameters):
+        self._parameters = parameters
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = compile_plan(self.parameters, self.architecture)
+        return self._plan
+
+    def invalidate_plan(self):
+        """Has to be called after changing parameters in place"""
+        self._plan = None
+
     def run(self, x):
-        return full_forward_propagation(x, self.parameters, self.architecture)
+        """Output of the network for input column x. The returned array is reused by the next call"""
+        return forward_propagation(self.plan, x)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_plan"] = None
+        return state
 
 
 def create_model(layers, seed=1, random_scale=0.1):
@@ -31,6 +73,7 @@ def mutate(child, mutation_rate=0.1, mutation_scale=0.05):
         randomChoices = np.random.uniform(size=layer.shape) > mutation_rate
         scale = np.exp(np.random.normal(0, mutation_scale, size=layer.shape))
         child.parameters[layer_name] = layer * (randomChoices * np.ones(layer.shape) + (1 - randomChoices) * scale)
+    child.invalidate_plan()
     return child
 
 
@@ -45,6 +88,31 @@ def make_child(mother, father, mutation_rate=0.1):
     )
 
 
+def breed(models, parent_pairs, rng, mutation_rate=0.1, mutation_scale=0.05):
+    """Make children of many parent pairs at once, with the same crossover and mutation as make_child.
+
+    models have to share one architecture, parent_pairs is a (children, 2) array of mother and
+    father indexes into models and rng is a np.random.Generator used for all random choices"""
+    parent_pairs = np.asarray(parent_pairs, dtype=np.intp).reshape(-1, 2)
+    mothers, fathers = parent_pairs[:, 0], parent_pairs[:, 1]
+    children_parameters = {}
+    for layer_name, layer in stack_parameters(models).items():
+        # every output neuron (row) comes whole from one of the parents
+        from_mother = rng.integers(2, size=(len(parent_pairs), layer.shape[1], 1)).astype(bool)
+        children_layer = np.where(from_mother, layer[mothers], layer[fathers])
+        mutated = rng.random(size=children_layer.shape) < mutation_rate
+        children_layer[mutated] *= np.exp(rng.normal(0, mutation_scale, size=np.count_nonzero(mutated)))
+        children_parameters[layer_name] = children_layer
+    return [
+        Model(
+            {layer_name: layer[k] for layer_name, layer in children_parameters.items()},
+            models[mother].architecture,
+            max(models[mother].generation, models[father].generation) + 1,
+        )
+        for k, (mother, father) in enumerate(parent_pairs.tolist())
+    ]
+
+
 def init_layers(nn_architecture, seed=1, random_scale=0.1):
     np.random.seed(seed)
     params_values = {}
@@ -58,6 +126,23 @@ def init_layers(nn_architecture, seed=1, random_scale=0.1):
     return params_values
 
 
+def compile_plan(params_values, nn_architecture):
+    """Immutable plan of a network, so running it needs no key building or activation lookup"""
+    plan = []
+    for i, layer in enumerate(nn_architecture):
+        if layer["activation"] not in ACTIVATIONS:
+            raise Exception("Non-supported activation function")
+        plan.append(
+            LayerPlan(
+                weights=np.ascontiguousarray(params_values["W" + str(i)], dtype=np.float64),
+                bias=np.ascontiguousarray(params_values["b" + str(i)], dtype=np.float64),
+                activation=ACTIVATIONS[layer["activation"]],
+                output=np.empty((layer["output_dim"], 1)),
+            )
+        )
+    return tuple(plan)
+
+
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
@@ -96,3 +181,34 @@ def full_forward_propagation(x, params_values, nn_architecture):
         current_activation = single_layer_forward_propagation(previous_activation, weights, bias, activation_function)
 
     return current_activation
+
+
+def stack_parameters(models):
+    """Stack parameters of models sharing one architecture into 3-D tensors, first axis is the model"""
+    return {
+        layer_name: np.stack([model.parameters[layer_name] for model in models]) for layer_name in models[0].parameters
+    }
+
+
+def batch_forward_propagation(x, stacked_params_values, nn_architecture):
+    """Forward propagation of many models at once. x has shape (models, input_dim, 1) and
+    stacked_params_values comes from stack_parameters. Every model gives the same result as
+    full_forward_propagation would"""
+    current_activation = x
+
+    for i, layer in enumerate(nn_architecture):
+        previous_activation = current_activation
+
+        activation_function = layer["activation"]
+        weights = stacked_params_values["W" + str(i)]
+        bias = stacked_params_values["b" + str(i)]
+        # matmul on stacks multiplies model by model, same as np.dot for each of them
+        intermediate = np.matmul(weights, previous_activation) + bias
+        if activation_function == "relu":
+            current_activation = relu(intermediate)
+        elif activation_function == "sigmoid":
+            current_activation = sigmoid(intermediate)
+        else:
+            raise Exception("Non-supported activation function")
+
+    return current_activation
@@ -1,9 +1,11 @@
 import random
 
+import numpy as np
+
 from argparser import config
 from gamecomponents import FireGun, Move, RotateGun, Rotate, Decision
 
-from network_processor import create_model
+from network_processor import COMPILED_KERNEL, create_model, stack_parameters, batch_forward_propagation
 
 
 def createModel(randomRange, seed):
@@ -26,18 +28,24 @@ ACTIVATION_THRESHOLD = 0.8
 RANDOM_RANGE = 3
 
 
-def neuralAI(seed=1, neural_net_model=None):
-    if neural_net_model is None:
-        model = createModel(RANDOM_RANGE, seed)
-    else:
-        model = neural_net_model
+class NeuralAI:
+    """Decision function driven by a neural network. It is a class and not a closure so players
+    using it can be pickled and sent to other processes"""
 
-    def decide(perception, memory):
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, perception, memory):
+        return self.decisionFromResult(self.model.run(self.networkInput(perception))), None
+
+    def networkInput(self, perception):
         if perception.target is not None:
             found = 1
         else:
             found = 0
-        result = model.run([[random.random()], [found]])
+        return [[random.random()], [found]]
+
+    def decisionFromResult(self, result):
         commands = []
         if result[0] > ACTIVATION_THRESHOLD:
             commands.append(FireGun())
@@ -56,6 +64,54 @@ def neuralAI(seed=1, neural_net_model=None):
                 commands.append(RotateGun(config.game_rotation_speed))
             else:
                 commands.append(RotateGun(-config.game_rotation_speed))
-        return Decision(commands), None
+        return Decision(commands)
+
+
+def architectureKey(architecture):
+    return tuple((layer["input_dim"], layer["output_dim"], layer["activation"]) for layer in architecture)
+
+
+class NeuralAIBatch:
+    """Runs decisions of many NeuralAI at once, with one forward pass for all networks of the same
+    architecture. Decisions are the same as calling every NeuralAI separately. When the compiled
+    network kernel is loaded networks run one by one through it, a batched pass could round
+    differently"""
+
+    def __init__(self):
+        # architecture key -> (models, their stacked parameters), restacked when models change
+        self.stacks = {}
+
+    def stackedParameters(self, key, models):
+        cached = self.stacks.get(key)
+        if cached is None or len(cached[0]) != len(models) or any(a is not b for a, b in zip(cached[0], models)):
+            cached = (models, stack_parameters(models))
+            self.stacks[key] = cached
+        return cached[1]
+
+    def decide(self, neuralAIs, inputs):
+        """Decisions of neuralAIs for network inputs made earlier with NeuralAI.networkInput"""
+        if COMPILED_KERNEL:
+            return [neuralAI.decisionFromResult(neuralAI.model.run(x)) for neuralAI, x in zip(neuralAIs, inputs)]
+        groups = {}
+        for i, neuralAI in enumerate(neuralAIs):
+            groups.setdefault(architectureKey(neuralAI.model.architecture), []).append(i)
+        decisions = [None] * len(neuralAIs)
+        for key, members in groups.items():
+            models = [neuralAIs[i].model for i in members]
+            results = batch_forward_propagation(
+                np.array([inputs[i] for i in members], dtype=np.float64),
+                self.stackedParameters(key, models),
+                models[0].architecture,
+            )
+            for i, result in zip(members, results):
+                decisions[i] = neuralAIs[i].decisionFromResult(result)
+        return decisions
+
+
+def neuralAI(seed=1, neural_net_model=None):
+    if neural_net_model is None:
+        model = createModel(RANDOM_RANGE, seed)
+    else:
+        model = neural_net_model
 
-    return decide, model
+    return NeuralAI(model), model
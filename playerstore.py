@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+import ai
+from gamecomponents import PlayerInfo
+from network_processor import Model
+from networks import neuralAI
+from replay import aiName
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    ai TEXT NOT NULL,
+    generation INTEGER,
+    total_games INTEGER NOT NULL,
+    mu REAL,
+    sigma REAL,
+    rank REAL,
+    active INTEGER NOT NULL,
+    architecture TEXT,
+    layers TEXT
+);
+CREATE INDEX IF NOT EXISTS players_rank ON players (rank);
+CREATE INDEX IF NOT EXISTS players_sigma ON players (sigma);
+CREATE INDEX IF NOT EXISTS players_generation ON players (generation);
+CREATE INDEX IF NOT EXISTS players_active_rank ON players (active, rank);
+"""
+COLUMNS = "id, name, ai, generation, total_games, mu, sigma, rank, architecture, layers"
+ORDERS = {"rank": "rank", "sigma": "sigma", "generation": "generation", "id": "id"}
+
+
+class StoredModel(Model):
+    """Model whose parameters are read from the weights file of a PlayerStore the first time they
+    are needed"""
+
+    def __init__(self, store, layers, architecture, generation):
+        super().__init__(None, architecture, generation)
+        self.store = store
+        self.layers = layers
+
+    @Model.parameters.getter
+    def parameters(self):
+        if self._parameters is None:
+            self._parameters = self.store.readWeights(self.layers)
+        return self._parameters
+
+    @property
+    def loaded(self):
+        return self._parameters is not None
+
+    def __reduce__(self):
+        # processes the model is sent to get a plain model, they have no access to the store
+        return Model, (self.parameters, self.architecture, self.generation)
+
+
+class PlayerStore:
+    """Players of tournaments kept on disk: ratings in an SQLite database at path, weights of their
+    networks appended to a file next to it which is memory mapped for reading.
+
+    Players that left the tournament stay in the store as inactive, so the best networks of all
+    time can be queried without holding them in memory."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.weightsPath = path + ".weights"
+        open(self.weightsPath, "ab").close()
+        self.weights = None
+
+    def close(self):
+        self.connection.close()
+        self.weights = None
+
+    def writeWeights(self, parameters):
+        """Append parameters to the weights file and return where every layer is in it"""
+        layers = {}
+        with open(self.weightsPath, "ab") as f:
+            offset = f.tell()
+            for layerName, layer in parameters.items():
+                layer = np.ascontiguousarray(layer, dtype="<f8")
+                layers[layerName] = [offset, list(layer.shape)]
+                f.write(layer.tobytes())
+                offset += layer.nbytes
+        return layers
+
+    def readWeights(self, layers):
+        end = max((offset + 8 * int(np.prod(shape)) for offset, shape in layers.values()), default=0)
+        if self.weights is None or len(self.weights) < end:
+            # the file only grows, mapping it again makes newly appended weights visible
+            self.weights = np.memmap(self.weightsPath, dtype=np.uint8, mode="r")
+        return {
+            layerName: np.array(self.weights[offset : offset + 8 * int(np.prod(shape))].view("<f8").reshape(shape))
+            for layerName, (offset, shape) in layers.items()
+        }
+
+    def add(self, p):
+        generation, architecture, layers = None, None, None
+        if p.neural_net is not None:
+            generation = p.neural_net.generation
+            architecture = json.dumps(p.neural_net.architecture)
+            layers = json.dumps(self.writeWeights(p.neural_net.parameters))
+        cursor = self.connection.execute(
+            "INSERT INTO players (name, ai, generation, total_games, mu, sigma, rank, active, architecture, layers)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+            (p.name, aiName(p.ai), generation, p.totalGames, p.mu, p.sigma, p.rank, architecture, layers),
+        )
+        p.storeId = cursor.lastrowid
+
+    def save(self, players, leaving=()):
+        """Store players that are not stored yet, save ratings and games played of all of them and
+        mark players as active and those leaving as inactive"""
+        for p in players:
+            if p.storeId is None:
+                self.add(p)
+        self.connection.executemany(
+            "UPDATE players SET total_games = ?, mu = ?, sigma = ?, rank = ?, active = ? WHERE id = ?",
+            [(p.totalGames, p.mu, p.sigma, p.rank, 1, p.storeId) for p in players]
+            + [(p.totalGames, p.mu, p.sigma, p.rank, 0, p.storeId) for p in leaving if p.storeId is not None],
+        )
+        self.connection.commit()
+
+    def deactivateAll(self):
+        self.connection.execute("UPDATE players SET active = 0 WHERE active = 1")
+        self.connection.commit()
+
+    def player(self, row):
+        storeId, name, aiKind, generation, totalGames, mu, sigma, rank, architecture, layers = row
+        model = None
+        if aiKind == "neural":
+            model = StoredModel(self, json.loads(layers), json.loads(architecture), generation)
+            decide, _ = neuralAI(neural_net_model=model)
+        else:
+            decide = None if aiKind == "human" else getattr(ai, aiKind)
+        p = PlayerInfo(name=name, ai=decide, neural_net=model)
+        p.storeId = storeId
+        p.totalGames, p.mu, p.sigma, p.rank = totalGames, mu, sigma, rank
+        return p
+
+    def query(self, orderBy="rank", descending=True, limit=None, active=None, generation=None, maxSigma=None):
+        """Stored players, using the indexes on rank, sigma and generation. Networks are read only
+        once their parameters are used"""
+        conditions, values = [], []
+        if active is not None:
+            conditions.append("active = ?")
+            values.append(int(active))
+        if generation is not None:
+            conditions.append("generation = ?")
+            values.append(generation)
+        if maxSigma is not None:
+            conditions.append("sigma < ?")
+            values.append(maxSigma)
+        column = ORDERS[orderBy]
+        sql = "SELECT {} FROM players".format(COLUMNS)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY {} {}, id".format(column, "DESC" if descending else "ASC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit)
+        return [self.player(row) for row in self.connection.execute(sql, values)]
+
+    def hallOfFame(self, limit=10):
+        """Best rated players of all time, active or not"""
+        return self.query(orderBy="rank", limit=limit)
+
+    def count(self, active=None):
+        if active is None:
+            return self.connection.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM players WHERE active = ?", (int(active),)).fetchone()[0]
+
+
+def openStore(path):
+    """PlayerStore at path, None when path is empty"""
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return PlayerStore(path)
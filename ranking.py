@@ -1,25 +1,314 @@
-from trueskill import rate, TrueSkill
+import math
 
+import numpy as np
+from trueskill import DELTA, TrueSkill, calc_draw_margin
 
-def processRanks(playerInfos):
-    env = TrueSkill()
-    playerScores = [p.score for p in playerInfos]
-    matchRanks = [sorted(playerScores, reverse=True).index(x) for x in playerScores]
-    ratings = {}
-
-    # for info in playerInfos:
-    #     if not info.rating:
-    #         print("Creating new rating for {}".format(info.name))
-    #         info.rating = env.create_rating()
-    ratings = [{p: env.create_rating(p.mu, p.sigma)} for p in playerInfos]
-    # ratings = [{playerInfos[0]: playerInfos[0].rating}, {playerInfos[1]: playerInfos[1].rating}]
-    ranks = rate(ratings, matchRanks)
+# One environment for all ratings, it only holds the default constants
+env = TrueSkill()
+# Draw margin between two players, every team of a free for all match is a single player
+DRAW_MARGIN = calc_draw_margin(env.draw_probability, 2, env)
+# Below this many independent matches rating them one by one is faster than the batched path
+BATCH_MIN_MATCHES = 16
+# Polynomial of trueskill's erfc approximation
+ERFC_COEFFICIENTS = (
+    1.00002368,
+    0.37409196,
+    0.09678418,
+    -0.18628806,
+    0.27886807,
+    -1.13520398,
+    1.48851587,
+    -0.82215223,
+    0.17087277,
+)
+
+
+def matchRanks(scores):
+    """Place of every score in a match, equal scores share the best of their places"""
+    order = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+    ranks = [0] * len(scores)
+    for place, i in enumerate(order):
+        previous = order[place - 1]
+        ranks[i] = ranks[previous] if place > 0 and scores[i] == scores[previous] else place
+    return ranks
+
+
+def waves(matches):
+    """Split matches into groups sharing no players. Every match comes in a later group than all
+    earlier matches it shares a player with, so rating group by group gives the same ratings as
+    rating match by match"""
+    lastWave = {}
     result = []
-    for rank_dict in ranks:
-        for playerInfo in rank_dict:
-            rank = rank_dict[playerInfo]
-            playerInfo.rank = rank.mu - 3 * rank.sigma
-            playerInfo.mu = rank.mu
-            playerInfo.sigma = rank.sigma
-            result.append(playerInfo)
-    return sorted(result, key=lambda player: -player.rank)
+    for j, match in enumerate(matches):
+        wave = max((lastWave[id(p)] + 1 for p in match if id(p) in lastWave), default=0)
+        if wave == len(result):
+            result.append([])
+        result[wave].append(j)
+        for p in match:
+            lastWave[id(p)] = wave
+    return result
+
+
+def setRating(p, mu, sigma):
+    p.rank = mu - 3 * sigma
+    p.mu = mu
+    p.sigma = sigma
+
+
+def rateMatch(players, scores):
+    """Rate a single match with the trueskill factor graph"""
+    ratings = [{p: env.create_rating(p.mu, p.sigma)} for p in players]
+    for rank_dict in env.rate(ratings, matchRanks(scores)):
+        for playerInfo, rating in rank_dict.items():
+            setRating(playerInfo, rating.mu, rating.sigma)
+
+
+def rateMatches(matches, scores):
+    """Rate all matches of a round, with the same results as rating them one by one in order"""
+    for wave in waves(matches):
+        sizes = {len(matches[j]) for j in wave}
+        if len(wave) < BATCH_MIN_MATCHES or len(sizes) > 1 or sizes == {1}:
+            for j in wave:
+                rateMatch(matches[j], scores[j])
+            continue
+        players = [matches[j] for j in wave]
+        mu = np.array([[env.mu if p.mu is None else p.mu for p in match] for match in players])
+        sigma = np.array([[env.sigma if p.sigma is None else p.sigma for p in match] for match in players])
+        ranks = np.array([matchRanks(scores[j]) for j in wave])
+        mu, sigma, failed = rateFreeForAll(mu, sigma, ranks)
+        for k, j in enumerate(wave):
+            if failed[k]:
+                # trueskill raises the same errors or handles the corner case itself
+                rateMatch(matches[j], scores[j])
+                continue
+            for p, playerMu, playerSigma in zip(matches[j], mu[k].tolist(), sigma[k].tolist()):
+                setRating(p, playerMu, playerSigma)
+
+
+def processRanks(playerInfos):
+    rateMatch(playerInfos, [p.score for p in playerInfos])
+    return sorted(playerInfos, key=lambda player: -player.rank)
+
+
+def elementwise(function, *arrays):
+    """function applied to every element with python floats, so results are the same as
+    trueskill's down to the last bit"""
+    values = zip(*(a.ravel().tolist() for a in arrays))
+    return np.array([function(*value) for value in values]).reshape(arrays[0].shape)
+
+
+def gaussian(mu, sigma):
+    """pi and tau of trueskill's Gaussian(mu, sigma)"""
+    pi = elementwise(lambda s: s**-2, sigma)
+    return np.stack([pi, pi * mu])
+
+
+def mean(g):
+    # trueskill's Gaussian gives a mean of 0 without precision
+    return np.where(g[0] != 0, g[1] / g[0], g[0])
+
+
+def updateMessage(variable, old, message):
+    return variable - old + message
+
+
+def updateValue(variable, old, value):
+    """New message and delta of variable being set to value"""
+    piDelta = np.abs(variable[0] - value[0])
+    delta = np.where(piDelta == np.inf, 0.0, np.maximum(np.abs(variable[1] - value[1]), np.sqrt(piDelta)))
+    return value + old - variable, delta
+
+
+def sumMessage(*terms):
+    """Message of a sum factor to one of its variables. terms are pairs of the other variables
+    divided by their messages to the factor and their coefficients"""
+    mu, piInverse, infinite = 0, 0, False
+    for div, coeff in terms:
+        mu = mu + coeff * mean(div)
+        # a variable without precision makes the sum infinitely uncertain
+        infinite = infinite | (div[0] == 0)
+        piInverse = piInverse + coeff**2 / div[0]
+    pi = 1.0 / np.where(infinite, np.inf, piInverse)
+    return np.stack([pi, pi * mu])
+
+
+def exp(x):
+    return elementwise(math.exp, x)
+
+
+def square(x):
+    # python's power, numpy's square may round differently
+    return elementwise(lambda value: value**2, x)
+
+
+def erfc(x):
+    """trueskill's complementary error function"""
+    z = np.abs(x)
+    t = 1.0 / (1.0 + z / 2.0)
+    polynomial = ERFC_COEFFICIENTS[-1]
+    for coefficient in reversed(ERFC_COEFFICIENTS[:-1]):
+        polynomial = coefficient + t * polynomial
+    r = t * exp(-z * z - 1.26551223 + t * polynomial)
+    return np.where(x < 0, 2.0 - r, r)
+
+
+def cdf(x):
+    return 0.5 * erfc(-(x - 0) / (1 * math.sqrt(2)))
+
+
+def pdf(x):
+    return 1 / math.sqrt(2 * math.pi) * 1 * exp(-(square((x - 0) / 1) / 2))
+
+
+def vWin(diff, drawMargin):
+    x = diff - drawMargin
+    denominator = cdf(x)
+    return np.where(denominator != 0, pdf(x) / denominator, -x)
+
+
+def truncateWin(diff, drawMargin):
+    x = diff - drawMargin
+    v = vWin(diff, drawMargin)
+    w = v * (v + x)
+    return v, w, ~((0 < w) & (w < 1))
+
+
+def vDraw(diff, drawMargin):
+    absDiff = np.abs(diff)
+    a, b = drawMargin - absDiff, -drawMargin - absDiff
+    denominator = cdf(a) - cdf(b)
+    numerator = pdf(b) - pdf(a)
+    return np.where(denominator != 0, numerator / denominator, a) * np.where(diff < 0, -1, +1)
+
+
+def truncateDraw(diff, drawMargin):
+    absDiff = np.abs(diff)
+    a, b = drawMargin - absDiff, -drawMargin - absDiff
+    denominator = cdf(a) - cdf(b)
+    v = vDraw(diff, drawMargin)
+    w = square(vDraw(absDiff, drawMargin)) + (a * pdf(a) - b * pdf(b)) / denominator
+    return v, w, denominator == 0
+
+
+def truncate(diff, drawMargin, tie):
+    """v and w of trueskill's truncate factor for every difference of performances. These are
+    trueskill's v and w functions and their statistics on numpy arrays, written with the same
+    operations in the same order"""
+    v, w, failed = np.empty_like(diff), np.empty_like(diff), np.empty(diff.shape, dtype=bool)
+    for isTie, function in ((False, truncateWin), (True, truncateDraw)):
+        selected = tie == isTie
+        if selected.any():
+            v[selected], w[selected], failed[selected] = function(diff[selected], drawMargin[selected])
+    # anything trueskill could fail on is rated by trueskill itself
+    return v, w, failed | ~np.isfinite(v) | ~np.isfinite(w)
+
+
+def rateFreeForAll(mu, sigma, ranks, minDelta=DELTA):
+    """trueskill's rate for many free for all matches at once, one match per row.
+
+    Runs the same message passing schedule on the factor graph of single player teams with the
+    same floating point operations, so the new ratings are exactly the ones trueskill gives.
+    Returns new mu and sigma and which matches hit a corner case this does not handle"""
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        return _rateFreeForAll(mu, sigma, ranks, minDelta)
+
+
+def _rateFreeForAll(mu, sigma, ranks, minDelta):
+    matches, size = mu.shape
+    rows = np.arange(matches)[:, None]
+    # players of every match ordered by rank, like trueskill does before building the graph
+    order = np.argsort(ranks, axis=1, kind="stable")
+    sortedRanks = ranks[rows, order]
+    tie = sortedRanks[:, :-1] == sortedRanks[:, 1:]
+    failed = np.zeros(matches, dtype=bool)
+
+    # prior and performance layers
+    rating = gaussian(mu[rows, order], sigma[rows, order])
+    priorSigma = elementwise(lambda pi: math.sqrt(math.sqrt(1 / pi) ** 2 + env.tau**2), rating[0])
+    rating = gaussian(mean(rating), priorSigma)
+    a = 1.0 / (1.0 + env.beta**2 * rating[0])
+    performance = np.stack([a * rating[0], a * rating[1]])
+    performanceLikelihood = performance
+    # team performance is the sum of a single performance
+    team = sumMessage((performance, 1))
+    teamSum = team.copy()
+    # messages of team performances to the difference factors on their left and right
+    teamLeft = np.zeros_like(team)
+    teamRight = np.zeros_like(team)
+    difference = np.zeros((2, matches, size - 1))
+    differenceSum = np.zeros_like(difference)
+    differenceTruncate = np.zeros_like(difference)
+
+    def down(k):
+        message = sumMessage((team[:, :, k] - teamRight[:, :, k], 1), (team[:, :, k + 1] - teamLeft[:, :, k + 1], -1))
+        difference[:, :, k] = updateMessage(difference[:, :, k], differenceSum[:, :, k], message)
+        differenceSum[:, :, k] = message
+
+    def up(k):
+        div = difference[:, :, k] - differenceTruncate[:, :, k]
+        sqrtPi = np.sqrt(div[0])
+        v, w, truncateFailed = truncate(div[1] / sqrtPi, DRAW_MARGIN * sqrtPi, tie[:, k])
+        # trueskill fails on the square root of a negative precision
+        truncateFailed |= div[0] < 0
+        denominator = 1.0 - w
+        value = np.stack([div[0] / denominator, (div[1] + sqrtPi * v) / denominator])
+        differenceTruncate[:, :, k], delta = updateValue(difference[:, :, k], differenceTruncate[:, :, k], value)
+        difference[:, :, k] = value
+        return delta, truncateFailed
+
+    def upRight(k):
+        message = sumMessage(
+            (team[:, :, k] - teamRight[:, :, k], 1.0), (difference[:, :, k] - differenceSum[:, :, k], -1.0)
+        )
+        team[:, :, k + 1] = updateMessage(team[:, :, k + 1], teamLeft[:, :, k + 1], message)
+        teamLeft[:, :, k + 1] = message
+
+    def upLeft(k):
+        message = sumMessage(
+            (difference[:, :, k] - differenceSum[:, :, k], 1.0), (team[:, :, k + 1] - teamLeft[:, :, k + 1], 1.0)
+        )
+        team[:, :, k] = updateMessage(team[:, :, k], teamRight[:, :, k], message)
+        teamRight[:, :, k] = message
+
+    if size == 2:
+        steps = [(0, None)]
+    else:
+        steps = [(k, upRight) for k in range(size - 2)] + [(k, upLeft) for k in range(size - 2, 0, -1)]
+    running = np.ones(matches, dtype=bool)
+    for _ in range(10):
+        messages = (team, teamLeft, teamRight, difference, differenceSum, differenceTruncate)
+        state = [array.copy() for array in messages]
+        delta = np.zeros(matches)
+        stepsFailed = np.zeros(matches, dtype=bool)
+        for k, after in steps:
+            down(k)
+            stepDelta, truncateFailed = up(k)
+            delta = np.maximum(delta, stepDelta)
+            stepsFailed |= truncateFailed
+            if after is not None:
+                after(k)
+        # matches that converged in an earlier iteration keep their state
+        for array, previous in zip(messages, state):
+            array[:, ~running] = previous[:, ~running]
+        failed |= stepsFailed & running
+        running &= ~(delta <= minDelta)
+        if not running.any():
+            break
+    upLeft(0)
+    upRight(size - 2)
+
+    # back up through team performances and performances to the ratings
+    performance = performance + sumMessage((team - teamSum, 1.0))
+    message = performance - performanceLikelihood
+    a = 1.0 / (1.0 + env.beta**2 * message[0])
+    rating = rating + np.stack([a * message[0], a * message[1]])
+
+    # trueskill returns Rating(mu, sigma) of the rating variables, which are converted to and from
+    # pi and tau once more
+    newSigma = elementwise(lambda pi: math.sqrt(1 / pi), rating[0])
+    rating = gaussian(mean(rating), newSigma)
+    newMu = np.empty_like(mu)
+    newSigma = np.empty_like(sigma)
+    newMu[rows, order] = mean(rating)
+    newSigma[rows, order] = elementwise(lambda pi: math.sqrt(1 / pi), rating[0])
+    return newMu, newSigma, failed | ~np.isfinite(newMu).all(axis=1) | ~np.isfinite(newSigma).all(axis=1)
@@ -0,0 +1,297 @@
+import json
+import os
+import zlib
+
+import esper
+import numpy as np
+
+import ai
+from gamecomponents import AI, Decision, FireGun, Gun, Move, PlayerInfo, PositionBox, Rotate, RotateGun, Velocity
+from network_processor import Model
+from networks import NeuralAI, neuralAI
+
+MAGIC = b"TNKREPLY"
+VERSION = 1
+# magic, version and length of the JSON header
+PREAMBLE_SIZE = 16
+
+# Flags of a decision record
+HAS_DECISION = 1
+FIRE = 2
+MOVE = 4
+ROTATE = 8
+ROTATE_GUN = 16
+# record of a human player: velocities of body (move, rotate) and gun (rotateGun) and a FireGun waiting
+HUMAN = 32
+
+DECISION_DTYPE = np.dtype(
+    [
+        ("tick", "<u4"),
+        ("player", "<u2"),
+        ("flags", "u1"),
+        ("timeout", "<i2"),
+        ("move", "<f8"),
+        ("rotate", "<f8"),
+        ("rotateGun", "<f8"),
+    ]
+)
+CHECKSUM_DTYPE = np.dtype([("tick", "<u4"), ("crc", "<u4")])
+
+
+class ReplayMismatch(Exception):
+    """Replayed match went differently than the recorded one"""
+
+
+def aiName(decisionFunction):
+    if decisionFunction is None:
+        return "human"
+    if isinstance(decisionFunction, NeuralAI):
+        return "neural"
+    return decisionFunction.__name__
+
+
+def stateChecksum(world, players):
+    positions = [(p.x, p.y, p.rotation) for _, p in world.get_component(PositionBox)]
+    state = np.array(positions, dtype=np.float64).tobytes() + np.array([p.score for p in players]).tobytes()
+    return zlib.crc32(state)
+
+
+class MatchProcessor(esper.Processor):
+    """Base of processors running right after AIProcessor that need to know which tank belongs to
+    which player of the match"""
+
+    def __init__(self, players, checksumInterval):
+        super().__init__()
+        self.players = players
+        self.checksumInterval = checksumInterval
+        self.tick = 0
+        self.tanks = None
+
+    def findTanks(self):
+        playerIndexes = {id(p): i for i, p in enumerate(self.players)}
+        tanks = [None] * len(self.players)
+        for body, (info, gun) in self.world.get_components(PlayerInfo, Gun):
+            tanks[playerIndexes[id(info)]] = (body, gun.gunEntity)
+        return tanks
+
+    def process(self):
+        if self.tanks is None:
+            self.tanks = self.findTanks()
+        self.tick += 1
+        self.processTick()
+        if self.tick % self.checksumInterval == 0:
+            self.processChecksum(stateChecksum(self.world, self.players))
+
+
+class RecorderProcessor(MatchProcessor):
+    """Records what every tank decided to do in each tick of a match"""
+
+    def __init__(self, players, seed, checksumInterval):
+        super().__init__(players, checksumInterval)
+        self.seed = seed
+        self.spawns = None
+        self.decisions = []
+        self.checksums = []
+
+    def processTick(self):
+        if self.spawns is None:
+            self.spawns = [self.spawn(body, gun) for body, gun in self.tanks]
+        for player, (body, gun) in enumerate(self.tanks):
+            if not self.world.entity_exists(body):
+                continue
+            if self.world.has_component(body, AI):
+                for decision in self.world.try_component(body, Decision):
+                    self.decisions.append(self.decisionRecord(player, decision))
+            else:
+                bodyVelocity = self.world.component_for_entity(body, Velocity)
+                gunVelocity = self.world.component_for_entity(gun, Velocity)
+                flags = HUMAN | (FIRE if self.world.has_component(body, FireGun) else 0)
+                self.decisions.append(
+                    (
+                        self.tick,
+                        player,
+                        flags,
+                        0,
+                        bodyVelocity.speed,
+                        bodyVelocity.angularSpeed,
+                        gunVelocity.angularSpeed,
+                    )
+                )
+
+    def spawn(self, body, gun):
+        """Position and rotations of a tank as it was created, rotations are still waiting in Rotate"""
+        position = self.world.component_for_entity(body, PositionBox)
+        rotations = [sum(rotate.angle for rotate in self.world.try_component(entity, Rotate)) for entity in (body, gun)]
+        return [position.x, position.y] + rotations
+
+    def decisionRecord(self, player, decision):
+        flags, move, rotate, rotateGun = HAS_DECISION, 0.0, 0.0, 0.0
+        # a later command of the same type replaces the earlier one, like in DecisionProcessor
+        for command in decision.commands:
+            if isinstance(command, FireGun):
+                flags |= FIRE
+            elif isinstance(command, Move):
+                flags, move = flags | MOVE, command.distance
+            elif isinstance(command, Rotate):
+                flags, rotate = flags | ROTATE, command.angle
+            elif isinstance(command, RotateGun):
+                flags, rotateGun = flags | ROTATE_GUN, command.angle
+            else:
+                raise ValueError("Command {} can not be recorded".format(type(command).__name__))
+        return (self.tick, player, flags, decision.timeout, move, rotate, rotateGun)
+
+    def processChecksum(self, crc):
+        self.checksums.append((self.tick, crc))
+
+    def save(self, path, scores, gameConfig):
+        """Write the recorded match to path"""
+        blobs = []
+        offset = 0
+        players = []
+        for p, spawn in zip(self.players, self.spawns):
+            player = {"name": p.name, "ai": aiName(p.ai), "spawn": spawn}
+            if isinstance(p.ai, NeuralAI):
+                model = p.ai.model
+                player["generation"] = model.generation
+                player["architecture"] = model.architecture
+                player["weights"] = {}
+                for layerName, layer in model.parameters.items():
+                    layer = np.ascontiguousarray(layer, dtype="<f8")
+                    player["weights"][layerName] = {"offset": offset, "shape": list(layer.shape)}
+                    blobs.append(layer.tobytes())
+                    offset += layer.nbytes
+            players.append(player)
+        decisions = np.array(self.decisions, dtype=DECISION_DTYPE)
+        checksums = np.array(self.checksums, dtype=CHECKSUM_DTYPE)
+        header = {
+            "seed": self.seed,
+            "config": gameConfig,
+            "scores": scores,
+            "ticks": self.tick,
+            "checksum_interval": self.checksumInterval,
+            "players": players,
+            "decisions": {"offset": offset, "count": len(decisions)},
+            "checksums": {"offset": offset + decisions.nbytes, "count": len(checksums)},
+        }
+        headerBytes = json.dumps(header).encode("utf-8")
+        # data after the header starts 8 byte aligned
+        headerBytes += b" " * (-(PREAMBLE_SIZE + len(headerBytes)) % 8)
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array([VERSION, len(headerBytes)], dtype="<u4").tobytes())
+            f.write(headerBytes)
+            for blob in blobs:
+                f.write(blob)
+            f.write(decisions.tobytes())
+            f.write(checksums.tobytes())
+
+
+class Replay:
+    """A recorded match. Decisions, checksums and weights are memory mapped from the file"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            preamble = f.read(PREAMBLE_SIZE)
+            if preamble[:8] != MAGIC:
+                raise ValueError("{} is not a replay file".format(path))
+            version, headerLength = np.frombuffer(preamble[8:], dtype="<u4")
+            if version != VERSION:
+                raise ValueError("Replay version {} is not supported".format(version))
+            self.header = json.loads(f.read(int(headerLength)).decode("utf-8"))
+        dataStart = PREAMBLE_SIZE + int(headerLength)
+        if os.path.getsize(path) > dataStart:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r", offset=dataStart)
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        self.decisions = self.records(self.header["decisions"], DECISION_DTYPE)
+        self.checksums = self.records(self.header["checksums"], CHECKSUM_DTYPE)
+        self.seed = self.header["seed"]
+        self.config = self.header["config"]
+        self.scores = self.header["scores"]
+
+    def records(self, location, dtype):
+        start = location["offset"]
+        return self.data[start : start + location["count"] * dtype.itemsize].view(dtype)
+
+    def weights(self, player):
+        return {
+            layerName: self.data[layer["offset"] : layer["offset"] + 8 * int(np.prod(layer["shape"]))]
+            .view("<f8")
+            .reshape(layer["shape"])
+            for layerName, layer in player["weights"].items()
+        }
+
+    def players(self, useNetworks=False):
+        """Players of the match. They repeat recorded decisions, or with useNetworks their decisions are
+        made again by the recorded networks and AIs. Human players get no AI, their recorded input is
+        applied by ReplayInputProcessor"""
+        players = []
+        for index, player in enumerate(self.header["players"]):
+            if player["ai"] == "human":
+                decide = None
+            elif not useNetworks:
+                decide = ReplayAI(self.decisions[self.decisions["player"] == index])
+            elif player["ai"] == "neural":
+                model = Model(
+                    {name: np.array(layer) for name, layer in self.weights(player).items()},
+                    player["architecture"],
+                    player["generation"],
+                )
+                decide, _ = neuralAI(neural_net_model=model)
+            else:
+                decide = getattr(ai, player["ai"])
+            players.append(PlayerInfo(name=player["name"], ai=decide))
+        return players
+
+
+class ReplayAI:
+    """Decision function repeating recorded decisions of one player, one tick per call"""
+
+    def __init__(self, records):
+        self.records = {int(record["tick"]): record for record in records}
+        self.tick = 0
+
+    def __call__(self, perception, memory):
+        self.tick += 1
+        record = self.records.get(self.tick)
+        if record is None:
+            return None, None
+        flags = int(record["flags"])
+        commands = []
+        if flags & FIRE:
+            commands.append(FireGun())
+        if flags & MOVE:
+            commands.append(Move(float(record["move"])))
+        if flags & ROTATE:
+            commands.append(Rotate(float(record["rotate"])))
+        if flags & ROTATE_GUN:
+            commands.append(RotateGun(float(record["rotateGun"])))
+        return Decision(commands, timeout=int(record["timeout"])), None
+
+
+class ReplayInputProcessor(MatchProcessor):
+    """Applies recorded input of human players and checks state checksums of a replayed match"""
+
+    def __init__(self, replay, players):
+        super().__init__(players, replay.header["checksum_interval"])
+        human = replay.decisions[(replay.decisions["flags"] & HUMAN) != 0]
+        self.humanInput = {(int(r["tick"]), int(r["player"])): r for r in human}
+        self.checksums = {int(r["tick"]): int(r["crc"]) for r in replay.checksums}
+
+    def processTick(self):
+        for player, (body, gun) in enumerate(self.tanks):
+            record = self.humanInput.get((self.tick, player))
+            if record is None:
+                continue
+            bodyVelocity = self.world.component_for_entity(body, Velocity)
+            bodyVelocity.speed, bodyVelocity.angularSpeed = float(record["move"]), float(record["rotate"])
+            self.world.component_for_entity(gun, Velocity).angularSpeed = float(record["rotateGun"])
+            if record["flags"] & FIRE and not self.world.has_component(body, FireGun):
+                self.world.add_component(body, FireGun())
+            elif not record["flags"] & FIRE and self.world.has_component(body, FireGun):
+                self.world.remove_component(body, FireGun)
+
+    def processChecksum(self, crc):
+        expected = self.checksums.get(self.tick)
+        if expected is not None and expected != crc:
+            raise ReplayMismatch("State differs from the recording at tick {}".format(self.tick))
@@ -0,0 +1,25 @@
+import numpy as np
+
+# Activations write into a preallocated buffer, out may be the same array as x
+
+
+def relu(x, out):
+    return np.maximum(0, x, out=out)
+
+
+def sigmoid(x, out):
+    np.negative(x, out=out)
+    np.exp(out, out=out)
+    np.add(1, out, out=out)
+    return np.divide(1, out, out=out)
+
+
+def forward_propagation(plan, x):
+    """Run a compiled layer plan (see network_processor.compile_plan) on input column x. The
+    returned array is the output buffer of the last layer and is overwritten by the next call"""
+    current_activation = x
+    for weights, bias, activation, output in plan:
+        np.dot(weights, current_activation, out=output)
+        np.add(output, bias, out=output)
+        current_activation = activation(output, output)
+    return current_activation
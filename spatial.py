@@ -0,0 +1,152 @@
+import numpy as np
+
+import instrumentation
+from vectormath import circlesCollideMatrix, circlesCollidePairs, rangeFind
+
+# Below this many circles checking every pair at once is faster than bucketing them into a grid
+ALL_PAIRS_LIMIT = 64
+
+
+def expandRanges(starts, ends):
+    """Concatenation of np.arange(start, end) for every start, end pair"""
+    counts = ends - starts
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.intp), counts
+    firsts = np.cumsum(counts) - counts
+    return np.arange(total) + np.repeat(starts - firsts, counts), counts
+
+
+class UniformGrid:
+    """Points bucketed into square cells of the same size.
+
+    Points that are no further than cellSize apart always end up in the same or in adjacent
+    cells."""
+
+    def __init__(self, x, y, cellSize):
+        self.cellSize = cellSize
+        cellX = np.floor(x / cellSize).astype(np.int64)
+        cellY = np.floor(y / cellSize).astype(np.int64)
+        # shifted by one so that neighbour cells of every point have non negative coordinates too
+        self.shiftX = 1 - int(cellX.min()) if len(x) > 0 else 0
+        self.shiftY = 1 - int(cellY.min()) if len(y) > 0 else 0
+        self.cellX = cellX + self.shiftX
+        self.cellY = cellY + self.shiftY
+        self.rowLength = int(self.cellY.max()) + 2 if len(y) > 0 else 1
+        keys = self.cellKeys(self.cellX, self.cellY)
+        self.order = np.argsort(keys, kind="stable")
+        self.sortedKeys = keys[self.order]
+
+    def cellKeys(self, cellX, cellY):
+        return cellX * self.rowLength + cellY
+
+    def neighbourPairs(self):
+        """Pairs (i, j), i != j, of points in the same or adjacent cells.
+
+        Returns two index arrays with every ordered pair in them exactly once, in no particular
+        order."""
+        rows, cols = [], []
+        points = np.arange(len(self.order))
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = self.cellKeys(self.cellX + dx, self.cellY + dy)
+                starts = np.searchsorted(self.sortedKeys, keys, side="left")
+                ends = np.searchsorted(self.sortedKeys, keys, side="right")
+                positions, counts = expandRanges(starts, ends)
+                rows.append(np.repeat(points, counts))
+                cols.append(self.order[positions])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        different = rows != cols
+        return rows[different], cols[different]
+
+    def cellRange(self, low, high, shift, last):
+        """First and end cell coordinates of cells from low to high and one more on each side, so that
+        rounding never leaves out a point right at the border. Limited to cells 0 to last"""
+        first = np.clip(np.floor(low / self.cellSize) + shift - 1, 0, last + 1)
+        end = np.clip(np.floor(high / self.cellSize) + shift + 1, -1, last) + 1
+        return int(first), int(end)
+
+    def pointsNear(self, x, y, radius):
+        """Points in all cells that have a part within radius of x, y, in no particular order"""
+        if len(self.order) == 0:
+            return self.order
+        firstX, endX = self.cellRange(x - radius, x + radius, self.shiftX, int(self.cellX.max()) + 1)
+        firstY, endY = self.cellRange(y - radius, y + radius, self.shiftY, self.rowLength - 1)
+        if firstX >= endX or firstY >= endY:
+            return self.order[:0]
+        # cells of one column have consecutive keys
+        columns = np.arange(firstX, endX) * self.rowLength
+        starts = np.searchsorted(self.sortedKeys, columns + firstY, side="left")
+        ends = np.searchsorted(self.sortedKeys, columns + endY, side="left")
+        positions, _ = expandRanges(starts, ends)
+        return self.order[positions]
+
+
+def collisionGrid(x, y, r):
+    # colliding circles are no further apart than the two biggest radiuses together, a bit of
+    # margin keeps pairs right at the border safe from rounding of the cell coordinates
+    return UniformGrid(x, y, 2 * float(r.max()) + 1)
+
+
+def collidingPairs(x, y, r, grid=None):
+    """Pairs (i, j) of circles for which slowmath.circlesCollide is true. grid is the collisionGrid
+    of the circles when it was already built.
+
+    Pairs are sorted by i and then by j, the same order as checking every pair in a nested loop."""
+    if len(x) <= ALL_PAIRS_LIMIT:
+        instrumentation.count("collision_checks", len(x) * (len(x) - 1))
+        return np.nonzero(circlesCollideMatrix(x, y, r))
+    if grid is None:
+        grid = collisionGrid(x, y, r)
+    rows, cols = grid.neighbourPairs()
+    instrumentation.count("collision_checks", len(rows))
+    colliding = circlesCollidePairs(x, y, r, rows, cols)
+    rows, cols = rows[colliding], cols[colliding]
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order]
+
+
+class SpatialIndex:
+    """Circles at x, y with radiuses r, for everything that looks for them by position: collisions,
+    rays and queries like what is near a point. With many circles they are bucketed into a grid,
+    built in bulk the first time a query needs it"""
+
+    def __init__(self, x, y, r):
+        self.x = x
+        self.y = y
+        self.r = r
+        self.grid = None
+
+    def collisionGrid(self):
+        if self.grid is None:
+            self.grid = collisionGrid(self.x, self.y, self.r)
+        return self.grid
+
+    def collidingPairs(self):
+        if len(self.x) <= ALL_PAIRS_LIMIT:
+            return collidingPairs(self.x, self.y, self.r)
+        return collidingPairs(self.x, self.y, self.r, self.collisionGrid())
+
+    def rangeFind(self, x, y, rotation, maxRange):
+        """vectormath.rangeFind of rays against every circle. Rays reach across most of the arena, so
+        they are not narrowed down by the grid"""
+        return rangeFind(x, y, rotation, maxRange, self.x, self.y, self.r)
+
+    def within(self, x, y, radius):
+        """Circles with their center no further than radius from x, y, in increasing order"""
+        if len(self.x) <= ALL_PAIRS_LIMIT:
+            candidates = np.arange(len(self.x))
+        else:
+            candidates = np.sort(self.collisionGrid().pointsNear(x, y, radius))
+        dx, dy = self.x[candidates] - x, self.y[candidates] - y
+        return candidates[dx * dx + dy * dy <= radius * radius]
+
+    def nearest(self, x, y, maxDistance):
+        """Circle with its center closest to x, y but not right at it, -1 when there is none within
+        maxDistance"""
+        candidates = self.within(x, y, maxDistance)
+        dx, dy = self.x[candidates] - x, self.y[candidates] - y
+        distances = np.where((dx != 0) | (dy != 0), dx * dx + dy * dy, np.inf)
+        if len(candidates) == 0 or np.isinf(distances.min()):
+            return -1
+        return int(candidates[np.argmin(distances)])
@@ -5,7 +5,7 @@
 # - [ ] v0.x
 #   - [ ] Multihostprocessing
 # - [ ] v0.6
-#   - [ ] Multiprocessing
+#   - [X] Multiprocessing
 # - [ ] v0.5
 #   - [X] Genetic mutations for NN Ai
 #   - [X] Simple NeuralNet AI
@@ -25,7 +25,7 @@
 #   - [X] Scoring
 #   - [X] Game End conditions
 # Refactors & Ideas:
-# - [ ] Separate Gun and change child to Mount (mount just moves around with parent)
+# - [X] Separate Gun and change child to Mount (mount just moves around with parent)
 # - [ ] Change all Move, Rotate etc to Commands
 # Quality of life and bugs:
 # - [ ] Player in different color
@@ -33,21 +33,31 @@
 # - [ ] Generating stating positions without overlap
 
 
+import copy
+import json
+import math
+import os
+import multiprocessing
 import random
+import sys
+
 import numpy as np
-import math
 
 import esper
-import pygame
 
+import checkpoint
 import create
+import instrumentation
+from arrayengine import ArrayEngine
+from lockstep import Lockstep
 from PlayerRepository import PlayerRepository
-from argparser import config
+from argparser import config, configOverride, printConfig
 from gamecomponents import (
     InputEvents,
 )
-from gui import InputEventProcessor, RenderProcessor, InputEventCollector
+from instrumentation import InstrumentedWorld
 from logic import (
+    BulletPoolProcessor,
     GameEndProcessor,
     AIProcessor,
     DecisionProcessor,
@@ -55,14 +65,20 @@ from logic import (
     TotalScoreProcessor,
     MovementProcessor,
     RotationProcessor,
+    MountProcessor,
     RangeFindingProcessor,
+    SpatialIndexProcessor,
     VelocityProcessor,
     FiringGunProcessor,
     CleanupProcessor,
     GunReloadProcessor,
+    QuiescenceDetector,
+    fastForward,
 )
-from network_processor import make_child
-from ranking import processRanks
+from network_processor import breed
+from playerstore import openStore
+from ranking import rateMatches
+from replay import RecorderProcessor, Replay, ReplayInputProcessor, ReplayMismatch
 
 totalRemoved = []
 
@@ -84,19 +100,29 @@ def printScoresAndRankings(round, players, removed, quantile):
             print("{} Died: {}".format("-" * 10, ",".join(removedNames).rjust(80, "-")))
 
 
-def initWorld():
-    world = esper.World()
+def initWorld(worldType=esper.World):
+    world = worldType()
     events = world.create_entity()
     world.add_component(events, InputEvents())
     return world, events
 
 
-def prepareProcessors(world, events, drawUI=True):
+def prepareProcessors(world, events, drawUI=True, matchProcessor=None, viewer=None, inputQueue=None):
+    """Add all processors of a match. matchProcessor is a recorder or a replay processor, it runs
+    right after the AIs decided. With a viewer the match is drawn on its thread instead of after
+    every tick. Human players also get key events from inputQueue"""
     gameEndProcessor = GameEndProcessor(turnsLeft=config.game_max_match_turns, ammoTimeout=config.game_bullet_ttl)
-    world.add_processor(AIProcessor())
+    bulletPool = BulletPoolProcessor()
+    spatialIndex = SpatialIndexProcessor()
+    mountProcessor = MountProcessor()
+    world.add_processor(bulletPool)
+    world.add_processor(AIProcessor(batchNeuralNetworks=config.ai_batch_networks))
+    if matchProcessor is not None:
+        world.add_processor(matchProcessor)
     world.add_processor(DecisionProcessor())
     world.add_processor(gameEndProcessor)
-    world.add_processor(CollisionProcessor())
+    world.add_processor(spatialIndex)
+    world.add_processor(CollisionProcessor(bulletPool, spatialIndex, mountProcessor))
     world.add_processor(
         TotalScoreProcessor(
             gameEndProcessor=gameEndProcessor,
@@ -104,33 +130,205 @@ def prepareProcessors(world, events, drawUI=True):
             lastManStandingScore=config.game_last_man_score,
         )
     )
-    world.add_processor(MovementProcessor())
+    world.add_processor(MovementProcessor(spatialIndex))
     world.add_processor(RotationProcessor())
-    world.add_processor(RangeFindingProcessor())
+    world.add_processor(mountProcessor)
+    world.add_processor(RangeFindingProcessor(spatialIndex))
     world.add_processor(VelocityProcessor())
-    world.add_processor(FiringGunProcessor())
-    world.add_processor(CleanupProcessor())
+    world.add_processor(FiringGunProcessor(render=drawUI, bulletPool=bulletPool))
+    world.add_processor(CleanupProcessor(bulletPool))
     world.add_processor(GunReloadProcessor())
-    if drawUI:
+    if viewer is not None:
+        from gui import SnapshotProcessor
+
+        world.add_processor(SnapshotProcessor(viewer))
+    elif drawUI:
+        # rendering pulls in pygame, so it is loaded only once a match is really drawn
+        from gui import InputEventProcessor, RenderProcessor, InputEventCollector
+
         world.add_processor(RenderProcessor())
-        world.add_processor(InputEventCollector(events))
+        world.add_processor(InputEventCollector(events, inputQueue))
+        world.add_processor(InputEventProcessor(gameEndProcessor))
+    elif inputQueue is not None:
+        from gui import InputEventProcessor, QueuedInputCollector
+
+        world.add_processor(QueuedInputCollector(events, inputQueue))
         world.add_processor(InputEventProcessor(gameEndProcessor))
     return gameEndProcessor
 
 
-def simulateGame(players, draw):
-    world, events = initWorld()
-    create.tanks(world, players)
-    gameEndProcessor = prepareProcessors(world, events, drawUI=draw)
+def simulateGame(players, draw, seed, matchProcessor=None):
+    """Play a single match and return the scores players got in it.
+
+    The match uses its own random seed so it gives the same result no matter in which process it
+    runs. Random state of the calling process is restored afterwards. Matches are recorded into
+    config.record_dir when it is set."""
+    state = random.getstate()
+    random.seed(seed)
+    recorder = None
+    if matchProcessor is None and config.record_dir:
+        recorder = RecorderProcessor(players, seed, config.record_checksum_interval)
+        matchProcessor = recorder
+    inputQueue = humanInput(players)
+    try:
+        if config.engine in ("array", "lockstep") and not draw and matchProcessor is None and inputQueue is None:
+            ArrayEngine(players).run()
+        else:
+            world, events = initWorld(InstrumentedWorld if instrumentation.stats is not None else esper.World)
+            viewer = matchViewer(players) if draw else None
+            create.tanks(world, players, render=draw)
+            gameEndProcessor = prepareProcessors(
+                world, events, drawUI=draw, matchProcessor=matchProcessor, viewer=viewer, inputQueue=inputQueue
+            )
+            # drawn, recorded and replayed matches need every turn, humans may press keys at any time
+            canFastForward = config.fast_forward and not draw and matchProcessor is None and inputQueue is None
+            quiescence = QuiescenceDetector(world)
+
+            while gameEndProcessor.isGameRunning():
+                # A single call to world.process() will update all Processors:
+                world.process()
+                if canFastForward and gameEndProcessor.isGameRunning() and quiescence.isQuiescent():
+                    fastForward(world)
+    finally:
+        random.setstate(state)
+    scores = [p.score for p in players]
+    for p in players:
+        p.score = 0
+    if recorder is not None:
+        recorder.save(os.path.join(config.record_dir, "match-{}.replay".format(seed)), scores, gameConfig())
+    return scores
+
+
+def matchViewer(players):
+    """Viewer drawing a match on its own thread, None when the match has to be drawn after every tick
+    because a human plays in it"""
+    if not config.gui_render_thread or any(p.ai is None for p in players):
+        return None
+    from gui import startViewer
+
+    return startViewer()
+
+
+# InputQueue getting key events from config.input_port, it is listened to from the first match on
+portInput = None
+
+
+def humanInput(players):
+    """InputQueue of the human players of a match, None when they only have the keyboard or there are
+    none. A script is played from its start in every match"""
+    global portInput
+    if all(p.ai is not None for p in players):
+        return None
+    from gui import InputQueue, listenForInput, readInputScript
+
+    if config.input_script:
+        return readInputScript(config.input_script)
+    if config.input_port is not None:
+        if portInput is None:
+            portInput = InputQueue()
+            listenForInput(portInput, config.input_port)
+        return portInput
+    return None
+
+
+def gameConfig():
+    return {name: value for name, value in vars(config).items() if name.startswith("game_")}
+
 
-    while gameEndProcessor.isGameRunning():
-        # A single call to world.process() will update all Processors:
-        world.process()
-    # rankedPlayers = processRanks([p[1] for p in world.get_component(PlayerInfo)])
-    rankedPlayers = processRanks(players)
-    for p in rankedPlayers:
-        p.totalGames += 1
-    return rankedPlayers
+def playReplay(path, draw, useNetworks=False):
+    """Play a recorded match again with the game config it was recorded with and return the scores.
+    Raises ReplayMismatch when the match goes differently than recorded"""
+    replay = Replay(path)
+    players = replay.players(useNetworks)
+    with configOverride(**replay.config):
+        scores = simulateGame(players, draw, replay.seed, ReplayInputProcessor(replay, players))
+    if scores != replay.scores:
+        raise ReplayMismatch("Replayed scores {} differ from recorded {}".format(scores, replay.scores))
+    return scores
+
+
+def simulateMatch(players, draw, seed):
+    """simulateGame that also returns stats collected in the match when instrumentation is on"""
+    if not config.instrument:
+        return simulateGame(players, draw, seed), None
+    with instrumentation.collecting() as stats:
+        scores = simulateGame(players, draw, seed)
+    return scores, stats
+
+
+def rankRound(matches, roundScores):
+    """Rate all matches of a round together and count the games players played"""
+    rateMatches(matches, roundScores)
+    for match in matches:
+        for p in match:
+            p.totalGames += 1
+            p.score = 0
+
+
+def usesLockstep():
+    # recorded matches need the esper processors
+    return config.engine == "lockstep" and not config.record_dir
+
+
+def simulateLockstep(matches, seeds):
+    """Play headless matches together in one Lockstep and return the scores of every match"""
+    # with matching_spread a player can be in more than one match of a round, so every match adds
+    # up scores on copies of its players
+    matches = [[copy.copy(p) for p in players] for players in matches]
+    Lockstep(matches, seeds).run()
+    return [[p.score for p in players] for players in matches]
+
+
+def simulateMatches(matches, seeds):
+    """simulateMatch for many headless matches. In lockstep they are played together and stats
+    collected in all of them come with the first match"""
+    if not usesLockstep():
+        return [simulateMatch(players, False, seed) for players, seed in zip(matches, seeds)]
+    if not config.instrument:
+        return [(scores, None) for scores in simulateLockstep(matches, seeds)]
+    with instrumentation.collecting() as stats:
+        results = simulateLockstep(matches, seeds)
+    return [(scores, stats if j == 0 else None) for j, scores in enumerate(results)]
+
+
+def matchBatches(draws, pool):
+    """Headless matches split into batches simulateMatches plays at once. In lockstep there is one
+    batch for every worker, otherwise every match is a batch of its own"""
+    headless = [j for j in range(len(draws)) if not draws[j]]
+    if not usesLockstep():
+        return [[j] for j in headless]
+    if pool is None:
+        workers = 1
+    else:
+        # same number of processes as createPool starts
+        workers = config.workers if config.workers > 0 else os.cpu_count()
+    return [batch for batch in (headless[i::workers] for i in range(workers)) if batch]
+
+
+def playRound(matches, seeds, draws, pool=None):
+    """Simulate all matches of a round and return scores for each of them.
+
+    Matches that are drawn run in this process, all other are sent to the pool if there is one."""
+    results = [None] * len(matches)
+    batches = matchBatches(draws, pool)
+    tasks = [([matches[j] for j in batch], [seeds[j] for j in batch]) for batch in batches]
+    pending = pool.starmap_async(simulateMatches, tasks) if pool is not None and tasks else None
+    for j in range(len(matches)):
+        if draws[j]:
+            results[j] = simulateMatch(matches[j], True, seeds[j])
+    batchResults = pending.get() if pending is not None else [simulateMatches(*task) for task in tasks]
+    for batch, batchResult in zip(batches, batchResults):
+        for j, result in zip(batch, batchResult):
+            results[j] = result
+    for scores, stats in results:
+        instrumentation.merge(stats)
+    return [scores for scores, stats in results]
+
+
+def createPool(workers):
+    if workers == 1:
+        return None
+    return multiprocessing.Pool(processes=workers if workers > 0 else None)
 
 
 def shouldDrawThisMatch(currentRound, currentMatch, totalMatches):
@@ -148,43 +346,80 @@ def sampleBasedOnSigma(players, sampleSize):
 
 
 def run():
+    """Run the tournament and return its players, best first"""
+    global totalRemoved
     if config.random_seed is not None and config.random_seed != "disabled":
         random.seed(config.random_seed)
 
-    playerRepository = PlayerRepository()
-    players = playerRepository.generatePlayers(number=config.players, includeHumanPlayer=config.include_human_player)
+    if config.instrument:
+        instrumentation.enable()
+    if config.resume and config.checkpoint_file and os.path.exists(config.checkpoint_file):
+        firstRound, playerRepository, rng, totalRemoved = checkpoint.load(config.checkpoint_file)
+        players = playerRepository.players
+        print("Resuming from round {} of {}".format(firstRound, config.checkpoint_file))
+    else:
+        firstRound = 0
+        # breeding has its own generator, seeded from the main random state so runs stay reproducible
+        rng = np.random.default_rng(random.getrandbits(64))
+        playerRepository = PlayerRepository()
+        players = playerRepository.generatePlayers(
+            number=config.players, includeHumanPlayer=config.include_human_player
+        )
+    store = openStore(config.player_store)
+    if store is not None:
+        # players of earlier tournaments, or added after the checkpoint, stay in the store as inactive
+        store.deactivateAll()
+        playerRepository.store = store
     playerRepository.setPlayers(players)
     totalMatches = config.players // config.match_size - (config.matching_spread - 1)
-    for i in range(config.rounds):
+    pool = createPool(config.workers)
+    for i in range(firstRound, config.rounds):
         players = playerRepository.fetchPlayers(sort=True)
+        matches = []
         for j in range(totalMatches):
             eligablePlayers = players[j * config.match_size : (j + config.matching_spread) * config.match_size]
             if config.matching_spread > 1:
                 nextMatchPlayers = sampleBasedOnSigma(eligablePlayers, config.match_size)
             else:
                 nextMatchPlayers = players[j * config.match_size : (j + 1) * config.match_size]
-            # print("Starting match from round {} for group {}".format(i, j))
-
-            simulateGame(nextMatchPlayers, shouldDrawThisMatch(i, j, totalMatches))
-            for p in players:
-                p.score = 0
+            matches.append(list(nextMatchPlayers))
+        seeds = [random.getrandbits(32) for _ in matches]
+        draws = [shouldDrawThisMatch(i, j, totalMatches) for j in range(totalMatches)]
+        # print("Starting round {} with {} matches".format(i, totalMatches))
+        rankRound(matches, playRound(matches, seeds, draws, pool))
+        for match in matches:
+            playerRepository.updateRanks(match)
         amountRemoved = playerRepository.removeWorstPlayers(
             quantile=config.gen_worst_quantile, minSigma=config.gen_min_sigma
         )
-        newPlayers = []
-        for n in range(len(amountRemoved)):
-            players_with_nets = playerRepository.fetchPlayers(sort=True, filter=lambda p: p.neural_net is not None)
-            parents = random.choices(
-                players_with_nets,
-                weights=range(len(players_with_nets), 0, -1),
-                k=2,
-            )
-            child_nn = make_child(parents[0].neural_net, parents[1].neural_net)
-            newPlayers.append(playerRepository.generateNNAIPlayer(child_nn))
-        playerRepository.setPlayers(playerRepository.fetchPlayers() + newPlayers)
+        players_with_nets = playerRepository.fetchPlayers(sort=True, filter=lambda p: p.neural_net is not None)
+        parentPairs = [
+            random.choices(range(len(players_with_nets)), weights=range(len(players_with_nets), 0, -1), k=2)
+            for n in range(len(amountRemoved))
+        ]
+        children = breed([p.neural_net for p in players_with_nets], parentPairs, rng) if parentPairs else []
+        newPlayers = [playerRepository.generateNNAIPlayer(child_nn) for child_nn in children]
+        playerRepository.addPlayers(newPlayers)
         printScoresAndRankings(i, players, amountRemoved, config.gen_worst_quantile)
+        if config.checkpoint_file and ((i + 1) % config.checkpoint_every == 0 or i + 1 == config.rounds):
+            checkpoint.save(config.checkpoint_file, i + 1, playerRepository, rng, totalRemoved)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if store is not None:
+        store.close()
+    if instrumentation.stats is not None:
+        print(json.dumps(instrumentation.stats.dump(), indent=2))
+    return playerRepository.fetchPlayers(sort=True)
 
 
 if __name__ == "__main__":
-    run()
-    pygame.quit()
+    printConfig()
+    if config.replay_file:
+        print(playReplay(config.replay_file, draw=config.gui_draw, useNetworks=config.replay_networks))
+    else:
+        run()
+    if "gui" in sys.modules:
+        sys.modules["gui"].stopViewer()
+    if "pygame" in sys.modules:
+        sys.modules["pygame"].quit()
@@ -0,0 +1,16 @@
+import pytest
+
+from testmatches import createPlayers, playCopy
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4, 5])
+def test_arrayEngineGivesSameScoresAsEsper(seed):
+    players = createPlayers(8)
+
+    assert playCopy(players, seed, engine="array") == playCopy(players, seed, engine="esper")
+
+
+def test_arrayEngineGivesSameScoresAsEsperInBigMatchWithHumanPlayer():
+    players = createPlayers(24, includeHumanPlayer=True)
+
+    assert playCopy(players, 7, engine="array") == playCopy(players, 7, engine="esper")
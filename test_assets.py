@@ -0,0 +1,34 @@
+import glob
+
+import esper
+import pygame
+import pytest
+
+import assets
+import create
+from gamecomponents import PlayerInfo, PositionBox, Renderable
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("assets/*.png")))
+def test_sizeFromHeaderIsSameAsLoadedImage(path):
+    assert assets.size(path) == pygame.image.load(path).get_size()
+
+
+def test_notPngImageIsRejected():
+    with pytest.raises(ValueError):
+        assets.size("assets/tank_body_raw.xcf")
+
+
+def test_imageIsLoadedOnce():
+    assert assets.image(assets.BULLET) is assets.image(assets.BULLET)
+
+
+def test_headlessTankHasSizesButNoRenderable():
+    world = esper.World()
+    create.tank(world, 0, 0, PlayerInfo(name="test", ai=lambda perception, memory: (None, None)), render=False)
+
+    assert world.get_component(Renderable) == []
+    assert [(p.w, p.h) for _, p in world.get_component(PositionBox)] == [
+        assets.size(assets.TANK_BASE),
+        assets.size(assets.TANK_TURRET),
+    ]
@@ -0,0 +1,22 @@
+import logic
+from argparser import config, configOverride
+from benchmark import esperMatch, scenarioPlayers
+
+
+def test_esperMatchTimesEveryProcessor():
+    with configOverride(game_max_match_turns=5):
+        seconds, stats = esperMatch(scenarioPlayers(8, None), seed=1)
+
+    assert stats.counters["ticks"] == 5
+    assert seconds > 0
+    processors = {name for name in dir(logic) if name.endswith("Processor") and name != "Processor"}
+    assert set(stats.processorSeconds) == processors
+    assert all(stats.processorCalls[name] == 5 for name in processors)
+
+
+def test_configOverrideIsRestored():
+    turns = config.game_max_match_turns
+    with configOverride(game_max_match_turns=turns + 1):
+        assert config.game_max_match_turns == turns + 1
+
+    assert config.game_max_match_turns == turns
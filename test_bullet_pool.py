@@ -0,0 +1,67 @@
+import pickle
+
+import esper
+
+import create
+from gamecomponents import Move, PlayerInfo, PositionBox, TTL, Velocity
+from logic import BulletPoolProcessor, CleanupProcessor, MovementProcessor, VelocityProcessor
+
+
+def setupWorld():
+    world = esper.World()
+    pool = BulletPoolProcessor()
+    world.add_processor(pool)
+    world.add_processor(CleanupProcessor(pool))
+    return world, pool
+
+
+def fire(world, pool, x=0.0):
+    create.bullet(world, ownerId=0, position=PositionBox(x=x), render=False, reused=pool.take())
+
+
+def test_componentsOfDeletedBulletAreReusedOnceItIsGone():
+    world, pool = setupWorld()
+    fire(world, pool)
+    bullet, oldPosition = world.get_component(PositionBox)[0]
+    oldMove = world.component_for_entity(bullet, Velocity).move
+    world.component_for_entity(bullet, TTL).turns = 0
+    world.process()
+
+    # the bullet is deleted, but stays in the world until the next turn starts
+    assert world.get_component(PositionBox) == [(bullet, oldPosition)]
+    assert pool.take() == {}
+
+    world.process()
+    fire(world, pool, x=100.0)
+    [(newBullet, position)] = world.get_component(PositionBox)
+
+    assert newBullet != bullet
+    assert position is oldPosition
+    assert position.x == 100.0 + 36
+    assert world.component_for_entity(newBullet, TTL).turns > 0
+    assert world.component_for_entity(newBullet, Velocity).move is oldMove
+
+
+def test_velocityAddsSameMoveEveryTurn():
+    world = esper.World()
+    entity = world.create_entity(PositionBox(), Velocity(speed=5))
+    world.add_processor(MovementProcessor())
+    world.add_processor(VelocityProcessor())
+    world.process()
+    move = world.component_for_entity(entity, Move)
+    # a collision reverting the move lasts only one turn
+    move.distance *= -1
+    world.process()
+
+    assert world.component_for_entity(entity, Move) is move
+    assert move.distance == 5
+    assert world.component_for_entity(entity, PositionBox).x == -5
+
+
+def test_componentsHaveNoDictionary():
+    p = PlayerInfo(name="p")
+    p.mu = 25.0
+
+    assert not hasattr(p, "__dict__")
+    assert not hasattr(PositionBox(), "__dict__")
+    assert pickle.loads(pickle.dumps(p)).mu == 25.0
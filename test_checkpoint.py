@@ -0,0 +1,45 @@
+import contextlib
+import io
+
+import numpy as np
+
+from argparser import configOverride
+from tankbr import run
+
+
+def tournament(rounds, **values):
+    with configOverride(players=16, rounds=rounds, workers=1, gui_draw=False, **values):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            players = run()
+    return players, output.getvalue()
+
+
+def playerStates(players):
+    return [(p.name, p.totalGames, p.mu, p.sigma, p.rank) for p in players]
+
+
+def test_resumedTournamentContinuesBitForBit(tmp_path):
+    path = str(tmp_path / "tournament.npz")
+    expected, expectedOutput = tournament(3, checkpoint_file=None, resume=False)
+
+    tournament(1, checkpoint_file=path, checkpoint_every=1, resume=False)
+    resumed, resumedOutput = tournament(3, checkpoint_file=path, checkpoint_every=1, resume=True)
+
+    assert playerStates(resumed) == playerStates(expected)
+    for p, q in zip(resumed, expected):
+        assert (p.neural_net is None) == (q.neural_net is None)
+        if p.neural_net is not None:
+            assert p.neural_net.generation == q.neural_net.generation
+            for layerName, layer in q.neural_net.parameters.items():
+                np.testing.assert_array_equal(p.neural_net.parameters[layerName], layer)
+    # rounds after the checkpoint print the same tables, including recently removed players
+    assert resumedOutput[resumedOutput.index("Round 1") :] == expectedOutput[expectedOutput.index("Round 1") :]
+
+
+def test_resumeWithoutCheckpointStartsFromScratch(tmp_path):
+    path = str(tmp_path / "missing.npz")
+    expected, _ = tournament(1, checkpoint_file=None, resume=False)
+    players, _ = tournament(1, checkpoint_file=path, checkpoint_every=5, resume=True)
+
+    assert playerStates(players) == playerStates(expected)
+    assert (tmp_path / "missing.npz").exists()
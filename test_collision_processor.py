@@ -0,0 +1,78 @@
+import esper
+
+from argparser import config
+from gamecomponents import Explosive, Mount, Move, Owner, PlayerInfo, PositionBox, Score, Solid
+from logic import CollisionProcessor, MountProcessor
+
+
+def createTank(world, x, y):
+    tank = world.create_entity()
+    world.add_component(tank, PositionBox(x=x, y=y))
+    world.add_component(tank, Solid(collisionRadius=20))
+    world.add_component(tank, PlayerInfo(name="tank"))
+    return tank
+
+
+def createBullet(world, x, y, ownerId):
+    bullet = world.create_entity()
+    world.add_component(bullet, PositionBox(x=x, y=y))
+    world.add_component(bullet, Solid(collisionRadius=10))
+    world.add_component(bullet, Owner(ownerId))
+    world.add_component(bullet, Explosive())
+    return bullet
+
+
+def test_bulletDestroysTankAndScoresForOwner():
+    world = esper.World()
+    world.add_processor(CollisionProcessor())
+    shooter = createTank(world, 0, 0)
+    target = createTank(world, 200, 0)
+    createBullet(world, 215, 0, shooter)
+    world.process()
+    world.process()
+
+    assert world.entity_exists(shooter)
+    assert not world.entity_exists(target)
+    scores = [score for _, score in world.get_component(Score)]
+    assert [(score.ownerId, score.points) for score in scores] == [(shooter, config.game_frag_score)]
+
+
+def test_collidingTanksRevertTheirMoves():
+    world = esper.World()
+    world.add_processor(CollisionProcessor())
+    tankA = createTank(world, 0, 0)
+    tankB = createTank(world, 30, 0)
+    moveA, moveB = Move(5), Move(-5)
+    world.add_component(tankA, moveA)
+    world.add_component(tankB, moveB)
+    world.process()
+
+    assert (moveA.distance, moveB.distance) == (-5, 5)
+
+
+def test_manyBulletsFarApartDoNotCollide():
+    world = esper.World()
+    world.add_processor(CollisionProcessor())
+    owner = createTank(world, -1000, -1000)
+    bullets = [createBullet(world, 100 * i, 100 * (i % 7), owner) for i in range(200)]
+    world.process()
+    world.process()
+
+    assert all(world.entity_exists(bullet) for bullet in bullets)
+
+
+def test_destroyedTankTakesMountedGunAlong():
+    world = esper.World()
+    mountProcessor = MountProcessor()
+    world.add_processor(CollisionProcessor(mountProcessor=mountProcessor))
+    world.add_processor(mountProcessor)
+    shooter = createTank(world, 0, 0)
+    target = createTank(world, 200, 0)
+    gun = world.create_entity(PositionBox(), Mount(target))
+    world.process()
+    createBullet(world, 215, 0, shooter)
+    world.process()
+    world.process()
+
+    assert not world.entity_exists(target)
+    assert not world.entity_exists(gun)
@@ -0,0 +1,51 @@
+import pytest
+
+import instrumentation
+from ai import rotatorAI
+from argparser import configOverride
+from testmatches import createPlayers, playCopy
+
+
+def idleAI(perception, memory):
+    return None, None
+
+
+def playWithAndWithoutFastForward(players, seed):
+    """Scores without and with fast forward and counters of the match played with it"""
+    scores = playCopy(players, seed, fast_forward=False)
+    with instrumentation.collecting() as stats:
+        fastScores = playCopy(players, seed, fast_forward=True)
+    return scores, fastScores, stats
+
+
+@pytest.mark.parametrize("engine", ["esper", "array"])
+@pytest.mark.parametrize("seed", [3, 5])
+def test_fastForwardGivesSameScoresAsPlayingEveryTurn(engine, seed):
+    # tanks fire only at targets, so once the last bullets hit the match waits out the ammo countdown
+    players = createPlayers(8, ai=rotatorAI)
+
+    with configOverride(engine=engine, game_ammo=1):
+        scores, fastScores, stats = playWithAndWithoutFastForward(players, seed)
+
+    assert fastScores == scores
+    assert stats.counters["ticks_fast_forwarded"] > 0
+
+
+def test_matchWithLoadedGunsIsNotFastForwarded():
+    players = createPlayers(8)
+
+    with configOverride(fast_forward=True), instrumentation.collecting() as stats:
+        playCopy(players, 1)
+
+    assert stats.counters["ticks_fast_forwarded"] == 0
+
+
+@pytest.mark.parametrize("engine", ["esper", "array"])
+def test_matchStandingStillIsFastForwardedWithLoadedGuns(engine):
+    players = createPlayers(4, ai=idleAI)
+
+    with configOverride(engine=engine):
+        scores, fastScores, stats = playWithAndWithoutFastForward(players, 2)
+
+    assert fastScores == scores
+    assert stats.counters["ticks_fast_forwarded"] > 0
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+from benchmark import coldStart
+
+
+def test_tournamentModulesImportWithoutPygame():
+    _, renderingModules = coldStart(runs=1)
+
+    assert renderingModules == []
+
+
+def test_headlessMatchDoesNotLoadPygame():
+    snippet = (
+        "import sys; from PlayerRepository import PlayerRepository; from tankbr import simulateGame; "
+        "simulateGame(PlayerRepository().generatePlayers(number=8), draw=False, seed=1); "
+        "assert 'pygame' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", snippet], check=True)
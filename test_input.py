@@ -0,0 +1,101 @@
+import socket
+import time
+
+import esper
+import pygame
+
+import tankbr
+from argparser import config, configOverride
+from gamecomponents import FireGun, Gun, InputEvents, MovementSteering, PlayerInfo, PositionBox, Velocity
+from gui import (
+    InputEventProcessor,
+    InputQueue,
+    KeyEvent,
+    QueuedInputCollector,
+    keyEvent,
+    listenForInput,
+    readInputScript,
+)
+from logic import GameEndProcessor
+
+
+def setupWorld(inputQueue):
+    world = esper.World()
+    events = world.create_entity(InputEvents())
+    tank = world.create_entity(
+        PositionBox(), Velocity(speed=0, angularSpeed=0), MovementSteering(pygame.K_w, pygame.K_s), Gun(None, ammo=1)
+    )
+    gameEndProcessor = GameEndProcessor(turnsLeft=100, ammoTimeout=1)
+    world.add_processor(QueuedInputCollector(events, inputQueue))
+    world.add_processor(InputEventProcessor(gameEndProcessor))
+    return world, tank, gameEndProcessor
+
+
+def test_keyEventsSteerTank():
+    inputQueue = InputQueue({1: [keyEvent("down", "w")], 2: [keyEvent("up", "w"), keyEvent("down", "s")]})
+    world, tank, _ = setupWorld(inputQueue)
+
+    world.process()
+    assert world.component_for_entity(tank, Velocity).speed == config.game_movement_speed
+    world.process()
+    assert world.component_for_entity(tank, Velocity).speed == -config.game_movement_speed
+
+
+def test_escapeEndsMatch():
+    inputQueue = InputQueue()
+    world, _, gameEndProcessor = setupWorld(inputQueue)
+    inputQueue.put(keyEvent("down", "escape"))
+    world.process()
+
+    assert gameEndProcessor.gameEndReason == GameEndProcessor.GameEndReason.MANUAL
+
+
+def test_deadTankIsNotSteered():
+    inputQueue = InputQueue({2: [keyEvent("down", "w")]})
+    world, tank, _ = setupWorld(inputQueue)
+    world.process()
+    velocity = world.component_for_entity(tank, Velocity)
+    world.delete_entity(tank)
+    world.process()
+
+    assert velocity.speed == 0
+
+
+def test_scriptGivesEventsOfEveryTick(tmp_path):
+    path = tmp_path / "input"
+    path.write_text("# tick event key\n1 down w\n3 down space\n3 up w\n")
+    inputQueue = readInputScript(str(path))
+
+    assert inputQueue.take() == [KeyEvent(pygame.KEYDOWN, pygame.K_w)]
+    assert inputQueue.take() == []
+    assert inputQueue.take() == [KeyEvent(pygame.KEYDOWN, pygame.K_SPACE), KeyEvent(pygame.KEYUP, pygame.K_w)]
+
+
+def test_eventsSentToPortAreQueued():
+    inputQueue = InputQueue()
+    port = listenForInput(inputQueue, 0)
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        connection.sendall(b"down a\nup a\n")
+    events = []
+    deadline = time.monotonic() + 5
+    while len(events) < 2 and time.monotonic() < deadline:
+        events += inputQueue.take()
+        time.sleep(0.01)
+
+    assert events == [KeyEvent(pygame.KEYDOWN, pygame.K_a), KeyEvent(pygame.KEYUP, pygame.K_a)]
+
+
+def test_scriptedHumanFiresInMatchThatIsNotDrawn(tmp_path):
+    path = tmp_path / "input"
+    path.write_text("1 down space\n")
+    human = PlayerInfo(name="human")
+    with configOverride(input_script=str(path)):
+        world, events = tankbr.initWorld()
+        tankbr.create.tanks(world, [human], render=False)
+        tankbr.prepareProcessors(world, events, drawUI=False, inputQueue=tankbr.humanInput([human]))
+        [(_, (_, gun))] = world.get_components(PlayerInfo, Gun)
+        world.process()
+        assert world.get_component(FireGun) != []
+        world.process()
+
+    assert gun.isLoaded is False
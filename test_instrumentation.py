@@ -0,0 +1,44 @@
+import copy
+import pickle
+
+import pytest
+
+import instrumentation
+from argparser import config
+from tankbr import playRound
+from testmatches import createMatches
+
+
+def test_countIsIgnoredWhenDisabled():
+    assert instrumentation.stats is None
+    instrumentation.count("ticks")
+
+    assert instrumentation.stats is None
+
+
+@pytest.mark.parametrize("engine", ["esper", "array", "lockstep"])
+def test_roundCollectsCounters(engine, monkeypatch):
+    monkeypatch.setattr(config, "instrument", True)
+    monkeypatch.setattr(config, "engine", engine)
+    monkeypatch.setattr(instrumentation, "stats", None)
+    instrumentation.enable()
+    playRound(createMatches([8, 8]), [1, 2], [False, False])
+    counters = instrumentation.stats.counters
+
+    assert counters["ticks"] > 0
+    assert counters["bullets_spawned"] > 0
+    assert counters["collision_checks"] > 0
+    assert counters["range_finder_tests"] > 0
+    assert pickle.loads(pickle.dumps(instrumentation.stats)).dump() == instrumentation.stats.dump()
+
+
+def test_instrumentationDoesNotChangeScores(monkeypatch):
+    matches = createMatches([8, 8])
+    instrumentedMatches = copy.deepcopy(matches)
+    scores = playRound(matches, [3, 4], [False, False])
+    monkeypatch.setattr(config, "instrument", True)
+    monkeypatch.setattr(instrumentation, "stats", None)
+    instrumentation.enable()
+
+    assert playRound(instrumentedMatches, [3, 4], [False, False]) == scores
+    assert set(instrumentation.stats.dump()["processors"]) >= {"CollisionProcessor", "RangeFindingProcessor"}
@@ -0,0 +1,78 @@
+import copy
+import multiprocessing
+import random
+
+import pytest
+
+import instrumentation
+from ai import rotatorAI
+from argparser import configOverride
+from tankbr import playRound, simulateGame, simulateLockstep
+from testmatches import createMatches
+
+
+def playAlone(matches, seeds):
+    with configOverride(engine="array"):
+        return [simulateGame(players, draw=False, seed=seed) for players, seed in zip(matches, seeds)]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_lockstepGivesSameScoresAsMatchesPlayedAlone(seed):
+    matches = createMatches([8, 8, 5, 12], includeHumanPlayer=True)
+    aloneMatches = copy.deepcopy(matches)
+    seeds = [seed, seed + 10, seed + 20, seed + 30]
+
+    assert simulateLockstep(matches, seeds) == playAlone(aloneMatches, seeds)
+
+
+def test_playerCanBeInManyMatches():
+    # like with matching_spread, where matches of a round are sampled from overlapping groups
+    players = createMatches([12])[0]
+    matches = [players[:8], players[4:], players[::2]]
+    seeds = [1, 2, 3]
+
+    assert simulateLockstep(matches, seeds) == playAlone(copy.deepcopy(matches), seeds)
+    assert all(p.score == 0 for p in players)
+
+
+def test_matchesFastForwardOnTheirOwn():
+    matches = createMatches([8, 8, 8])
+    for players in matches:
+        for p in players:
+            p.ai = rotatorAI
+    aloneMatches = copy.deepcopy(matches)
+    seeds = [3, 1, 5]
+
+    with configOverride(game_ammo=1):
+        with instrumentation.collecting() as stats:
+            scores = simulateLockstep(matches, seeds)
+        assert scores == playAlone(aloneMatches, seeds)
+    assert stats.counters["ticks_fast_forwarded"] > 0
+
+
+def test_lockstepCollectsSameCountersAsArrayEngine():
+    matches = createMatches([8, 6])
+    aloneMatches = copy.deepcopy(matches)
+    with instrumentation.collecting() as stats:
+        simulateLockstep(matches, [1, 2])
+    with instrumentation.collecting() as aloneStats:
+        playAlone(aloneMatches, [1, 2])
+
+    assert stats.counters == aloneStats.counters
+
+
+def test_lockstepRoundGivesSameScoresAsEsperRound():
+    matches = createMatches([8, 8, 8])
+    lockstepMatches = copy.deepcopy(matches)
+    parallelMatches = copy.deepcopy(matches)
+    seeds, draws = [4, 5, 6], [False, False, False]
+    scores = playRound(matches, seeds, draws)
+
+    random.seed(7)
+    expected = random.random()
+    random.seed(7)
+    with configOverride(engine="lockstep", workers=2):
+        assert playRound(lockstepMatches, seeds, draws) == scores
+        assert random.random() == expected
+        with multiprocessing.Pool(processes=2) as pool:
+            assert playRound(parallelMatches, seeds, draws, pool) == scores
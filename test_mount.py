@@ -0,0 +1,48 @@
+import esper
+import pytest
+
+from gamecomponents import Gun, Mount, Move, PositionBox, Rotate, RotateGun
+from logic import MountProcessor, MovementProcessor, RotationProcessor
+
+
+def setupWorld(mount):
+    world = esper.World()
+    parent = world.create_entity(PositionBox(x=10, y=20, rotation=0))
+    mount.parentId = parent
+    mounted = world.create_entity(PositionBox(), mount)
+    world.add_processor(MovementProcessor())
+    world.add_processor(RotationProcessor())
+    world.add_processor(MountProcessor())
+    return world, parent, mounted
+
+
+def test_mountedEntityFollowsParent():
+    world, parent, mounted = setupWorld(Mount(None))
+    world.add_component(parent, Move(5))
+    world.add_component(parent, Rotate(90))
+    world.process()
+    position = world.component_for_entity(mounted, PositionBox)
+
+    assert (position.x, position.y, position.rotation) == (15, 20, 90)
+
+
+def test_offsetTurnsWithParent():
+    world, parent, mounted = setupWorld(Mount(None, x=3, y=0))
+    world.add_component(parent, Rotate(90))
+    world.process()
+    position = world.component_for_entity(mounted, PositionBox)
+
+    assert (position.x, position.y) == pytest.approx((10, 23))
+
+
+def test_mountedEntityRotatesRelativeToParent():
+    world, parent, mounted = setupWorld(Mount(None, rotation=10))
+    world.add_component(parent, Gun(mounted, ammo=0))
+    world.add_component(parent, Rotate(30))
+    world.add_component(parent, RotateGun(5))
+    world.add_component(mounted, Rotate(2))
+    world.process()
+
+    assert world.component_for_entity(mounted, Mount).rotation == 17
+    assert world.component_for_entity(mounted, PositionBox).rotation == 47
+    assert world.component_for_entity(parent, PositionBox).rotation == 30
@@ -0,0 +1,117 @@
+import random
+
+import numpy as np
+import pytest
+
+from gamecomponents import Perception, PositionBox
+import slownetwork
+from network_processor import (
+    batch_forward_propagation,
+    breed,
+    create_model,
+    full_forward_propagation,
+    mutate,
+    stack_parameters,
+)
+from networks import NeuralAIBatch, neuralAI
+from testmatches import createPlayers, playCopy
+
+
+def commandsOf(decision):
+    return [
+        (type(command).__name__, getattr(command, "distance", getattr(command, "angle", None)))
+        for command in decision.commands
+    ]
+
+
+def test_batchForwardPropagationGivesSameResultsAsOneByOne():
+    models = [create_model([2, 12, 8, 7], seed=seed, random_scale=3) for seed in range(10)]
+    inputs = [[[random.random()], [seed % 2]] for seed in range(10)]
+
+    results = batch_forward_propagation(
+        np.array(inputs, dtype=np.float64), stack_parameters(models), models[0].architecture
+    )
+
+    for model, x, result in zip(models, inputs, results):
+        assert np.array_equal(full_forward_propagation(x, model.parameters, model.architecture), result)
+
+
+def test_compiledPlanGivesSameResultsAsForwardPropagation():
+    model = create_model([2, 12, 8, 7], seed=4, random_scale=3)
+    for x in ([[0.25], [0]], [[0.75], [1]]):
+        expected = full_forward_propagation(x, model.parameters, model.architecture)
+        assert np.allclose(model.run(x), expected, rtol=1e-12, atol=1e-12)
+        assert np.array_equal(slownetwork.forward_propagation(model.plan, x), expected)
+
+
+def test_planFollowsChangedParameters():
+    model = create_model([2, 12, 8, 7], seed=4, random_scale=3)
+    x = [[0.5], [1]]
+    model.run(x)
+    mutate(model, mutation_rate=1, mutation_scale=1)
+
+    assert np.array_equal(
+        slownetwork.forward_propagation(model.plan, x),
+        full_forward_propagation(x, model.parameters, model.architecture),
+    )
+
+
+def test_batchGivesSameDecisionsAsNeuralAIs():
+    neuralAIs = [neuralAI(seed=seed)[0] for seed in range(10)] + [
+        neuralAI(neural_net_model=create_model([2, 5, 7], seed=seed, random_scale=3))[0] for seed in range(5)
+    ]
+    perceptions = []
+    for i in range(len(neuralAIs)):
+        perception = Perception()
+        perception.target = PositionBox() if i % 3 == 0 else None
+        perceptions.append(perception)
+
+    random.seed(3)
+    expected = [commandsOf(ai(perception, None)[0]) for ai, perception in zip(neuralAIs, perceptions)]
+    random.seed(3)
+    inputs = [ai.networkInput(perception) for ai, perception in zip(neuralAIs, perceptions)]
+    decisions = NeuralAIBatch().decide(neuralAIs, inputs)
+
+    assert [commandsOf(decision) for decision in decisions] == expected
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_batchedNetworksGiveSameScores(seed):
+    players = createPlayers(8)
+
+    assert playCopy(players, seed, ai_batch_networks=True) == playCopy(players, seed, ai_batch_networks=False)
+
+
+def test_breedIsReproducibleWithSameGenerator():
+    models = [create_model([2, 12, 8, 7], seed=seed, random_scale=3) for seed in range(4)]
+    pairs = [[0, 1], [2, 3], [1, 1]]
+
+    first = breed(models, pairs, np.random.default_rng(8))
+    second = breed(models, pairs, np.random.default_rng(8))
+
+    for a, b in zip(first, second):
+        assert all(np.array_equal(a.parameters[name], b.parameters[name]) for name in a.parameters)
+
+
+def test_breedWithoutMutationTakesEveryNeuronFromOneOfParents():
+    models = [create_model([2, 12, 8, 7], seed=seed, random_scale=3) for seed in range(4)]
+    models[3].generation = 5
+    pairs = np.array([[0, 1], [3, 2]])
+
+    children = breed(models, pairs, np.random.default_rng(1), mutation_rate=0)
+
+    assert [child.generation for child in children] == [1, 6]
+    for child, (mother, father) in zip(children, pairs):
+        for name, layer in child.parameters.items():
+            fromMother = np.all(layer == models[mother].parameters[name], axis=1)
+            fromFather = np.all(layer == models[father].parameters[name], axis=1)
+            assert np.all(fromMother | fromFather)
+
+
+def test_breedWithFullMutationChangesAllWeights():
+    models = [create_model([2, 12, 8, 7], seed=seed, random_scale=3) for seed in range(2)]
+
+    child = breed(models, [[0, 0]], np.random.default_rng(1), mutation_rate=1)[0]
+
+    for name, layer in child.parameters.items():
+        assert np.all(layer != models[0].parameters[name])
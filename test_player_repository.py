@@ -1,4 +1,6 @@
 import pytest
+import hypothesis.strategies as st
+from hypothesis import given
 
 from PlayerRepository import PlayerRepository
 from gamecomponents import PlayerInfo
@@ -41,8 +43,29 @@ def test_remove_worst_players_too_big_sigma():
 def test_remove_worst_players_too_big_sigma_but_limited_amount_should_remove_worst_player():
     p1.rank = 30
     p2.rank = 40
+    repo.updateRanks([p1, p2])
     removed = repo.removeWorstPlayers(quantile=0.5, minSigma=6)
 
     assert len(removed) == 1
     assert len(repo.fetchPlayers()) == 1
     assert repo.fetchPlayers() == [p2]
+
+
+@given(
+    st.lists(st.one_of(st.none(), st.integers(-5, 5)), min_size=1),
+    st.lists(st.tuples(st.integers(0, 100), st.integers(-5, 5))),
+)
+def test_rank_index_matches_sorting_the_players(ranks, updates):
+    players = [PlayerInfo(str(i)) for i in range(len(ranks))]
+    for p, rank in zip(players, ranks):
+        p.rank = rank
+    repository = PlayerRepository()
+    repository.setPlayers(players)
+    for index, rank in updates:
+        players[index % len(players)].rank = rank
+        repository.updateRanks([players[index % len(players)]])
+
+    expected = repository.sortPlayers(players)
+    assert repository.fetchPlayers(sort=True) == expected
+    assert repository.top(2) == expected[:2]
+    assert list(repository.ranked(len(players) // 2)) == expected[len(players) // 2 :]
@@ -0,0 +1,79 @@
+import contextlib
+import io
+import pickle
+
+import numpy as np
+
+from PlayerRepository import PlayerRepository
+from argparser import configOverride
+from network_processor import Model
+from playerstore import PlayerStore, StoredModel
+from tankbr import run
+
+
+def storedPlayers(tmp_path, number=8):
+    store = PlayerStore(str(tmp_path / "players.db"))
+    repository = PlayerRepository(store)
+    players = repository.generatePlayers(number=number)
+    for i, p in enumerate(players):
+        p.mu, p.sigma, p.rank = 25.0 + i, 5.0 - i / 10, float(i)
+    repository.setPlayers(players)
+    return store, repository, players
+
+
+def test_storedPlayersKeepRatingsAndWeights(tmp_path):
+    store, _, players = storedPlayers(tmp_path)
+    stored = {p.storeId: p for p in store.query()}
+
+    for p in players:
+        s = stored[p.storeId]
+        assert (s.name, s.mu, s.sigma, s.rank, s.totalGames) == (p.name, p.mu, p.sigma, p.rank, p.totalGames)
+        if p.neural_net is not None:
+            assert isinstance(s.neural_net, StoredModel) and not s.neural_net.loaded
+            for layerName, layer in p.neural_net.parameters.items():
+                np.testing.assert_array_equal(s.neural_net.parameters[layerName], layer)
+            assert s.neural_net.run([[0.5], [1]]).tolist() == p.neural_net.run([[0.5], [1]]).tolist()
+        else:
+            assert s.ai is p.ai
+
+
+def test_playersLeavingStayInHallOfFame(tmp_path):
+    store, repository, players = storedPlayers(tmp_path)
+    best = players[-1]
+    repository.setPlayers(players[:-1])
+
+    assert store.count(active=True) == len(players) - 1
+    assert [p.storeId for p in store.query(active=True)] == [p.storeId for p in reversed(players[:-1])]
+    assert store.hallOfFame(limit=1)[0].storeId == best.storeId
+
+
+def test_queryByGenerationAndSigma(tmp_path):
+    store, _, players = storedPlayers(tmp_path)
+
+    assert {p.storeId for p in store.query(generation=0)} == {p.storeId for p in players if p.neural_net is not None}
+    assert {p.storeId for p in store.query(maxSigma=4.5)} == {p.storeId for p in players if p.sigma < 4.5}
+    assert [p.sigma for p in store.query(orderBy="sigma", descending=False)] == sorted(p.sigma for p in players)
+
+
+def test_storedModelPicklesIntoPlainModel(tmp_path):
+    store, _, players = storedPlayers(tmp_path)
+    stored = store.query(generation=0, limit=1)[0].neural_net
+
+    model = pickle.loads(pickle.dumps(stored))
+
+    assert type(model) is Model
+    for layerName, layer in stored.parameters.items():
+        np.testing.assert_array_equal(model.parameters[layerName], layer)
+
+
+def test_tournamentWithStoreGivesSameResults(tmp_path):
+    def tournament(playerStore):
+        with configOverride(players=16, rounds=2, workers=1, gui_draw=False, player_store=playerStore):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return [(p.name, p.mu, p.sigma) for p in run()]
+
+    path = str(tmp_path / "tournament.db")
+    players = tournament(path)
+    assert players == tournament(None)
+    store = PlayerStore(path)
+    assert [(p.name, p.mu, p.sigma) for p in store.query(active=True)] == players
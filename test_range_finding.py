@@ -1,12 +1,15 @@
 import math
 
 import esper
+import numpy as np
 import hypothesis.strategies as st
 from hypothesis import given
 
 # We check for translation invariant here also
 from gamecomponents import PositionBox, Solid, RangeFinder
 from logic import RangeFindingProcessor
+from slowmath import segmentAndCircleIntersect, square
+from vectormath import rangeFind
 
 
 @given(
@@ -80,3 +83,90 @@ def test_shouldNotFindTargetOutOfRange():
 
     assert finder.closestTarget is None
     assert finder.foundTargets == []
+
+
+def test_shouldPickClosestOfManyTargetsForEveryFinder():
+    world = esper.World()
+    finders = []
+    for rotation in (0, 90):
+        finderEntity = world.create_entity()
+        finder = RangeFinder(maxRange=100, angleOffset=0)
+        world.add_component(finderEntity, finder)
+        world.add_component(finderEntity, PositionBox(rotation=rotation))
+        finders.append(finder)
+    targets = []
+    for x, y in ((60, 0), (30, 0), (0, 50), (0, -50)):
+        target = world.create_entity()
+        world.add_component(target, Solid(collisionRadius=5))
+        targetPosition = PositionBox(x=x, y=y)
+        world.add_component(target, targetPosition)
+        targets.append(targetPosition)
+    world.add_processor(RangeFindingProcessor())
+    world.process()
+
+    assert finders[0].closestTarget == targets[1]
+    assert finders[0].foundTargets == [targets[0], targets[1]]
+    assert finders[1].closestTarget == targets[2]
+    assert finders[1].foundTargets == [targets[2]]
+
+
+coordinates = st.floats(min_value=-500, max_value=500)
+
+
+@given(
+    finders=st.lists(st.tuples(coordinates, coordinates, st.integers(-720, 720)), min_size=1, max_size=10),
+    targets=st.lists(st.tuples(coordinates, coordinates, st.floats(min_value=0, max_value=50)), max_size=10),
+)
+def test_rangeFindGivesSameHitsAsSegmentIntersection(finders, targets):
+    maxRange = 300.0
+    finderX, finderY, rotation = np.array(finders, dtype=np.float64).T
+    targetX, targetY, targetRange = np.array(targets, dtype=np.float64).reshape(len(targets), 3).T
+    hits, closest, distance = rangeFind(
+        finderX, finderY, rotation, np.full(len(finders), maxRange), targetX, targetY, targetRange
+    )
+    for i, (x, y, rotation) in enumerate(finders):
+        endX = x + maxRange * math.cos(math.radians(rotation))
+        endY = y + maxRange * math.sin(math.radians(rotation))
+        expected = [
+            j
+            for j, (tx, ty, r) in enumerate(targets)
+            if (x != tx or y != ty) and segmentAndCircleIntersect(x, y, endX, endY, maxRange, tx, ty, r)
+        ]
+        assert np.flatnonzero(hits[i]).tolist() == expected
+        if expected:
+            best = min(expected, key=lambda j: square(x - targets[j][0]) + square(y - targets[j][1]))
+            assert closest[i] == best
+            assert distance[i] == math.sqrt(square(x - targets[best][0]) + square(y - targets[best][1]))
+        else:
+            assert closest[i] == -1
+            assert distance[i] == math.inf
+
+
+@given(
+    stacks=st.lists(
+        st.lists(
+            st.tuples(coordinates, coordinates, st.integers(-720, 720), st.floats(min_value=0, max_value=50)),
+            min_size=1,
+            max_size=6,
+        ),
+        min_size=1,
+        max_size=4,
+    )
+)
+def test_stackedRangeFindGivesSameResultsAsEveryStackAlone(stacks):
+    # every stack is a match whose tanks find each other, shorter ones are padded with NaN
+    width = max(len(stack) for stack in stacks)
+    padded = np.full((len(stacks), width, 4), np.nan)
+    for j, stack in enumerate(stacks):
+        padded[j, : len(stack)] = stack
+    x, y, rotation, r = padded.transpose(2, 0, 1)
+    rotation = np.nan_to_num(rotation)
+    hits, closest, distance = rangeFind(x, y, rotation, np.full(x.shape, 300.0), x, y, r)
+    for j, stack in enumerate(stacks):
+        x, y, rotation, r = np.array(stack, dtype=np.float64).T
+        expected = rangeFind(x, y, rotation, np.full(len(stack), 300.0), x, y, r)
+        n = len(stack)
+        assert not hits[j, n:].any() and not hits[j, :, n:].any()
+        assert hits[j, :n, :n].tolist() == expected[0].tolist()
+        assert closest[j, :n].tolist() == expected[1].tolist()
+        assert distance[j, :n].tolist() == expected[2].tolist()
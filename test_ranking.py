@@ -0,0 +1,62 @@
+import random
+
+import hypothesis.strategies as st
+import numpy as np
+from hypothesis import given, settings
+
+import ranking
+from gamecomponents import PlayerInfo
+from ranking import matchRanks, rateFreeForAll, rateMatch, rateMatches, waves
+
+scores = st.lists(st.sampled_from([0, 0.5, 1, 1.5, 2.25]), min_size=2, max_size=8)
+
+
+@given(scores)
+def test_matchRanksGiveBestPlaceOfEqualScores(matchScores):
+    assert matchRanks(matchScores) == [sorted(matchScores, reverse=True).index(x) for x in matchScores]
+
+
+def test_matchesSharingPlayersAreInLaterWaves():
+    a, b, c, d = (PlayerInfo(name) for name in "abcd")
+
+    assert waves([[a, b], [c, d], [b, c], [a, d], [a, b]]) == [[0, 1], [2, 3], [4]]
+
+
+def ratedPlayers(mu, sigma, matchScores):
+    players = [PlayerInfo(str(i)) for i in range(len(matchScores))]
+    for p, playerMu, playerSigma in zip(players, mu, sigma):
+        p.mu, p.sigma = playerMu, playerSigma
+    rateMatch(players, matchScores)
+    return players
+
+
+@settings(deadline=None)
+@given(st.integers(2, 8), st.integers(1, 6), st.integers(0, 2**32 - 1))
+def test_batchedRatingIsExactlyTrueSkill(size, matches, seed):
+    rng = random.Random(seed)
+    mu = np.array([[rng.uniform(0, 50) for _ in range(size)] for _ in range(matches)])
+    sigma = np.array([[rng.uniform(0.5, 9) for _ in range(size)] for _ in range(matches)])
+    matchScores = [[rng.choice([0, 0.5, 1, 2]) for _ in range(size)] for _ in range(matches)]
+
+    newMu, newSigma, failed = rateFreeForAll(mu, sigma, np.array([matchRanks(s) for s in matchScores]))
+
+    assert not failed.any()
+    for k in range(matches):
+        players = ratedPlayers(mu[k].tolist(), sigma[k].tolist(), matchScores[k])
+        assert newMu[k].tolist() == [p.mu for p in players]
+        assert newSigma[k].tolist() == [p.sigma for p in players]
+
+
+def test_roundIsRatedLikeMatchByMatch(monkeypatch):
+    monkeypatch.setattr(ranking, "BATCH_MIN_MATCHES", 2)
+    rng = random.Random(7)
+    players = [PlayerInfo(str(i)) for i in range(40)]
+    copies = [PlayerInfo(str(i)) for i in range(40)]
+    rounds = [[rng.sample(range(40), 8) for _ in range(12)] for _ in range(3)]
+    for matchIndexes in rounds:
+        roundScores = [[rng.choice([0, 0.5, 1, 2]) for _ in range(8)] for _ in matchIndexes]
+        rateMatches([[players[i] for i in match] for match in matchIndexes], roundScores)
+        for match, matchScores in zip(matchIndexes, roundScores):
+            rateMatch([copies[i] for i in match], matchScores)
+
+    assert [(p.mu, p.sigma, p.rank) for p in players] == [(p.mu, p.sigma, p.rank) for p in copies]
@@ -0,0 +1,78 @@
+import os
+
+# the window is opened on a video driver that needs no display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import esper  # noqa: E402
+import pygame  # noqa: E402
+import pytest  # noqa: E402
+
+from argparser import config  # noqa: E402
+from gamecomponents import PlayerInfo, PositionBox  # noqa: E402
+from gui import Laser, Renderer, Snapshot, frameAt, takeSnapshot  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def display():
+    pygame.init()
+    yield
+    # processes forked later by other tests must not inherit a running SDL
+    pygame.quit()
+
+
+def setupWorld(*positions):
+    world = esper.World()
+    players = [world.create_entity(PlayerInfo(name="p"), PositionBox(x=x, y=y, w=10, h=10)) for x, y in positions]
+    return world, players
+
+
+def snapshot(time, *lasers):
+    return Snapshot(time, (), tuple(Laser(*laser) for laser in lasers), (), ())
+
+
+def test_onlyPointsNearTheWindowAreOnScreen():
+    renderer = Renderer()
+    width = config.gui_resolution[0] / config.gui_zoom
+
+    assert renderer.onScreen(0, 0, 0)
+    assert renderer.onScreen(width, 0, 0) is False
+    assert renderer.onScreen(width, 0, width * config.gui_zoom)
+
+
+def test_labelIsRenderedAgainOnlyWhenItsTextChanges():
+    renderer = Renderer()
+    world, (player,) = setupWorld((0, 0))
+    renderer.drawNamesAndScores(takeSnapshot(world).labels)
+    _, label = renderer.labels[player]
+
+    renderer.drawNamesAndScores(takeSnapshot(world).labels)
+    assert renderer.labels[player][1] is label
+    world.component_for_entity(player, PlayerInfo).score += 1
+    renderer.drawNamesAndScores(takeSnapshot(world).labels)
+    assert renderer.labels[player][1] is not label
+
+
+def test_playersOffScreenGetNoLabel():
+    renderer = Renderer()
+    world, (near, far) = setupWorld((0, 0), (100 * config.gui_resolution[0] / config.gui_zoom, 0))
+    renderer.drawNamesAndScores(takeSnapshot(world).labels)
+
+    assert set(renderer.labels) == {near}
+
+
+def test_frameIsInterpolatedOneSnapshotLate():
+    previous = snapshot(1.0, (1, 0, 0, 350), (2, 5, 5, 0))
+    latest = snapshot(2.0, (1, 10, 20, 10), (3, 7, 7, 0))
+
+    first, new = frameAt(previous, latest, 2.5).lasers
+    assert (first.x, first.y, first.rotation) == pytest.approx((5, 10, 360))
+    assert new == latest.lasers[1]
+    assert frameAt(previous, latest, 1.5).lasers[0].x == 0
+    assert frameAt(previous, latest, 5).lasers[0].x == 10
+
+
+def test_frameIsLatestSnapshotBeforeThereAreTwo():
+    latest = snapshot(1.0, (1, 0, 0, 0))
+
+    assert frameAt(None, None, 1) is None
+    assert frameAt(None, latest, 1) is latest
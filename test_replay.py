@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from PlayerRepository import PlayerRepository
+from argparser import config
+from replay import CHECKSUM_DTYPE, Replay, ReplayMismatch
+from tankbr import playReplay, simulateGame
+
+
+def recordMatch(tmp_path, monkeypatch, seed, includeHumanPlayer=False):
+    monkeypatch.setattr(config, "record_dir", str(tmp_path))
+    monkeypatch.setattr(config, "record_checksum_interval", 10)
+    players = PlayerRepository().generatePlayers(number=8, includeHumanPlayer=includeHumanPlayer)
+    scores = simulateGame(players, draw=False, seed=seed)
+    monkeypatch.setattr(config, "record_dir", None)
+    return tmp_path / "match-{}.replay".format(seed), scores
+
+
+@pytest.mark.parametrize("useNetworks", [False, True])
+def test_replayGivesRecordedScores(tmp_path, monkeypatch, useNetworks):
+    path, scores = recordMatch(tmp_path, monkeypatch, seed=3)
+
+    assert playReplay(path, draw=False, useNetworks=useNetworks) == scores
+
+
+def test_replayWithHumanPlayer(tmp_path, monkeypatch):
+    path, scores = recordMatch(tmp_path, monkeypatch, seed=4, includeHumanPlayer=True)
+
+    assert playReplay(path, draw=False) == scores
+
+
+def test_replayUsesRecordedGameConfig(tmp_path, monkeypatch):
+    path, scores = recordMatch(tmp_path, monkeypatch, seed=5)
+    monkeypatch.setattr(config, "game_bullet_speed", config.game_bullet_speed + 7)
+
+    assert playReplay(path, draw=False) == scores
+
+
+def test_recordingKeepsMatchHeaderAndWeights(tmp_path, monkeypatch):
+    path, scores = recordMatch(tmp_path, monkeypatch, seed=6)
+    replay = Replay(path)
+
+    assert replay.seed == 6
+    assert replay.scores == scores
+    assert isinstance(replay.data, np.memmap)
+    assert len(replay.checksums) == replay.header["ticks"] // 10
+    neural = [p for p in replay.header["players"] if p["ai"] == "neural"]
+    original = PlayerRepository().generatePlayers(number=8)
+    originalNets = [p.neural_net for p in original if p.neural_net is not None]
+    for player, model in zip(neural, originalNets):
+        assert all(np.array_equal(layer, model.parameters[name]) for name, layer in replay.weights(player).items())
+
+
+def test_changedStateIsCaughtByChecksum(tmp_path, monkeypatch):
+    path, _ = recordMatch(tmp_path, monkeypatch, seed=7)
+    replay = Replay(path)
+    offset = replay.data.offset + replay.header["checksums"]["offset"]
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        record = np.frombuffer(f.read(CHECKSUM_DTYPE.itemsize), dtype=CHECKSUM_DTYPE).copy()
+        record["crc"] ^= 1
+        f.seek(offset)
+        f.write(record.tobytes())
+
+    with pytest.raises(ReplayMismatch):
+        playReplay(path, draw=False)
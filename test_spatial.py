@@ -0,0 +1,65 @@
+import hypothesis.strategies as st
+import numpy as np
+from hypothesis import given
+
+from slowmath import circlesCollide
+from spatial import ALL_PAIRS_LIMIT, SpatialIndex, collidingPairs
+
+coordinates = st.floats(min_value=-2000, max_value=2000)
+circles = st.lists(
+    st.tuples(coordinates, coordinates, st.floats(min_value=0, max_value=60)),
+    min_size=ALL_PAIRS_LIMIT + 1,
+    max_size=3 * ALL_PAIRS_LIMIT,
+)
+
+
+def nestedLoopPairs(circles):
+    return [
+        (i, j)
+        for i, (x0, y0, r0) in enumerate(circles)
+        for j, (x1, y1, r1) in enumerate(circles)
+        if i != j and circlesCollide(x0, y0, r0, x1, y1, r1)
+    ]
+
+
+def pairsOf(circles):
+    x, y, r = (np.array(values, dtype=np.float64) for values in zip(*circles))
+    rows, cols = collidingPairs(x, y, r)
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+@given(circles=circles)
+def test_gridFindsSamePairsAsNestedLoop(circles):
+    assert pairsOf(circles) == nestedLoopPairs(circles)
+
+
+@given(
+    circles=st.lists(st.tuples(coordinates, coordinates, st.floats(min_value=0, max_value=60)), min_size=1, max_size=20)
+)
+def test_allPairsFindsSamePairsAsNestedLoop(circles):
+    assert pairsOf(circles) == nestedLoopPairs(circles)
+
+
+def test_crowdedCirclesInOneCell():
+    circles = [(float(i % 3), float(i % 5), 10.0 + i % 7) for i in range(2 * ALL_PAIRS_LIMIT)]
+
+    assert pairsOf(circles) == nestedLoopPairs(circles)
+
+
+def indexOf(circles):
+    return SpatialIndex(*(np.array(values, dtype=np.float64) for values in zip(*circles)))
+
+
+@given(circles=circles, x=coordinates, y=coordinates, radius=st.floats(min_value=0, max_value=3000))
+def test_withinFindsSameCirclesAsLoop(circles, x, y, radius):
+    near = [i for i, (cx, cy, _) in enumerate(circles) if (cx - x) ** 2 + (cy - y) ** 2 <= radius**2]
+
+    assert indexOf(circles).within(x, y, radius).tolist() == near
+
+
+def test_nearestSkipsCircleAtThePoint():
+    index = indexOf([(0.0, 0.0, 10.0), (50.0, 0.0, 10.0), (0.0, 20.0, 10.0)] * ALL_PAIRS_LIMIT)
+
+    assert index.nearest(0, 0, np.inf) == 2
+    assert index.nearest(0, 0, 10) == -1
+    assert index.nearest(1000, 1000, 100) == -1
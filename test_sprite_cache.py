@@ -0,0 +1,42 @@
+import pygame
+import pytest
+
+from gui import SpriteCache, boxOffset
+
+
+def test_spriteIsRotatedOnlyOnce():
+    cache = SpriteCache(size=4)
+    image = pygame.Surface((20, 10))
+
+    first = cache.sprite(image, (10, 5), 90, 0, 1)
+    assert cache.sprite(image, (10, 5), 450, 0, 1) is first
+    assert first[0].get_width() < first[0].get_height()
+
+
+def test_leastRecentlyUsedSpriteIsDropped():
+    cache = SpriteCache(size=2)
+    image = pygame.Surface((20, 10))
+    zero = cache.sprite(image, (10, 5), 0, 0, 1)
+    cache.sprite(image, (10, 5), 1, 0, 1)
+    cache.sprite(image, (10, 5), 0, 0, 1)
+    cache.sprite(image, (10, 5), 2, 0, 1)
+
+    assert len(cache.sprites) == 2
+    assert cache.sprite(image, (10, 5), 0, 0, 1) is zero
+
+
+def test_zoomChangeDropsSprites():
+    cache = SpriteCache(size=4)
+    image = pygame.Surface((20, 10))
+    cache.sprite(image, (10, 5), 0, 0, 1)
+
+    rotated, _ = cache.sprite(image, (10, 5), 0, 0, 2)
+    assert len(cache.sprites) == 1
+    assert rotated.get_size() == (40, 20)
+
+
+def test_boxOffsetOfCenteredPivot():
+    image = pygame.Surface((20, 10))
+
+    assert boxOffset(image, (10, 5), 0) == pytest.approx((-10, 5))
+    assert boxOffset(image, (10, 5), 180) == pytest.approx((-10, 5))
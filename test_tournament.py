@@ -0,0 +1,33 @@
+import copy
+import multiprocessing
+import random
+
+from tankbr import playRound, rankRound
+from testmatches import createMatches
+
+
+def test_parallelRoundGivesSameResultsAsSerialRound():
+    parallelMatches = createMatches([8, 8])
+    serialMatches = copy.deepcopy(parallelMatches)
+    seeds = [11, 12]
+    draws = [False, False]
+
+    serialScores = playRound(serialMatches, seeds, draws)
+    with multiprocessing.Pool(processes=2) as pool:
+        parallelScores = playRound(parallelMatches, seeds, draws, pool)
+
+    assert serialScores == parallelScores
+    rankRound(serialMatches, serialScores)
+    rankRound(parallelMatches, parallelScores)
+    for serial, parallel in zip(serialMatches, parallelMatches):
+        assert [(p.name, p.mu, p.sigma) for p in serial] == [(p.name, p.mu, p.sigma) for p in parallel]
+
+
+def test_simulationDoesNotChangeRandomStateOfCaller():
+    matches = createMatches([8, 8])
+    random.seed(5)
+    expected = random.random()
+    random.seed(5)
+    playRound(matches, [1, 2], [False, False])
+
+    assert random.random() == expected
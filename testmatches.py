@@ -0,0 +1,31 @@
+"""Players and matches for tests that play the same match in two ways and compare the scores"""
+
+import copy
+
+from PlayerRepository import PlayerRepository
+from argparser import configOverride
+from tankbr import simulateGame
+
+
+def createPlayers(number, includeHumanPlayer=False, ai=None):
+    """Generated players, all driven by ai when it is given"""
+    players = PlayerRepository().generatePlayers(number=number, includeHumanPlayer=includeHumanPlayer)
+    if ai is not None:
+        for p in players:
+            p.ai = ai
+    return players
+
+
+def createMatches(sizes, includeHumanPlayer=False):
+    """Matches of generated players of the given sizes, a human player is only in the first one"""
+    repository = PlayerRepository()
+    return [
+        repository.generatePlayers(number=size, includeHumanPlayer=includeHumanPlayer and i == 0)
+        for i, size in enumerate(sizes)
+    ]
+
+
+def playCopy(players, seed, **configValues):
+    """Scores of a headless match of copies of players, played with configValues set"""
+    with configOverride(**configValues):
+        return simulateGame(copy.deepcopy(players), draw=False, seed=seed)
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+# Rotations in the game are whole degrees almost all the time, so cosine and sine are looked up in
+# a table filled with math.cos/math.sin. This keeps results bit for bit the same as in the
+# processors that compute them one by one with the math module.
+_tableRange = -1
+_cosTable = np.zeros(1)
+_sinTable = np.zeros(1)
+
+
+def _growTable(limit):
+    global _tableRange, _cosTable, _sinTable
+    newRange = max(1024, 2 * _tableRange)
+    while newRange < limit:
+        newRange *= 2
+    radians = [math.radians(d) for d in range(-newRange, newRange + 1)]
+    _cosTable = np.array([math.cos(r) for r in radians])
+    _sinTable = np.array([math.sin(r) for r in radians])
+    _tableRange = newRange
+
+
+def cosSin(degrees):
+    """Cosine and sine of an array of angles given in degrees"""
+    degrees = np.asarray(degrees, dtype=np.float64)
+    if degrees.size == 0:
+        return np.zeros(degrees.shape), np.zeros(degrees.shape)
+    indexes = degrees.astype(np.intp)
+    if np.array_equal(indexes, degrees):
+        limit = max(-indexes.min(), indexes.max())
+        if limit > _tableRange:
+            _growTable(limit)
+        indexes += _tableRange
+        return _cosTable[indexes], _sinTable[indexes]
+    radians = [math.radians(d) for d in degrees.tolist()]
+    return (
+        np.array([math.cos(r) for r in radians]).reshape(degrees.shape),
+        np.array([math.sin(r) for r in radians]).reshape(degrees.shape),
+    )
+
+
+def pySquare(a):
+    """Same as a ** 2 on python floats, which is not always equal to a * a"""
+    return np.float_power(a, 2.0)
+
+
+def circlesCollideMatrix(x, y, r):
+    """Vectorized slowmath.circlesCollide for every pair of circles.
+
+    Returns a boolean matrix where [i, j] tells if circle i collides with circle j. The diagonal
+    is always False. Arguments of shape (..., n) give a stack of matrices, circles at NaN positions
+    collide with nothing."""
+    pointDifference = pySquare(x[..., :, None] - x[..., None, :]) + pySquare(y[..., :, None] - y[..., None, :])
+    rLow = pySquare(r[..., :, None] - r[..., None, :])
+    rHigh = pySquare(r[..., :, None] + r[..., None, :])
+    collisions = (rLow <= pointDifference) & (pointDifference <= rHigh)
+    collisions &= ~np.eye(x.shape[-1], dtype=bool)
+    return collisions
+
+
+def circlesCollidePairs(x, y, r, first, second):
+    """Vectorized slowmath.circlesCollide for circles first[k] and second[k]"""
+    pointDifference = pySquare(x[first] - x[second]) + pySquare(y[first] - y[second])
+    rLow = pySquare(r[first] - r[second])
+    rHigh = pySquare(r[first] + r[second])
+    return (rLow <= pointDifference) & (pointDifference <= rHigh)
+
+
+def segmentAndCircleIntersectMatrix(startX, startY, endX, endY, startEndDist, targetX, targetY, targetRange):
+    """Vectorized slowmath.segmentAndCircleIntersect for every segment against every circle.
+
+    Segment arguments are arrays of length n, circle arguments arrays of length m. Returns
+    a boolean (n, m) matrix. Arguments may have leading dimensions too, like (matches, n) and
+    (matches, m), which give a stack of matrices."""
+    startX, startY, endX, endY, startEndDist = (a[..., :, None] for a in (startX, startY, endX, endY, startEndDist))
+    targetX, targetY, targetRange = (a[..., None, :] for a in (targetX, targetY, targetRange))
+    x1, y1, x2, y2 = startX - targetX, startY - targetY, endX - targetX, endY - targetY
+    # x1 and x2 are the same differences slowmath uses for distances to the start and the end of
+    # the segment (negating a float is exact), so they are reused instead of computed again
+    maxRangeWithCollision = startEndDist + targetRange
+    targetInFront = x2 * x2 + y2 * y2 < startEndDist * startEndDist
+    targetInRange = x1 * x1 + y1 * y1 < maxRangeWithCollision * maxRangeWithCollision
+    dx, dy = x1 - x2, y1 - y2
+    drSquare = dx * dx + dy * dy
+    D = x1 * y2 - x2 * y1
+    delta = targetRange * targetRange * drSquare - D * D
+    return (delta > 0) & targetInFront & targetInRange
+
+
+def rangeFind(x, y, rotation, maxRange, targetX, targetY, targetRange):
+    """Cast rays of length maxRange from (x, y) in direction rotation (degrees) against circles.
+
+    Finder arguments are arrays of length n, circle arguments arrays of length m. Circles centered
+    exactly at the start of a ray are skipped. Returns the (n, m) boolean matrix of hits, the index
+    of the closest hit circle for every ray (-1 when nothing was hit) and the distance to its center
+    (inf when nothing was hit). With leading dimensions, like segmentAndCircleIntersectMatrix, every
+    stack of finders only looks at its own stack of circles. Finders or circles at NaN positions
+    never hit anything."""
+    cos, sin = cosSin(rotation)
+    hits = segmentAndCircleIntersectMatrix(
+        x, y, x + maxRange * cos, y + maxRange * sin, maxRange, targetX, targetY, targetRange
+    )
+    dx, dy = x[..., :, None] - targetX[..., None, :], y[..., :, None] - targetY[..., None, :]
+    hits &= (dx != 0) | (dy != 0)
+    if hits.shape[-1] == 0:
+        return hits, np.full(x.shape, -1, dtype=np.intp), np.full(x.shape, np.inf)
+    distancesSquared = np.where(hits, dx * dx + dy * dy, np.inf)
+    closest = np.argmin(distancesSquared, axis=-1)
+    closestDistance = np.sqrt(np.take_along_axis(distancesSquared, closest[..., None], axis=-1)[..., 0])
+    closest[~hits.any(axis=-1)] = -1
+    return hits, closest, closestDistance